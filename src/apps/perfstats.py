@@ -0,0 +1,50 @@
+"""
+Single-file app exposing performance traces collected by the tracer.
+`perfstats` returns recorded spans and per-function statistics as JSON,
+`perfstats chrome` returns spans in Chrome trace-event format,
+`perfstats mem` returns heap and ramdisk usage of the last host requests,
+`perfstats boot` returns the boot timeline,
+`perfstats clear` resets the buffer.
+"""
+from app import BaseApp, AppError
+from io import BytesIO
+from tracer import tracer, boot
+from memstats import memstats
+import platform
+
+# Should be called App if you use a single file
+
+# simulator also saves chrome trace to this file
+TRACE_FILE = "trace.json"
+
+
+class App(BaseApp):
+    """Dumps performance traces"""
+    name = "perfstats"
+    prefixes = [b"perfstats"]
+
+    async def process_host_command(self, stream, show_fn):
+        prefix = self.get_prefix(stream)
+        if prefix != b"perfstats":
+            raise AppError("Prefix is not valid: %s" % prefix.decode())
+        cmd = stream.read().strip()
+        if cmd == b"clear":
+            tracer.clear()
+            memstats.clear()
+            return True
+        res = BytesIO()
+        if cmd == b"chrome":
+            tracer.dump_chrome_trace(res)
+            if platform.simulator:
+                tracer.save_chrome_trace(TRACE_FILE)
+        elif cmd == b"mem":
+            memstats.dump(res)
+        elif cmd == b"boot":
+            boot.dump(res)
+        elif cmd == b"":
+            tracer.dump(res)
+        else:
+            raise AppError("Unknown command: %s" % cmd.decode())
+        res.seek(0)
+        obj = {"title": "Performance stats", "note": "%d spans" % len(tracer.spans)}
+        return res, obj
@@ -0,0 +1,152 @@
+import os
+import json
+import platform
+from storage import storage
+from embit import compact
+from embit.psbtview import read_write
+
+
+class CatalogError(Exception):
+    pass
+
+
+class WalletCatalog:
+    """
+    Single-file storage of wallet records.
+    Every change is appended to the journal as a separate encrypted entry:
+    <compact-len><aead({"id": wallet id, field: value, ...})>,
+    fields of the entry are merged into the wallet record,
+    {"id": wallet id, "deleted": true} removes the record.
+    On load the journal is replayed, a truncated tail
+    (power loss during the write) is dropped.
+    Complete entries that fail to decrypt are skipped and listed in errors,
+    the journal is not rewritten so other entries are not lost.
+    New entries are kept in storage until the next storage.commit().
+    """
+    FILENAME = "catalog"
+    # journal is compacted when it has this many stale entries
+    MAX_STALE = 16
+
+    def __init__(self, path, keystore):
+        self.path = path.rstrip("/")
+        self.keystore = keystore
+        # wallet id: record
+        self.records = {}
+        # number of entries in the journal
+        self.entries = 0
+        # messages about corrupted entries found on load
+        self.errors = []
+
+    @property
+    def fname(self):
+        return self.path + "/" + self.FILENAME
+
+    def _recover(self):
+        """Finishes interrupted compaction"""
+        if not platform.file_exists(self.fname + ".tmp"):
+            return
+        if platform.file_exists(self.fname):
+            # compaction didn't finish writing, journal is still valid
+            os.remove(self.fname + ".tmp")
+        else:
+            # old journal is already removed, new one is complete
+            os.rename(self.fname + ".tmp", self.fname)
+
+    def load(self):
+        """Replays the journal, returns {wallet id: record}"""
+        storage.flush(self.fname)
+        self._recover()
+        self.records = {}
+        self.entries = 0
+        self.errors = []
+        if not platform.file_exists(self.fname):
+            return self.records
+        tail = None
+        with open(self.fname, "rb") as f:
+            while True:
+                pos = f.tell()
+                try:
+                    l = compact.read_from(f)
+                except:
+                    # end of file or truncated length
+                    if f.tell() != pos:
+                        tail = pos
+                    break
+                data = f.read(l)
+                if len(data) != l:
+                    # last entry was not written completely
+                    tail = pos
+                    break
+                self.entries += 1
+                try:
+                    _, plaintext = self.keystore.decrypt_aead(data)
+                    self._apply(json.loads(plaintext.decode()))
+                except Exception as e:
+                    # damaged entry, the following ones are still valid
+                    self.errors.append("Corrupted catalog entry at %d: %r" % (pos, e))
+        if tail is not None:
+            self._truncate(tail)
+        return self.records
+
+    def _apply(self, entry):
+        wid = entry.pop("id")
+        if entry.get("deleted"):
+            self.records.pop(wid, None)
+        elif wid in self.records:
+            self.records[wid].update(entry)
+        else:
+            self.records[wid] = entry
+
+    def _serialize(self, entry):
+        data = self.keystore.encrypt_aead(plaintext=json.dumps(entry).encode())
+        return compact.to_bytes(len(data)) + data
+
+    def _append(self, entry):
+        storage.append(self.fname, self._serialize(entry))
+        self._apply(entry)
+        self.entries += 1
+        if self.entries - len(self.records) > self.MAX_STALE:
+            self.compact()
+
+    def next_id(self):
+        return max(self.records) + 1 if self.records else 0
+
+    def set(self, wid, fields):
+        """Updates fields of the wallet record or creates a new one"""
+        entry = {"id": wid}
+        entry.update(fields)
+        self._append(entry)
+
+    def delete(self, wid):
+        if wid not in self.records:
+            raise CatalogError("Wallet %d not found" % wid)
+        self._append({"id": wid, "deleted": True})
+
+    def compact(self):
+        """Rewrites the journal with one entry per wallet"""
+        # pending entries are already merged into records
+        storage.discard(self.fname)
+        tmp = self.fname + ".tmp"
+        with open(tmp, "wb") as f:
+            for wid in sorted(self.records):
+                entry = {"id": wid}
+                entry.update(self.records[wid])
+                f.write(self._serialize(entry))
+        self._replace(tmp)
+        self.entries = len(self.records)
+
+    def _truncate(self, size):
+        """Drops the incomplete tail, entries before it are kept as is"""
+        tmp = self.fname + ".tmp"
+        with open(self.fname, "rb") as fin:
+            with open(tmp, "wb") as fout:
+                read_write(fin, fout, size)
+        self._replace(tmp)
+
+    def _replace(self, tmp):
+        """Replaces the journal with the complete tmp file (see _recover)"""
+        platform.sync()
+        if platform.file_exists(self.fname):
+            os.remove(self.fname)
+        os.rename(tmp, self.fname)
+        platform.sync()
@@ -6,9 +6,12 @@ from embit.liquid.psetview import PSETView, ser_string
 from embit.liquid.networks import NETWORKS
 from embit.liquid.transaction import LSIGHASH as SIGHASH
 from embit.liquid.addresses import address as liquid_address
-from embit.liquid.addresses import to_unconfidential
+from embit.liquid.addresses import to_unconfidential, addr_decode
 from .wallet import WalletError, LWallet
-from helpers import is_liquid
+from ..psbtindex import PSBTIndex
+from ..plan import SigningPlan
+from ..txmeta import TxMeta
+from helpers import is_liquid, LoaderProgress, run_steps
 import secp256k1
 from platform import get_preallocated_ram
 
@@ -28,6 +31,31 @@ for sh in list(SIGHASH_NAMES):
 for sh in list(SIGHASH_NAMES):
     SIGHASH_NAMES[sh | SIGHASH.RANGEPROOF] = SIGHASH_NAMES[sh] + " | RANGEPROOF"
 
+class IndexedPSETView(PSETView):
+    """
+    PSETView seeking to scopes with the offset index,
+    sighash_cache and current_scope are used as in IndexedPSBTView
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.index = PSBTIndex(self)
+        self.sighash_cache = None
+        self.current_scope = None
+
+    def seek_to_scope(self, n):
+        return self.index.seek_to_scope(n)
+
+    def sighash(self, i, *args, **kwargs):
+        if self.sighash_cache is not None:
+            return self.sighash_cache.sighash(i, *args, **kwargs)
+        return super().sighash(i, *args, **kwargs)
+
+    def input(self, i, compress=None):
+        if self.current_scope is not None and self.current_scope[0] == i:
+            return self.current_scope[1]
+        return super().input(i, compress)
+
+
 class LWalletManager(WalletManager):
     """
     WalletManager class manages your wallets.
@@ -36,7 +64,7 @@ class LWalletManager(WalletManager):
     """
 
     prefixes = WalletManager.prefixes + [b"addasset", b"dumpassets"]
-    PSBTViewClass = PSETView
+    PSBTViewClass = IndexedPSETView
     B64PSBT_PREFIX = b"cHNl"
     WalletClass = LWallet
     # supported networks
@@ -95,24 +123,44 @@ class LWalletManager(WalletManager):
         return super().parse_stream(stream)
 
 
+    def address_script(self, addr: str):
+        sc, _ = addr_decode(addr)
+        return sc
+
+    def lookup_address(self, addr: str):
+        res = super().lookup_address(addr)
+        if res is None:
+            return None
+        # blinding key should match as well
+        w, branch_idx, idx = res
+        a, _ = w.get_address(idx, self.network, branch_idx)
+        if addr not in [a, to_unconfidential(a)]:
+            return None
+        return res
+
     def find_wallet_from_address(self, addr: str, paths=None, index=None):
+        derivation_path = None
+        if paths is not None:
+            # we can detect the wallet from just one path
+            derivation_path = self.parse_host_path(paths[0])
+        res = self.lookup_address(addr)
+        if res is not None:
+            w, branch_idx, idx = res
+            if index is not None and (branch_idx, idx) == (0, index):
+                return w, (0, index)
+            # path from the host should point to the same address
+            if derivation_path is not None and w.descriptor.check_derivation(derivation_path) == (idx, branch_idx):
+                return w, (idx, branch_idx)
+        # address is outside of the lookahead window
         if index is not None:
             for w in self.wallets:
                 a, _ = w.get_address(index, self.network)
                 unconf_a = to_unconfidential(a)
                 if addr in [a, unconf_a]:
                     return w, (0, index)
-        if paths is not None:
-            # we can detect the wallet from just one path
-            p = paths[0]
-            if not p.startswith("m"):
-                fingerprint = unhexlify(p[:8])
-                derivation = bip32.parse_path("m"+p[8:])
-            else:
-                fingerprint = self.keystore.fingerprint
-                derivation = bip32.parse_path(p)
-            derivation_path = DerivationPath(fingerprint, derivation)
-            for w in self.wallets:
+        if derivation_path is not None:
+            self.key_index.update(self.wallets)
+            for w in self.key_index.lookup_derivation(derivation_path):
                 der = w.descriptor.check_derivation(derivation_path)
                 if der is not None:
                     idx, branch_idx = der
@@ -160,7 +208,11 @@ class LWalletManager(WalletManager):
 
 
     async def check_unknown_assets(self, meta, show_screen):
-        unknown_assets = {sc["raw_asset"] for sc in (meta["inputs"]+meta["outputs"]) if "raw_asset" in sc}
+        items = (meta.inputs, meta.outputs)
+        unknown_assets = {
+            sc.get(i, "raw_asset") for sc in items for i in range(len(sc))
+            if sc.get(i, "raw_asset")
+        }
         if len(unknown_assets) == 0:
             return
         scr = Prompt(
@@ -185,12 +237,14 @@ class LWalletManager(WalletManager):
                     self.assets[asset] = lbl
             self.save_assets()
         # replace labels we just saved
-        for sc in meta["inputs"] + meta["outputs"]:
-            if sc.get("raw_asset"):
-                sc["asset"] = self.asset_label(sc["raw_asset"])
+        for sc in items:
+            for i in range(len(sc)):
+                raw_asset = sc.get(i, "raw_asset")
+                if raw_asset:
+                    sc.set(i, "asset", self.asset_label(raw_asset))
 
 
-    def create_default_wallet(self, path):
+    def create_default_wallet(self):
         """Creates default p2wpkh wallet with name `Default`"""
         der = "m/84h/%dh/0h" % self.Networks[self.network]["bip32"]
         xpub = self.keystore.get_xpub(der)
@@ -201,15 +255,11 @@ class LWalletManager(WalletManager):
         )
         # add blinding key to the descriptor
         desc = "blinded(slip77(%s),%s)" % (self.keystore.slip77_key, desc)
-        w = self.WalletClass.parse("Default&"+desc, path)
-        # pass keystore to encrypt data
-        w.save(self.keystore)
-        platform.sync()
-        return w
+        return self.WalletClass.parse("Default&"+desc)
 
-    def _copy_kv(self, fout, psbtv, key):
+    def _copy_kv(self, fout, psbtv, scope, key):
         # find offset of the key if it exists
-        off = psbtv.seek_to_value(key, from_current=True)
+        off = psbtv.index.seek_to_value(scope, key)
         if off is None:
             return
         # we found it - copy over
@@ -237,13 +287,36 @@ class LWalletManager(WalletManager):
             title = "Reissuance transaction"
         return await show_screen(TransactionScreen(title, meta))
 
-    def preprocess_psbt(self, stream, fout):
+    def fill_psbt_iter(self, stream):
+        """
+        Blinding proofs are generated while the pset is filled,
+        so filled pset is written to the ramdisk.
+        The file is closed by sign_psbt.
+        """
+        plan = SigningPlan(self.keystore.fingerprint)
+        with open(self.tempdir + "/filled_psbt", "wb") as fout:
+            wallets, meta = yield from self.preprocess_psbt_iter(stream, fout, plan)
+        f = open(self.tempdir + "/filled_psbt", "rb")
+        psbtv = self.PSBTViewClass.view(f, compress=True)
+        psbtv.plan = plan
+        return psbtv, wallets, meta
+
+    @trace("LWalletManager.preprocess_psbt")
+    def preprocess_psbt(self, stream, fout, plan=None):
         """
         Processes incoming PSBT, fills missing information and writes to fout.
+        Fills SigningPlan if it is provided.
         Returns:
         - wallets in inputs: list of tuples (wallet, amount)
         - metadata for tx display including warnings that require user confirmation
         """
+        return run_steps(self.preprocess_psbt_iter(stream, fout, plan))
+
+    def preprocess_psbt_iter(self, stream, fout, plan=None):
+        """
+        Same as preprocess_psbt, but yields after every input, output
+        and generated proof, so blinding can be interrupted between them.
+        """
         self.show_loader(title="Parsing transaction...")
 
         # compress = True flag will make sure large fields won't be loaded to RAM
@@ -271,16 +344,19 @@ class LWalletManager(WalletManager):
         # here we will store all wallets that we detect in inputs
         # wallet: {"amount": {asset: amount}, "gaps" [gaps]}
         wallets = {}
-        meta = {
-            "inputs": [{} for i in range(psbtv.num_inputs)],
-            "outputs": [{} for i in range(psbtv.num_outputs)],
-            "issuance": False, "reissuance": False,
-            "signed_inputs": signed_inputs,
-            "tx_version": psbtv.tx_version,
-            "locktime": psbtv.locktime,
-        }
+        meta = TxMeta(psbtv.num_inputs, psbtv.num_outputs,
+            # addresses are derived when displayed
+            get_address=lambda i: self.get_address(psbtv.output(i)),
+            issuance=False, reissuance=False,
+            signed_inputs=signed_inputs,
+            tx_version=psbtv.tx_version,
+            locktime=psbtv.locktime,
+        )
 
-        fingerprint = self.keystore.fingerprint
+        self.script_index.update(self.wallets)
+        self.key_index.update(self.wallets)
+        progress = LoaderProgress(self.show_loader, "Parsing inputs...",
+                                  psbtv.num_inputs + psbtv.num_outputs)
         # We need to detect wallets owning inputs and outputs,
         # in case of liquid - unblind them.
         # Fill all necessary information:
@@ -288,16 +364,16 @@ class LWalletManager(WalletManager):
         # For Liquid: same + values, assets, commitments, proofs etc.
         # At the end we should have the most complete PSBT / PSET possible
         for i in range(psbtv.num_inputs):
-            self.show_loader(title="Parsing input %d..." % i)
+            progress.update(i)
+            yield
             # load input to memory, verify it (check prevtx hash)
             inp = psbtv.input(i)
-            metainp = meta["inputs"][i]
             # verify, do not require non_witness_utxo if witness_utxo is set
             inp.verify(ignore_missing=True)
 
             # check sighash in the input
             if inp.sighash_type is not None and inp.sighash_type != self.DEFAULT_SIGHASH:
-                metainp["sighash"] = self.get_sighash_info(inp.sighash_type)["name"]
+                meta.inputs.set(i, "sighash", self.get_sighash_info(inp.sighash_type)["name"])
 
             if inp.issue_value:
                 if inp.issue_entropy:
@@ -308,32 +384,19 @@ class LWalletManager(WalletManager):
             # in Liquid we may need to rewind the rangeproof to get values
             rangeproof_offset = None
 
-            off = psbtv.seek_to_scope(i)
             # find offset of the rangeproof if it exists
-            rangeproof_offset = psbtv.seek_to_value(b'\xfc\x04pset\x0e', from_current=True)
-            # add scope offset
-            if rangeproof_offset is not None:
-                rangeproof_offset += off
+            rangeproof_offset = psbtv.index.seek_to_value(i, b'\xfc\x04pset\x0e')
 
             # Find wallets owning the inputs and fill scope data:
             # first we check already detected wallet owns the input
             # as in most common case all inputs are owned by the same wallet.
-            wallet = None
-            for w in wallets:
-                # pass rangeproof offset if it's in the scope
-                if w and w.fill_scope(inp, fingerprint,
-                                stream=psbtv.stream, rangeproof_offset=rangeproof_offset):
-                    wallet = w
-                    break
-            # if it's a different wallet - go through all our wallets and check
-            if wallet is None:
-                # find wallet and append it to wallets
-                for w in self.wallets:
-                    # pass rangeproof offset if it's in the scope
-                    if w.fill_scope(inp, fingerprint,
-                                    stream=psbtv.stream, rangeproof_offset=rangeproof_offset):
-                        wallet = w
-                        break
+            # pass rangeproof offset if it's in the scope
+            wallet = self.find_scope_wallet(inp, wallets,
+                            stream=psbtv.stream, rangeproof_offset=rangeproof_offset)
+            if plan is not None:
+                plan.add_input(i, inp, wallet)
+                if wallet:
+                    plan.use(wallet, inp)
             # get gaps
             gaps = None
             if wallet:
@@ -375,16 +438,17 @@ class LWalletManager(WalletManager):
                     in_gens.append(secp256k1.generator_generate(inp.utxo.asset))
 
             wallets[wallet]["amount"][asset] = wallets[wallet]["amount"].get(asset, 0) + value
-            metainp.update({
-                "label": wallet.name if wallet else "Unknown wallet",
+            label = wallet.name if wallet else "Unknown wallet"
+            if wallet and wallet.is_watchonly:
+                label += " (watch-only)"
+            meta.inputs.update(i, {
+                "label": label,
                 "value": value,
                 "asset": self.asset_label(asset),
                 "sequence": inp.sequence,
             })
-            if wallet and wallet.is_watchonly:
-                metainp["label"] += " (watch-only)"
             if asset not in self.assets:
-                metainp.update({"raw_asset": asset})
+                meta.inputs.set(i, "raw_asset", asset)
             inp.write_to(fout, version=psbtv.version)
 
         # if blinding seed is set we can generate all proofs
@@ -395,6 +459,7 @@ class LWalletManager(WalletManager):
             for i in range(psbtv.num_outputs):
                 out = psbtv.output(i)
                 hseed.update(out.script_pubkey.serialize())
+                yield
             txseed = hseed.digest()
             # now we can blind everything
             for i in range(psbtv.num_outputs):
@@ -406,6 +471,7 @@ class LWalletManager(WalletManager):
                     abfs.append(abf)
                     vbfs.append(vbf)
                     vals.append(out.value)
+                yield
             # get last vbf from scope
             out = psbtv.output(blinding_out_indexes[-1])
             if (None in vals or None in abfs or None in vbfs or None in in_tags):
@@ -423,19 +489,19 @@ class LWalletManager(WalletManager):
             in_tags = b"".join(in_tags)
         for i in range(psbtv.num_outputs):
             gc.collect()
-            self.show_loader(title="Parsing output %d..." % i)
+            progress.update(psbtv.num_inputs + i,
+                            title=("Blinding outputs..." if blinding_seed else "Verifying outputs..."))
+            yield
             out = psbtv.output(i)
-            metaout = meta["outputs"][i]
+            metaout = {}
             # calculate commitments
             if blinding_seed and out.blinding_pubkey:
                 # index of this output in the abfs, vbfs and vals
                 list_idx = psbtv.num_inputs + blinding_out_indexes.index(i)
-                self.show_loader(title="Generating asset commtiment %d..." % i)
                 # asset commitment
                 out.asset_blinding_factor = abfs[list_idx]
                 gen = secp256k1.generator_generate_blinded(out.asset, out.asset_blinding_factor)
                 out.asset_commitment = secp256k1.generator_serialize(gen)
-                self.show_loader(title="Generating value commtiment %d..." % i)
                 # value commitment
                 out.value_blinding_factor = vbfs[list_idx]
                 value_commitment = secp256k1.pedersen_commit(out.value_blinding_factor, out.value, gen)
@@ -456,7 +522,6 @@ class LWalletManager(WalletManager):
                 # ser_string(fout, surjection_proof)
                 # # del surjection_proof
 
-                self.show_loader(title="Generating range proof %d..." % i)
                 # generate range proof
                 rangeproof_nonce = hashes.tagged_hash("liquid/range_proof", txseed+i.to_bytes(4,'little'))
                 pub = secp256k1.ec_pubkey_parse(out.blinding_pubkey)
@@ -480,54 +545,36 @@ class LWalletManager(WalletManager):
                     ser_string(fout, b'\xfc\x04pset\x04')
                     fout.write(compact.to_bytes(rplen))
                     read_write(frp, fout, rplen)
+                # rangeproof takes a while, let the GUI update
+                yield
 
             rangeproof_offset = None
             # we only need to verify rangeproof if we didn't generate it ourselves
             if not blinding_seed:
-                self.show_loader(title="Verifying output %d..." % i)
                 # find rangeproof and surjection proof
                 # rangeproof
-                off = psbtv.seek_to_scope(psbtv.num_inputs+i)
+                scope = psbtv.num_inputs+i
                 # find offset of the rangeproof if it exists
-                rangeproof_offset = self._copy_kv(fout, psbtv, b'\xfc\x04pset\x04')
+                rangeproof_offset = self._copy_kv(fout, psbtv, scope, b'\xfc\x04pset\x04')
                 if rangeproof_offset is None:
-                    psbtv.seek_to_scope(psbtv.num_inputs+i)
                     # alternative key definition (psetv0)
-                    rangeproof_offset = self._copy_kv(fout, psbtv, b'\xfc\x08elements\x04')
-                if rangeproof_offset is not None:
-                    rangeproof_offset += off
+                    rangeproof_offset = self._copy_kv(fout, psbtv, scope, b'\xfc\x08elements\x04')
 
             surj_proof_offset = None
             # surjection proof
-            off = psbtv.seek_to_scope(psbtv.num_inputs+i)
-            # find offset of the rangeproof if it exists
-            surj_proof_offset = self._copy_kv(fout, psbtv, b'\xfc\x04pset\x05')
+            # find offset of the surjection proof if it exists
+            surj_proof_offset = self._copy_kv(fout, psbtv, psbtv.num_inputs+i, b'\xfc\x04pset\x05')
             if surj_proof_offset is None:
-                psbtv.seek_to_scope(psbtv.num_inputs+i)
                 # alternative key definition (psetv0)
-                surj_proof_offset = self._copy_kv(fout, psbtv, b'\xfc\x08elements\x05')
-            if surj_proof_offset is not None:
-                surj_proof_offset += off
-
-            wallet = None
-            for w in wallets:
-                # pass rangeproof offset if it's in the scope
-                if w and w.fill_scope(out, fingerprint,
-                                stream=psbtv.stream,
-                                rangeproof_offset=rangeproof_offset,
-                ):
-                    wallet = w
-                    break
-            if wallet is None:
-                # find wallet and append it to wallets
-                for w in self.wallets:
-                    # pass rangeproof offset if it's in the scope
-                    if w.fill_scope(out, fingerprint,
-                                    stream=psbtv.stream,
-                                    rangeproof_offset=rangeproof_offset,
-                    ):
-                        wallet = w
-                        break
+                surj_proof_offset = self._copy_kv(fout, psbtv, psbtv.num_inputs+i, b'\xfc\x08elements\x05')
+
+            # pass rangeproof offset if it's in the scope
+            wallet = self.find_scope_wallet(out, wallets,
+                            stream=psbtv.stream,
+                            rangeproof_offset=rangeproof_offset,
+            )
+            if plan is not None and wallet and wallet in wallets:
+                plan.use(wallet, out)
             # if we didn't blind it ourselves
             if not blinding_seed:
                 try:
@@ -545,7 +592,6 @@ class LWalletManager(WalletManager):
             metaout.update({
                 "change": (wallet is not None and len(wallets) == 1 and wallet in wallets),
                 "value": value,
-                "address": self.get_address(out),
                 "asset": self.asset_label(asset),
             })
             if wallet:
@@ -569,6 +615,7 @@ class LWalletManager(WalletManager):
                     metaout["warning"] = "Watch-only wallet!"
             if asset and asset not in self.assets:
                 metaout.update({"raw_asset": asset})
+            meta.outputs.update(i, metaout)
             out.write_to(fout, skip_separator=True, version=psbtv.version)
             # write rangeproofs and surjection proofs
             # separator
@@ -609,8 +656,16 @@ class LWalletManager(WalletManager):
 
     def save_assets(self):
         platform.maybe_mkdir(self.assets_path)
-        assets = self.assets_json()
-        self.keystore.save_aead(self.assets_file, plaintext=assets.encode(), key=self.keystore.userkey)
+        # registry can be large - written entry by entry
+        with self.keystore.open_aead(self.assets_file, "wb", key=self.keystore.userkey) as f:
+            f.write(b"{")
+            for i, asset in enumerate(self.assets):
+                if i > 0:
+                    f.write(b",")
+                h = hexlify(bytes(reversed(asset))).decode()
+                f.write(("%s:%s" % (json.dumps(h), json.dumps(self.assets[asset]))).encode())
+            f.write(b"}")
+        platform.sync()
 
     def load_assets(self):
         self.assets = {}
@@ -622,8 +677,13 @@ class LWalletManager(WalletManager):
             })
         platform.maybe_mkdir(self.assets_path)
         if platform.file_exists(self.assets_file):
-            _, assets = self.keystore.load_aead(self.assets_file, key=self.keystore.userkey)
-            assets = json.loads(assets.decode())
+            try:
+                with self.keystore.open_aead(self.assets_file, key=self.keystore.userkey) as f:
+                    assets = json.load(f)
+            except:
+                # registry saved before the streaming format
+                _, assets = self.keystore.load_aead(self.assets_file, key=self.keystore.userkey)
+                assets = json.loads(assets.decode())
             # no support for bytes...
             for asset in assets:
                 self.assets[bytes(reversed(unhexlify(asset)))] = assets[asset]
@@ -16,6 +16,12 @@ class LWallet(Wallet):
     DescriptorClass = LDescriptor
     Networks = NETWORKS
 
+    def branch_keys(self, desc):
+        keys = super().branch_keys(desc)
+        if desc.is_blinded and not desc.is_slip77:
+            keys = keys + [desc.blinding_key.key]
+        return keys
+
     def fill_scope(self, scope, fingerprint, stream=None, rangeproof_offset=None, surj_proof_offset=None):
         """
         Fills derivation paths in inputs.
@@ -29,7 +35,7 @@ class LWallet(Wallet):
         if der is None:
             return False
         idx, branch_idx = der
-        desc = self.descriptor.derive(idx, branch_index=branch_idx)
+        desc = self.derive(idx, branch_idx)
         # find keys with our fingerprint
         for key in desc.keys:
             if key.fingerprint == fingerprint:
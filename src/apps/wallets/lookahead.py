@@ -0,0 +1,133 @@
+class ScriptIndex:
+    """
+    Lookahead index of wallet scripts.
+    Maps script_pubkey to (wallet, branch, idx) for every wallet
+    and every branch up to the gap limit of the branch,
+    so the wallet owning an input, output or address
+    is found with a single lookup.
+    """
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # script_pubkey data: (wallet, branch, idx)
+        self.scripts = {}
+        # wallet: number of indexed scripts per branch
+        self.windows = {}
+
+    def __len__(self):
+        return len(self.scripts)
+
+    def extend(self, w):
+        """Adds scripts of the wallet up to the current gap limits"""
+        window = self.windows.get(w)
+        if window is None:
+            window = [0 for gap in w.gaps]
+            self.windows[w] = window
+        for branch, gap in enumerate(w.gaps):
+            if window[branch] >= gap:
+                continue
+            desc = w.get_branch(branch)
+            for idx in range(window[branch], gap):
+                sc = desc.derive(idx).script_pubkey()
+                self.scripts[sc.data] = (w, branch, idx)
+            window[branch] = gap
+
+    def remove(self, w):
+        """Removes all scripts of the wallet"""
+        if w not in self.windows:
+            return
+        del self.windows[w]
+        for k in [k for k, v in self.scripts.items() if v[0] is w]:
+            del self.scripts[k]
+
+    def update(self, wallets):
+        """
+        Syncs the index with the list of wallets.
+        Wallets that are not loaded yet are skipped,
+        they are indexed once their descriptor is parsed.
+        """
+        for w in [w for w in self.windows if w not in wallets]:
+            self.remove(w)
+        for w in wallets:
+            if w.is_loaded:
+                self.extend(w)
+
+    def lookup(self, script_pubkey):
+        """Returns (wallet, branch, idx) or None if script is not in the index"""
+        if script_pubkey is None:
+            return None
+        return self.scripts.get(script_pubkey.data)
+
+
+class KeyOriginIndex:
+    """
+    Index of wallet keys by origin.
+    Maps (fingerprint, derivation prefix) of every derivable key
+    to the wallets with this key, so only wallets that could own
+    a psbt scope are checked.
+    """
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # (fingerprint, derivation tuple): [wallets]
+        self.origins = {}
+        # lengths of the derivation after the prefix (usually 2 - branch and idx)
+        self.lengths = []
+        self.wallets = []
+
+    def add(self, w):
+        if w in self.wallets:
+            return
+        self.wallets.append(w)
+        for fingerprint, derivation, l in w.key_origins():
+            key = (fingerprint, derivation)
+            arr = self.origins.get(key)
+            if arr is None:
+                arr = []
+                self.origins[key] = arr
+            if w not in arr:
+                arr.append(w)
+            if l not in self.lengths:
+                self.lengths.append(l)
+
+    def remove(self, w):
+        if w not in self.wallets:
+            return
+        self.wallets.remove(w)
+        for key in list(self.origins):
+            arr = self.origins[key]
+            if w in arr:
+                arr.remove(w)
+            if len(arr) == 0:
+                del self.origins[key]
+
+    def update(self, wallets):
+        """Syncs the index with the list of wallets"""
+        for w in [w for w in self.wallets if w not in wallets]:
+            self.remove(w)
+        for w in wallets:
+            self.add(w)
+
+    def lookup_derivation(self, der, res=None):
+        """Returns wallets with keys matching the derivation path"""
+        if res is None:
+            res = []
+        for l in self.lengths:
+            if len(der.derivation) < l:
+                continue
+            key = (der.fingerprint, tuple(der.derivation[:len(der.derivation)-l]))
+            for w in self.origins.get(key, []):
+                if w not in res:
+                    res.append(w)
+        return res
+
+    def lookup(self, scope):
+        """Returns wallets with keys matching derivations of the psbt scope"""
+        res = []
+        for der in scope.bip32_derivations.values():
+            self.lookup_derivation(der, res)
+        for leafs, der in scope.taproot_bip32_derivations.values():
+            self.lookup_derivation(der, res)
+        return res
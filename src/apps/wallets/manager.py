@@ -7,14 +7,24 @@ import os
 from binascii import hexlify, unhexlify, a2b_base64
 from embit import script, bip32, compact
 from embit.psbt import DerivationPath, CompressMode
-from embit.psbtview import PSBTView, read_write, PSBTError
+from embit.psbtview import read_write, PSBTError
 from embit.networks import NETWORKS
 from embit.transaction import SIGHASH
 from .wallet import WalletError, Wallet
+from .lookahead import ScriptIndex, KeyOriginIndex
+from .catalog import WalletCatalog
+from .overlay import ScopeOverlay, OverlayPSBTView
+from .plan import SigningPlan
+from .speculative import SpeculativeSigner
+from .txmeta import TxMeta
 from .commands import DELETE, EDIT
 from io import BytesIO
 from bcur import bcur_decode_stream
-from helpers import a2b_base64_stream, b2a_base64_stream
+from helpers import a2b_base64_stream, B64Writer, LoaderProgress, CancelToken, Cancelled, cooperate, run_steps
+from tracer import trace
+from memstats import memstats
+from storage import storage
+from sighash import SighashCache
 import gc
 import json
 
@@ -55,19 +65,32 @@ class WalletManager(BaseApp):
     name = "wallets"
 
     # Class constants for inheritance
-    PSBTViewClass = PSBTView
+    PSBTViewClass = OverlayPSBTView
     B64PSBT_PREFIX = b"cHNi"
     # wallet class
     WalletClass = Wallet
     # supported networks
     Networks = NETWORKS
     DEFAULT_SIGHASH = SIGHASH.ALL
+    # sign in the background while the user reviews the transaction,
+    # default if it's not set in experimental settings
+    SPECULATIVE_SIGNING = False
 
     def __init__(self, path):
         self.root_path = path
         platform.maybe_mkdir(path)
         self.path = None
         self.wallets = []
+        self.catalog = None
+        self.script_index = ScriptIndex()
+        self.key_index = KeyOriginIndex()
+        # SpeculativeSigner of the transaction being confirmed
+        self.speculation = None
+
+    @property
+    def speculative_signing(self):
+        """Background signing can be enabled in experimental settings"""
+        return self.GLOBAL.get("experimental", {}).get("speculative_signing", self.SPECULATIVE_SIGNING)
 
     def init(self, keystore, network, *args, **kwargs):
         """Loads or creates default wallets for new keystore or network"""
@@ -83,10 +106,13 @@ class WalletManager(BaseApp):
         path += "/" + network
         platform.maybe_mkdir(path)
         self.path = path
+        self.script_index.clear()
+        self.key_index.clear()
+        self.catalog = WalletCatalog(path, self.keystore)
         self.wallets = self.load_wallets()
         if self.wallets is None or len(self.wallets) == 0:
-            w = self.create_default_wallet(path=self.path + "/0")
-            self.wallets = [w]
+            self.wallets = []
+            self.add_wallet(self.create_default_wallet())
 
     def get_address(self, psbtout):
         """Helper function to get an address for every output"""
@@ -132,7 +158,7 @@ class WalletManager(BaseApp):
                 name = await show_screen(scr)
                 if name is not None and name != w.name and name != "":
                     w.name = name
-                    w.save(self.keystore)
+                    self.save_wallet(w)
             return True
 
     def can_process(self, stream):
@@ -281,32 +307,39 @@ class WalletManager(BaseApp):
             raise WalletError("Unknown command")
 
     async def sign_psbt(self, stream, show_screen, encoding=BASE64_STREAM):
+        """
+        Signs PSBT from the stream, returns path to the signed PSBT
+        in the same encoding or None if the user cancelled.
+        Base64 is decoded to the only temporary copy on the ramdisk,
+        fill data is kept in memory and signed PSBT is written
+        directly to the result file.
+        """
         if encoding == BASE64_STREAM:
             with open(self.tempdir+"/raw", "wb") as f:
                 # read in chunks, write to ram file
                 a2b_base64_stream(stream, f)
+            memstats.sample("b64decode")
             with open(self.tempdir+"/raw", "rb") as f:
-                res = await self.sign_psbt(f, show_screen, encoding=RAW_STREAM)
-            if res:
-                with open(self.tempdir+"/signed_b64", "wb") as fout:
-                    with open(res, "rb") as fin:
-                        b2a_base64_stream(fin, fout)
-                return self.tempdir+"/signed_b64"
-            return
+                return await self._sign_psbt(f, show_screen, self.tempdir+"/signed_b64", b64=True)
+        return await self._sign_psbt(stream, show_screen, self.tempdir+"/signed_raw")
 
+    async def _sign_psbt(self, stream, show_screen, fname, b64=False):
         # preprocess stream - parse psbt, check wallets in inputs and outputs,
         # get metadata to display, default sighash for signing,
-        # fill missing metadata and store it in temp file:
-        with open(self.tempdir + "/filled_psbt", "wb") as fout:
-            try:
-                wallets, meta = self.preprocess_psbt(stream, fout)
-            except PSBTError as e:
-                raise WalletError("Invalid PSBT:\n\n%s" % e)
-
-        # now we can work with copletely filled psbt:
-        with open(self.tempdir + "/filled_psbt", "rb") as f:
-            psbtv = self.PSBTViewClass.view(f, compress=True)
-
+        # fill missing metadata
+        # the user can stop parsing or signing with the Cancel button
+        token = CancelToken()
+        try:
+            self.show_loader(title="Parsing transaction...", on_cancel=token.cancel)
+            psbtv, wallets, meta = await cooperate(self.fill_psbt_iter(stream), token)
+        except PSBTError as e:
+            raise WalletError("Invalid PSBT:\n\n%s" % e)
+        except Cancelled:
+            return
+        memstats.sample("preprocess")
+        if self.speculative_signing:
+            self.speculation = SpeculativeSigner(self, psbtv, wallets, fname, b64)
+        try:
             # ask user for everything, if None is returned - user cancelled at some point
             options = await self.confirm_transaction(wallets, meta, show_screen)
             if options is None:
@@ -315,10 +348,35 @@ class WalletManager(BaseApp):
             del meta
             gc.collect()
             # sign transaction if the user confirmed
-            self.show_loader(title="Signing transaction...")
-            with open(self.tempdir+"/signed_raw", "wb") as f:
-                sig_count = self.sign_psbtview(psbtv, f, wallets, **options)
-            return self.tempdir+"/signed_raw"
+            self.show_loader(title="Signing transaction...", on_cancel=token.cancel)
+            committed = False
+            if self.speculation is not None:
+                committed = await self.speculation.commit(options, token)
+                # cancelled while waiting for the background signing
+                if committed is None:
+                    return
+            if committed:
+                self.update_wallets(psbtv, wallets)
+            else:
+                try:
+                    with open(fname, "wb") as f:
+                        out = B64Writer(f) if b64 else f
+                        await self.sign_psbtview_async(psbtv, out, wallets, token=token, **options)
+                        if b64:
+                            out.close()
+                except Cancelled:
+                    os.remove(fname)
+                    return
+            memstats.sample("signed")
+            return fname
+        finally:
+            # wipe background signing result if it's not used
+            if self.speculation is not None:
+                self.speculation.cancel()
+                self.speculation = None
+            # filled copy of the psbt if the manager needs one
+            if psbtv.stream is not stream:
+                psbtv.stream.close()
 
     async def confirm_transaction(self, wallets, meta, show_screen):
         """
@@ -334,7 +392,7 @@ class WalletManager(BaseApp):
         if sighash == False:
             return
 
-        if meta.get("signed_inputs", 0) == len(meta.get("inputs", [])):
+        if meta.get("signed_inputs", 0) == len(meta.inputs):
             scr = Prompt(
                 "Warning!",
                 "\nThe transaction is already signed!\n\n\n"
@@ -351,6 +409,10 @@ class WalletManager(BaseApp):
         if not await self.confirm_wallets(wallets, show_screen):
             return
 
+        # start signing while the user is looking at the transaction
+        if self.speculation is not None:
+            self.speculation.start(dict(sighash=sighash))
+
         if not await self.confirm_transaction_final(wallets, meta, show_screen):
             return
 
@@ -400,7 +462,8 @@ class WalletManager(BaseApp):
         """
         sighash_name = self.get_sighash_info(self.DEFAULT_SIGHASH)["name"]
         # check if there are any custom sighashes
-        used_custom_sighashes = any([inp.get("sighash", sighash_name) != sighash_name for inp in meta["inputs"]])
+        inputs = meta.inputs
+        used_custom_sighashes = any([inputs.get(i, "sighash", sighash_name) != sighash_name for i in range(len(inputs))])
 
         # no custom sighashes - just continue
         if not used_custom_sighashes:
@@ -408,13 +471,13 @@ class WalletManager(BaseApp):
 
         # ask the user if they want to sign in case of non-default sighashes
         custom_sighashes = [
-                ("Input %d: %s" % (i, inp.get("sighash", sighash_name)))
-                for (i, inp) in enumerate(meta["inputs"])
-                if inp.get("sighash", sighash_name) != sighash_name
+                ("Input %d: %s" % (i, inputs.get(i, "sighash", sighash_name)))
+                for i in range(len(inputs))
+                if inputs.get(i, "sighash", sighash_name) != sighash_name
         ]
         canceltxt = (
             ("Only sign %s" % sighash_name)
-            if len(custom_sighashes) != len(meta["inputs"])
+            if len(custom_sighashes) != len(inputs)
             else "Cancel"
         )
         confirm = await show_screen(Prompt("Warning!",
@@ -427,7 +490,7 @@ class WalletManager(BaseApp):
             return None
         # if we are forced to use default sighash - check
         # that not all inputs have custom sighashes
-        if len(custom_sighashes) == len(meta["inputs"]):
+        if len(custom_sighashes) == len(inputs):
             # nothing to sign
             return False
         return self.DEFAULT_SIGHASH
@@ -488,33 +551,66 @@ class WalletManager(BaseApp):
         return addr
 
     def load_wallets(self):
-        """Loads all wallets from path"""
+        """
+        Loads all wallets from the catalog.
+        Descriptors are not parsed until wallets are used.
+        """
         try:
-            platform.maybe_mkdir(self.path)
-            # Get ids of the wallets.
-            # Every wallet is stored in a numeric folder
-            wallet_ids = sorted(
-                [
-                    int(f[0])
-                    for f in os.ilistdir(self.path)
-                    if f[0].isdigit() and f[1] == 0x4000
-                ]
-            )
-            return [self.load_wallet(self.path + ("/%d" % wid)) for wid in wallet_ids]
+            records = self.catalog.load()
+            for err in self.catalog.errors:
+                print(err)
+            if self.find_legacy_wallets():
+                self.migrate()
+            wallets = []
+            for wid in sorted(records):
+                # full record is lost if the entry creating the wallet is corrupted
+                if "descriptor" not in records[wid]:
+                    print("Wallet %d is missing in the catalog" % wid)
+                    continue
+                wallets.append(self.WalletClass.from_record(wid, self.keystore, records[wid]))
+            return wallets
         except:
             return []
 
-    def load_wallet(self, path):
-        """Loads a wallet with particular id"""
-        try:
-            # pass path and key for verification
-            return self.WalletClass.from_path(path, self.keystore)
-        except Exception as e:
-            # if we failed to load -> delete folder and throw an error
+    def find_legacy_wallets(self):
+        """Returns ids of wallets stored in numeric folders (before the catalog)"""
+        return sorted(
+            [
+                int(f[0])
+                for f in os.ilistdir(self.path)
+                if f[0].isdigit() and f[1] == 0x4000
+            ]
+        )
+
+    def migrate(self):
+        """Moves wallets from numeric folders to the catalog"""
+        hashes = [r["hash"] for r in self.catalog.records.values()]
+        paths = [self.path + ("/%d" % wid) for wid in self.find_legacy_wallets()]
+        for path in paths:
+            try:
+                w = self.WalletClass.from_path(path, self.keystore)
+                if w.descriptor_hash not in hashes:
+                    self.catalog.set(self.catalog.next_id(), w.get_record())
+                    hashes.append(w.descriptor_hash)
+            except Exception as e:
+                # broken wallets were deleted on load before
+                print("Failed to migrate wallet %s: %r" % (path, e))
+        # catalog must be on flash before legacy folders are removed
+        self.catalog.compact()
+        for path in paths:
             platform.delete_recursively(path, include_self=True)
-            raise e
+        # file used by lazy loading before the catalog
+        if platform.file_exists(self.path + "/manifest"):
+            os.remove(self.path + "/manifest")
+
+    def save_wallet(self, w):
+        """
+        Saves changed name and gaps of the wallet,
+        written to flash on the next storage.commit()
+        """
+        self.catalog.set(w.wid, w.get_meta())
 
-    def create_default_wallet(self, path):
+    def create_default_wallet(self):
         """Creates default p2wpkh wallet with name `Default`"""
         der = "m/84h/%dh/0h" % self.Networks[self.network]["bip32"]
         xpub = self.keystore.get_xpub(der)
@@ -523,18 +619,14 @@ class WalletManager(BaseApp):
             der[1:],
             xpub.to_base58(self.Networks[self.network]["xpub"]),
         )
-        w = self.WalletClass.parse("Default&"+desc, path)
-        # pass keystore to encrypt data
-        w.save(self.keystore)
-        platform.sync()
-        return w
+        return self.WalletClass.parse("Default&"+desc)
 
     def parse_wallet(self, desc):
         try:
             w = self.WalletClass.parse(desc)
         except Exception as e:
             raise WalletError("Can't parse descriptor\n\n%s" % str(e))
-        if str(w.descriptor) in [str(ww.descriptor) for ww in self.wallets]:
+        if w.descriptor_hash in [ww.descriptor_hash for ww in self.wallets]:
             raise WalletError("Wallet with this descriptor already exists")
         # check that xpubs and tpubs are not mixed in the same descriptor:
         if not w.check_network(self.Networks[self.network]):
@@ -542,43 +634,65 @@ class WalletManager(BaseApp):
         return w
 
     def add_wallet(self, w):
+        # wallet has access to keystore only if it's saved or loaded
+        w.keystore = self.keystore
+        w.wid = self.catalog.next_id()
+        self.catalog.set(w.wid, w.get_record())
         self.wallets.append(w)
-        wallet_ids = sorted(
-            [
-                int(f[0])
-                for f in os.ilistdir(self.path)
-                if f[0].isdigit() and f[1] == 0x4000
-            ]
-        )
-        # get wallet id
-        wid = (max(wallet_ids) + 1) if wallet_ids else 0
-        newpath = self.path + ("/%d" % wid)
-        platform.maybe_mkdir(newpath)
-        w.save(self.keystore, path=newpath)
 
     def delete_wallet(self, w):
         if w not in self.wallets:
             raise WalletError("Wallet not found")
         self.wallets.pop(self.wallets.index(w))
-        w.wipe()
+        self.script_index.remove(w)
+        self.key_index.remove(w)
+        self.catalog.delete(w.wid)
+
+    def address_script(self, addr: str):
+        """Returns script_pubkey of the address"""
+        return script.address_to_scriptpubkey(addr)
+
+    def lookup_address(self, addr: str):
+        """Returns (wallet, branch, idx) from the lookahead index or None"""
+        try:
+            sc = self.address_script(addr)
+        except Exception:
+            return None
+        self.script_index.update(self.wallets)
+        return self.script_index.lookup(sc)
+
+    def parse_host_path(self, p):
+        """Converts path from the host (fingerprint or "m" and derivation) to DerivationPath"""
+        if not p.startswith("m"):
+            fingerprint = unhexlify(p[:8])
+            derivation = bip32.parse_path("m"+p[8:])
+        else:
+            fingerprint = self.keystore.fingerprint
+            derivation = bip32.parse_path(p)
+        return DerivationPath(fingerprint, derivation)
 
     def find_wallet_from_address(self, addr: str, paths=None, index=None):
+        derivation_path = None
+        if paths is not None:
+            # we can detect the wallet from just one path
+            derivation_path = self.parse_host_path(paths[0])
+        res = self.lookup_address(addr)
+        if res is not None:
+            w, branch_idx, idx = res
+            if index is not None and (branch_idx, idx) == (0, index):
+                return w, (0, index)
+            # path from the host should point to the same address
+            if derivation_path is not None and w.descriptor.check_derivation(derivation_path) == (idx, branch_idx):
+                return w, (idx, branch_idx)
+        # address is outside of the lookahead window
         if index is not None:
             for w in self.wallets:
                 a, _ = w.get_address(index, self.network)
                 if a == addr:
                     return w, (0, index)
-        if paths is not None:
-            # we can detect the wallet from just one path
-            p = paths[0]
-            if not p.startswith("m"):
-                fingerprint = unhexlify(p[:8])
-                derivation = bip32.parse_path("m"+p[8:])
-            else:
-                fingerprint = self.keystore.fingerprint
-                derivation = bip32.parse_path(p)
-            derivation_path = DerivationPath(fingerprint, derivation)
-            for w in self.wallets:
+        if derivation_path is not None:
+            self.key_index.update(self.wallets)
+            for w in self.key_index.lookup_derivation(derivation_path):
                 der = w.descriptor.check_derivation(derivation_path)
                 if der is not None:
                     idx, branch_idx = der
@@ -587,6 +701,27 @@ class WalletManager(BaseApp):
                         return w, (idx, branch_idx)
         raise WalletError("Can't find wallet owning address %s" % addr)
 
+    def find_scope_wallet(self, scope, wallets, *args, **kwargs):
+        """
+        Finds the wallet owning psbt scope and fills scope data.
+        Wallet from the lookahead index is checked first.
+        If the script is not in the index (index may be outside of the window)
+        only wallets with keys matching scope derivations are checked,
+        starting with wallets already detected in the transaction.
+        """
+        fingerprint = self.keystore.fingerprint
+        res = self.script_index.lookup(scope.script_pubkey)
+        if res is not None:
+            w = res[0]
+            return w if w.fill_scope(scope, fingerprint, *args, **kwargs) else None
+        candidates = self.key_index.lookup(scope)
+        if not candidates:
+            return None
+        candidates = [w for w in wallets if w in candidates] + [w for w in candidates if w not in wallets]
+        for w in candidates:
+            if w.fill_scope(scope, fingerprint, *args, **kwargs):
+                return w
+
     def fill_zero_fingerprint(self, scope):
         """Blue Wallet hack - zeroes in fingerprint should be checked and replaced by our fingerprint"""
         for pub in scope.bip32_derivations:
@@ -599,88 +734,116 @@ class WalletManager(BaseApp):
         """Goes through all input scopes and checks if they are already signed"""
         signed_inputs = 0
         for i in range(psbtv.num_inputs):
-            psbtv.seek_to_scope(i)
-            off = psbtv.seek_to_value(b"\x07", from_current=True) # final scriptsig
-            if off is not None:
-                signed_inputs += 1
-                continue
-            psbtv.seek_to_scope(i)
-            off = psbtv.seek_to_value(b"\x08", from_current=True) # final scriptwitness
-            if off is not None:
+            # final scriptsig or final scriptwitness
+            if psbtv.index.find(i, b"\x07") is not None or psbtv.index.find(i, b"\x08") is not None:
                 signed_inputs += 1
-                continue
         return signed_inputs
 
+    def fill_psbt(self, stream):
+        """
+        Parses PSBT from the stream and fills missing information.
+        Returns a tuple (psbtview, wallets, metadata), see preprocess_psbtview.
+        Filled data is kept in memory as scope overlays of the view.
+        """
+        return run_steps(self.fill_psbt_iter(stream))
+
+    def fill_psbt_iter(self, stream):
+        """Same as fill_psbt, but yields after every input and output"""
+        # compress = True flag will make sure large fields won't be loaded to RAM
+        psbtv = self.PSBTViewClass.view(stream, compress=True)
+        wallets, meta = yield from self.preprocess_psbtview_iter(psbtv)
+        return psbtv, wallets, meta
+
     def preprocess_psbt(self, stream, fout):
         """
-        Processes incoming PSBT, fills missing information and writes to fout.
+        Same as fill_psbt, but writes filled PSBT to fout.
+        Returns wallets and metadata.
+        """
+        psbtv, wallets, meta = self.fill_psbt(stream)
+        psbtv.stream.seek(psbtv.offset)
+        read_write(psbtv.stream, fout, psbtv.first_scope-psbtv.offset)
+        for i in range(psbtv.num_inputs):
+            inp = psbtv.input(i)
+            # write non_witness_utxo separately if it exists (as we use compressed psbtview)
+            if psbtv.index.seek_to_value(i, b'\x00'):
+                l = compact.read_from(psbtv.stream)
+                fout.write(b"\x01\x00")
+                fout.write(compact.to_bytes(l))
+                read_write(psbtv.stream, fout, l)
+            inp.write_to(fout, version=psbtv.version)
+        for i in range(psbtv.num_outputs):
+            psbtv.output(i).write_to(fout, version=psbtv.version)
+        return wallets, meta
+
+    @trace("WalletManager.preprocess_psbt")
+    def preprocess_psbtview(self, psbtv):
+        """
+        Processes incoming PSBT, fills missing information
+        into overlays of the view and stores SigningPlan in psbtv.plan.
         Returns:
         - wallets in inputs: dict {wallet: amount}
         - metadata for tx display including warnings that require user confirmation
         """
+        return run_steps(self.preprocess_psbtview_iter(psbtv))
+
+    def preprocess_psbtview_iter(self, psbtv):
+        """Same as preprocess_psbtview, but yields after every input and output"""
         self.show_loader(title="Parsing transaction...")
 
-        # compress = True flag will make sure large fields won't be loaded to RAM
-        psbtv = self.PSBTViewClass.view(stream, compress=True)
+        # verify previous transactions before inputs are parsed
+        yield from psbtv.prevtxs.collect_iter()
 
         # check if inputs are already signed
         signed_inputs = self.check_signed_inputs(psbtv)
 
-        # Write global scope first
-        psbtv.stream.seek(psbtv.offset)
-        res = read_write(psbtv.stream, fout, psbtv.first_scope-psbtv.offset)
-
         # string representation of the Bitcoin for wallet processing
         fee = 0
 
         # here we will store all wallets that we detect in inputs
         # {wallet: {"amount": amount, "gaps": [gaps]}}
         wallets = {}
-        meta = {
-            "inputs": [{} for i in range(psbtv.num_inputs)],
-            "outputs": [{} for i in range(psbtv.num_outputs)],
-            "default_asset": "BTC" if self.network == "main" else "tBTC",
-            "signed_inputs": signed_inputs,
-            "tx_version": psbtv.tx_version,
-            "locktime": psbtv.locktime,
-        }
+        meta = TxMeta(psbtv.num_inputs, psbtv.num_outputs,
+            # addresses are derived when displayed
+            get_address=lambda i: self.get_address(psbtv.vout(i)),
+            default_asset="BTC" if self.network == "main" else "tBTC",
+            signed_inputs=signed_inputs,
+            tx_version=psbtv.tx_version,
+            locktime=psbtv.locktime,
+        )
+        plan = SigningPlan(self.keystore.fingerprint)
 
-        fingerprint = self.keystore.fingerprint
+        self.script_index.update(self.wallets)
+        self.key_index.update(self.wallets)
+        progress = LoaderProgress(self.show_loader, "Parsing transaction...",
+                                  psbtv.num_inputs + psbtv.num_outputs)
         # We need to detect wallets owning inputs and outputs,
         # Fill all necessary information:
         # bip32 derivations, witness script, redeem script
         # At the end we should have the most complete PSBT / PSET possible
         for i in range(psbtv.num_inputs):
-            self.show_loader(title="Parsing input %d..." % i)
+            progress.update(i)
+            yield
             # load input to memory, verify it (check prevtx hash)
             inp = psbtv.input(i)
-            metainp = meta["inputs"][i]
             # verify, do not require non_witness_utxo if witness_utxo is set
             inp.verify(ignore_missing=True)
 
             # check sighash in the input
             if inp.sighash_type is not None and inp.sighash_type != self.DEFAULT_SIGHASH:
-                metainp["sighash"] = self.get_sighash_info(inp.sighash_type)["name"]
+                meta.inputs.set(i, "sighash", self.get_sighash_info(inp.sighash_type)["name"])
 
+            snapshot = ScopeOverlay.snapshot(inp)
             self.fill_zero_fingerprint(inp)
 
-            # Find wallets owning the inputs and fill scope data:
-            # first we check already detected wallet owns the input
-            # as in most common case all inputs are owned by the same wallet.
-            wallet = None
+            # Find wallets owning the inputs and fill scope data
+            wallet = self.find_scope_wallet(inp, wallets)
+            overlay = ScopeOverlay.diff(inp, snapshot)
+            if overlay is not None:
+                psbtv.input_overlays[i] = overlay
+            plan.add_input(i, inp, wallet)
+            if wallet:
+                plan.use(wallet, inp)
             gaps = None
-            for w in wallets:
-                # pass rangeproof offset if it's in the scope
-                if w and w.fill_scope(inp, fingerprint):
-                    wallet = w
-                    break
-            if wallet is None:
-                # find wallet and append it to wallets
-                for w in self.wallets:
-                    # pass rangeproof offset if it's in the scope
-                    if w.fill_scope(inp, fingerprint):
-                        wallet = w
-                        break
             if wallet:
                 gaps = [g for g in wallet.gaps] # copy
                 res = wallet.get_derivation(inp.bip32_derivations)
@@ -698,52 +861,37 @@ class WalletManager(BaseApp):
             fee += value
 
             wallets[wallet]["amount"] = wallets.get(wallet, {}).get("amount") + value
-            metainp.update({
-                "label": wallet.name if wallet else "Unknown wallet",
+            label = wallet.name if wallet else "Unknown wallet"
+            if wallet and wallet.is_watchonly:
+                label += " (watch-only)"
+            meta.inputs.update(i, {
+                "label": label,
                 "value": value,
                 "sequence": inp.sequence,
             })
-            if wallet and wallet.is_watchonly:
-                metainp["label"] += " (watch-only)"
-            # write non_witness_utxo separately if it exists (as we use compressed psbtview)
-            non_witness_utxo_off = None
-            off = psbtv.seek_to_scope(i)
-            non_witness_utxo_off = psbtv.seek_to_value(b'\x00', from_current=True)
-            if non_witness_utxo_off:
-                non_witness_utxo_off += off
-                l = compact.read_from(psbtv.stream)
-                fout.write(b"\x01\x00")
-                fout.write(compact.to_bytes(l))
-                read_write(psbtv.stream, fout, l)
-            inp.write_to(fout, version=psbtv.version)
 
         # parse all outputs
         for i in range(psbtv.num_outputs):
-            self.show_loader(title="Parsing output %d..." % i)
+            progress.update(psbtv.num_inputs + i)
+            yield
             out = psbtv.output(i)
-            metaout = meta["outputs"][i]
+            metaout = {}
 
+            snapshot = ScopeOverlay.snapshot(out)
             self.fill_zero_fingerprint(out)
 
-            wallet = None
-            for w in wallets:
-                # pass rangeproof offset if it's in the scope
-                if w and w.fill_scope(out, fingerprint):
-                    wallet = w
-                    break
-            if wallet is None:
-                # find wallet and append it to wallets
-                for w in self.wallets:
-                    if w.fill_scope(out, fingerprint):
-                        wallet = w
-                        break
+            wallet = self.find_scope_wallet(out, wallets)
+            overlay = ScopeOverlay.diff(out, snapshot)
+            if overlay is not None:
+                psbtv.output_overlays[i] = overlay
+            if wallet and wallet in wallets:
+                plan.use(wallet, out)
             # Get values and store in metadata and wallets dict
             value = out.value
             fee -= value
             metaout.update({
                 "change": (wallet is not None and len(wallets) == 1 and wallet in wallets),
                 "value": value,
-                "address": self.get_address(out),
             })
             if wallet:
                 metaout["label"] = wallet.name
@@ -764,43 +912,116 @@ class WalletManager(BaseApp):
                         metaout["warning"] = "Derivation index is by %d larger than last known used index %d!" % (idx-allowed_idx+wallet.GAP_LIMIT, allowed_idx-wallet.GAP_LIMIT)
                 if wallet.is_watchonly:
                     metaout["warning"] = "Watch-only wallet!"
-
-            out.write_to(fout, version=psbtv.version)
+            meta.outputs.update(i, metaout)
         meta["fee"] = fee
+        psbtv.plan = plan
         return wallets, meta
 
+    @trace("WalletManager.sign_psbtview")
     def sign_psbtview(self, psbtv, out_stream, wallets, sighash):
+        """
+        Signs inputs following psbtv.plan and writes signed psbt to out_stream.
+        Without the plan every input is passed to all signers.
+        Wallets are updated only if signing succeeded.
+        """
+        progress = LoaderProgress(self.show_loader, "Signing transaction...", psbtv.num_inputs)
+        for i in self.sign_psbtview_iter(psbtv, out_stream, wallets, sighash):
+            progress.update(i)
+        self.update_wallets(psbtv, wallets)
+
+    async def sign_psbtview_async(self, psbtv, out_stream, wallets, sighash, token=None):
+        """
+        Same as sign_psbtview, but yields to other tasks while signing
+        and stops if the token is cancelled. Wallets are updated at the end.
+        """
+        progress = LoaderProgress(self.show_loader, "Signing transaction...", psbtv.num_inputs)
+        await cooperate(self.sign_psbtview_iter(psbtv, out_stream, wallets, sighash), token, progress)
+        self.update_wallets(psbtv, wallets)
+
+    def update_wallets(self, psbtv, wallets):
+        """Updates max used derivations in wallets"""
+        plan = getattr(psbtv, "plan", None)
         for w in wallets:
             if w is None:
                 continue
-            # update max used derivations in wallets
-            w.update_gaps(psbtv=psbtv)
-            w.save(self.keystore)
+            if plan is None:
+                w.update_gaps(psbtv=psbtv)
+            else:
+                w.update_gaps(used_idxs=plan.used.get(w))
+            self.script_index.extend(w)
+            self.save_wallet(w)
+
+    def sign_psbtview_iter(self, psbtv, out_stream, wallets, sighash):
+        """
+        Same as sign_psbtview, but doesn't update wallets
+        and yields the index of every input before signing it.
+        """
+        plan = getattr(psbtv, "plan", None)
         sig_count = 0
-        with open(self.tempdir+"/sigs", "wb") as sig_stream:
-            for i in range(psbtv.num_inputs):
-                self.show_loader(title="Signing input %d of %d" % (i+1, psbtv.num_inputs))
-                inp = psbtv.input(i)
-                inp_sighash = sighash or inp.sighash_type or self.DEFAULT_SIGHASH
-                for w in wallets:
-                    if w is None:
-                        continue
-                    # sign with wallet if it has private keys
-                    if w.has_private_keys:
-                        sig_count += w.sign_input(psbtv, i, sig_stream, inp_sighash, inp)
-                # sign with keystore
-                sig_count += self.keystore.sign_input(psbtv, i, sig_stream, inp_sighash, inp)
-                # add separator
-                sig_stream.write(b"\x00")
+        sig_stream = BytesIO()
+        # digests shared by all inputs
+        sighashes = SighashCache(psbtv)
+        # signed psbt is written in a single pass:
+        # global scope, then every input with its signatures
+        psbtv.stream.seek(psbtv.offset)
+        read_write(psbtv.stream, out_stream, psbtv.first_scope-psbtv.offset)
+        for i in range(psbtv.num_inputs):
+            yield i
+            # second parse of the input after preprocessing:
+            # keeping parsed scopes of all inputs until signing
+            # doesn't fit in memory for large PSBTs (500 inputs),
+            # so the plan keeps only signers and derivations.
+            # This is the only parse here - sighash and wallet updates reuse it
+            inp = psbtv.input(i)
+            # signatures are added to the parsed scope directly,
+            # serialized copies are not needed
+            sig_stream.seek(0)
+            if plan is None:
+                sig_count += self.sign_input_all(psbtv, i, inp, sig_stream, wallets, sighash, sighashes)
+            elif plan.get(i) is not None:
+                sig_count += self.sign_input_planned(psbtv, i, inp, sig_stream, plan.get(i), sighash, sighashes)
+            # remove unnecessary stuff
+            inp.clear_metadata(compress=CompressMode.PARTIAL)
+            inp.write_to(out_stream, version=psbtv.version)
+        memstats.sample("sigs")
         if sig_count == 0:
             raise WalletError("We didn't add any signatures!\n\nMaybe you forgot to import the wallet?\n\nScan the wallet descriptor to import it.")
-        # remove unnecessary stuff:
-        with open(self.tempdir+"/sigs", "rb") as sig_stream:
-            psbtv.write_to(out_stream, compress=CompressMode.PARTIAL, extra_input_streams=[sig_stream])
+        for i in range(psbtv.num_outputs):
+            out = psbtv.output(i)
+            out.clear_metadata(compress=CompressMode.PARTIAL)
+            out.write_to(out_stream, version=psbtv.version)
+
+    def sign_input_all(self, psbtv, i, inp, sig_stream, wallets, sighash, sighashes):
+        """Tries to sign the input with all wallets and the keystore"""
+        sig_count = 0
+        inp_sighash = sighash or inp.sighash_type or self.DEFAULT_SIGHASH
+        for w in wallets:
+            if w is None:
+                continue
+            # sign with wallet if it has private keys
+            if w.has_private_keys:
+                sig_count += w.sign_input(psbtv, i, sig_stream, inp_sighash, inp, sighashes)
+        # sign with keystore
+        sig_count += self.keystore.sign_input(psbtv, i, sig_stream, inp_sighash, inp, sighashes)
+        return sig_count
+
+    def sign_input_planned(self, psbtv, i, inp, sig_stream, entry, sighash, sighashes):
+        """Signs the input with signers from the SigningPlan entry"""
+        wallet, der, derivations, inp_sighash = entry
+        inp_sighash = sighash or inp_sighash or self.DEFAULT_SIGHASH
+        sig_count = 0
+        if wallet is not None:
+            sig_count += wallet.sign_input(psbtv, i, sig_stream, inp_sighash, inp, sighashes, der)
+        if derivations:
+            sig_count += self.keystore.sign_input(psbtv, i, sig_stream, inp_sighash, inp, sighashes, derivations)
+        return sig_count
 
 
     def wipe(self):
         """Deletes all wallets info"""
         self.wallets = []
+        self.script_index.clear()
+        self.key_index.clear()
         self.path = None
+        storage.discard(self.root_path)
         platform.delete_recursively(self.root_path)
@@ -0,0 +1,82 @@
+from .psbtindex import IndexedPSBTView
+
+
+class ScopeOverlay:
+    """
+    Data filled in a PSBT scope by the wallets:
+    derivations and scripts missing or different in the original.
+    """
+    def __init__(self):
+        self.bip32_derivations = {}
+        self.witness_script = None
+        self.redeem_script = None
+
+    @staticmethod
+    def snapshot(scope):
+        """Remembers the original fields of the scope before it is filled"""
+        ders = {}
+        for pub, der in scope.bip32_derivations.items():
+            ders[pub] = (der.fingerprint, tuple(der.derivation))
+        return ders, scope.witness_script, scope.redeem_script
+
+    @classmethod
+    def diff(cls, scope, snapshot):
+        """Returns overlay with fields changed since the snapshot or None"""
+        ders, witness_script, redeem_script = snapshot
+        overlay = cls()
+        changed = False
+        for pub, der in scope.bip32_derivations.items():
+            if ders.get(pub) != (der.fingerprint, tuple(der.derivation)):
+                overlay.bip32_derivations[pub] = der
+                changed = True
+        if _script_changed(witness_script, scope.witness_script):
+            overlay.witness_script = scope.witness_script
+            changed = True
+        if _script_changed(redeem_script, scope.redeem_script):
+            overlay.redeem_script = scope.redeem_script
+            changed = True
+        return overlay if changed else None
+
+    def apply(self, scope):
+        scope.bip32_derivations.update(self.bip32_derivations)
+        if self.witness_script is not None:
+            scope.witness_script = self.witness_script
+        if self.redeem_script is not None:
+            scope.redeem_script = self.redeem_script
+
+
+def _script_changed(old, new):
+    if new is None:
+        return False
+    return old is None or old.data != new.data
+
+
+class OverlayPSBTView(IndexedPSBTView):
+    """
+    PSBTView with fill data kept in memory:
+    overlays are applied to every scope read from the stream,
+    so the filled PSBT is never written to the ramdisk.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # scope index: ScopeOverlay
+        self.input_overlays = {}
+        self.output_overlays = {}
+
+    def input(self, i, compress=None):
+        scope = self.parsed_input(i)
+        if scope is not None:
+            # overlay is already applied
+            return scope
+        scope = super().input(i, compress)
+        overlay = self.input_overlays.get(i)
+        if overlay is not None:
+            overlay.apply(scope)
+        return scope
+
+    def output(self, i, compress=None):
+        scope = super().output(i, compress)
+        overlay = self.output_overlays.get(i)
+        if overlay is not None:
+            overlay.apply(scope)
+        return scope
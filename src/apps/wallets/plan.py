@@ -0,0 +1,53 @@
+class SigningPlan:
+    """
+    What to sign, collected while the PSBT is preprocessed.
+    For every input we can sign:
+    (wallet, (idx, branch_idx), [(pub, derivation), ...], sighash) -
+    wallet with private keys and its derivation (or None),
+    keystore keys with derivation paths and sighash type of the scope.
+    Inputs we can't sign are not in the plan.
+    Also keeps max used derivation indexes of the wallets.
+    """
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        # input index: tuple
+        self.inputs = {}
+        # wallet: [max used idx or None for every branch]
+        self.used = {}
+
+    def __len__(self):
+        return len(self.inputs)
+
+    def add_input(self, i, scope, wallet=None):
+        """Adds the input if the keystore or the wallet can sign it"""
+        derivations = []
+        for pub, der in scope.bip32_derivations.items():
+            if der.fingerprint == self.fingerprint:
+                derivations.append((pub, der.derivation))
+        for pub, (leafs, der) in scope.taproot_bip32_derivations.items():
+            if der.fingerprint == self.fingerprint:
+                derivations.append((pub, der.derivation))
+        der = None
+        if wallet is not None and wallet.has_private_keys:
+            der = wallet.get_derivation(scope.bip32_derivations, scope.taproot_bip32_derivations)
+        if der is None:
+            wallet = None
+        if wallet is None and not derivations:
+            return
+        self.inputs[i] = (wallet, der, derivations, scope.sighash_type)
+
+    def get(self, i):
+        return self.inputs.get(i)
+
+    def use(self, wallet, scope):
+        """Remembers derivation index of the wallet used in the scope"""
+        der = wallet.get_derivation(scope.bip32_derivations, scope.taproot_bip32_derivations)
+        if der is None:
+            return
+        idx, branch_idx = der
+        used = self.used.get(wallet)
+        if used is None:
+            used = [None] * len(wallet.gaps)
+            self.used[wallet] = used
+        if used[branch_idx] is None or used[branch_idx] < idx:
+            used[branch_idx] = idx
@@ -0,0 +1,128 @@
+import hashlib
+from embit import compact
+from embit.psbt import PSBTError
+from embit.transaction import TransactionOutput
+from helpers import run_steps
+
+# size of the chunks hashed while streaming previous transactions
+CHUNK_SIZE = 256
+
+
+def _hash_bytes(stream, h, l):
+    """Hashes l bytes from the stream without loading them at once"""
+    while l > 0:
+        chunk = stream.read(min(l, CHUNK_SIZE))
+        if not chunk:
+            raise PSBTError("Unexpected end of non_witness_utxo")
+        h.update(chunk)
+        l -= len(chunk)
+
+
+def _hash_string(stream, h):
+    l = compact.read_from(stream)
+    h.update(compact.to_bytes(l))
+    _hash_bytes(stream, h, l)
+
+
+def read_txid(stream, vouts=()):
+    """
+    Streams transaction from the current position of the stream.
+    Returns a tuple (txid, {vout: TransactionOutput}) for requested vouts.
+    Only requested outputs are kept in memory, witness is skipped.
+    """
+    h = hashlib.sha256()
+    h.update(stream.read(4))
+    num_vin = compact.read_from(stream)
+    # if num_vin is zero it is a segwit transaction
+    is_segwit = (num_vin == 0)
+    if is_segwit:
+        if stream.read(1) != b"\x01":
+            raise PSBTError("Invalid segwit marker")
+        num_vin = compact.read_from(stream)
+    h.update(compact.to_bytes(num_vin))
+    for i in range(num_vin):
+        # prev txid, vout, script_sig, sequence
+        _hash_bytes(stream, h, 36)
+        _hash_string(stream, h)
+        _hash_bytes(stream, h, 4)
+    num_vout = compact.read_from(stream)
+    h.update(compact.to_bytes(num_vout))
+    outputs = {}
+    for i in range(num_vout):
+        if i in vouts:
+            out = TransactionOutput.read_from(stream)
+            h.update(out.serialize())
+            outputs[i] = out
+        else:
+            _hash_bytes(stream, h, 8)
+            _hash_string(stream, h)
+    for vout in vouts:
+        if vout not in outputs:
+            raise PSBTError("Invalid vout index %d, max is %d" % (vout, num_vout - 1))
+    if is_segwit:
+        for i in range(num_vin):
+            for j in range(compact.read_from(stream)):
+                l = compact.read_from(stream)
+                stream.seek(l, 1)
+    h.update(stream.read(4))
+    txid = bytes(reversed(hashlib.sha256(h.digest()).digest()))
+    return txid, outputs
+
+
+class PrevTxVerifier:
+    """
+    Verifies non_witness_utxo of all inputs of the PSBTView.
+    Every previous transaction is streamed from the PSBT and hashed once,
+    inputs spending the same transaction share the verified outputs,
+    so their own copies of the transaction are not read at all.
+    """
+    def __init__(self, psbtv):
+        self.psbtv = psbtv
+        # input index: (txid, vout) of inputs with non_witness_utxo
+        self.inputs = None
+        # txid: {vout: TransactionOutput} of verified transactions
+        self.verified = {}
+
+    def collect_iter(self):
+        """
+        Verifies previous transactions of all inputs,
+        yields before streaming every transaction.
+        """
+        if self.inputs is not None:
+            return
+        psbtv = self.psbtv
+        inputs = {}
+        # txid: (offset of the first copy, set of vouts)
+        txs = {}
+        for i in range(psbtv.num_inputs):
+            off = psbtv.index.seek_to_value(i, b"\x00")
+            if off is None:
+                continue
+            vin = psbtv.vin(i)
+            inputs[i] = (vin.txid, vin.vout)
+            if vin.txid not in txs:
+                txs[vin.txid] = (off, set())
+            txs[vin.txid][1].add(vin.vout)
+        for txid in txs:
+            yield
+            off, vouts = txs[txid]
+            psbtv.stream.seek(off)
+            compact.read_from(psbtv.stream)
+            h, outputs = read_txid(psbtv.stream, vouts)
+            if h != txid:
+                raise PSBTError("Previous txid doesn't match non_witness_utxo txid")
+            self.verified[txid] = outputs
+        # set only when all transactions are verified
+        self.inputs = inputs
+
+    def __len__(self):
+        return len(self.verified)
+
+    def utxo(self, i):
+        """Returns a tuple (txid, verified utxo) or None if input doesn't have non_witness_utxo"""
+        if self.inputs is None:
+            run_steps(self.collect_iter())
+        if i not in self.inputs:
+            return None
+        txid, vout = self.inputs[i]
+        return txid, self.verified[txid][vout]
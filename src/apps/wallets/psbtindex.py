@@ -0,0 +1,154 @@
+from array import array
+from embit import compact
+from embit.psbtview import PSBTView, PSBTError, read_string, skip_string
+from .prevtx import PrevTxVerifier
+
+
+class PSBTIndex:
+    """
+    Offset table of the PSBT stream built in a single pass:
+    start of every scope and offset and length of every key.
+    Fields are looked up without rescanning the key-value pairs.
+    Scope numbers are the same as in PSBTView.seek_to_scope:
+    None for global, 0..num_inputs+num_outputs for inputs and outputs.
+    """
+    def __init__(self, psbtv):
+        self.stream = psbtv.stream
+        self.num_scopes = psbtv.num_inputs + psbtv.num_outputs
+        # offsets of the global scope, every scope and the end of psbt
+        self.scopes = array("I")
+        # index of the first field of every scope
+        self.first_field = array("I")
+        # first byte of the key - key type
+        self.types = array("B")
+        # offsets of keys and values (compact length of the value)
+        self.keys = array("I")
+        self.key_lens = array("I")
+        self.values = array("I")
+        off = psbtv.offset + len(psbtv.MAGIC)
+        self.stream.seek(off)
+        for n in range(self.num_scopes + 1):
+            self.scopes.append(off)
+            self.first_field.append(len(self.types))
+            off = self._index_scope(off)
+        self.scopes.append(off)
+        self.first_field.append(len(self.types))
+        self.stream.seek(psbtv.first_scope)
+
+    def __len__(self):
+        return len(self.types)
+
+    def _index_scope(self, off):
+        while True:
+            l = compact.read_from(self.stream)
+            off += len(compact.to_bytes(l))
+            # separator
+            if l == 0:
+                return off
+            self.types.append(self.stream.read(1)[0])
+            self.keys.append(off)
+            self.key_lens.append(l)
+            off += l
+            self.stream.seek(off)
+            self.values.append(off)
+            vl = compact.read_from(self.stream)
+            off += len(compact.to_bytes(vl)) + vl
+            self.stream.seek(off)
+
+    def _scope(self, n):
+        if n is None:
+            return 0
+        if n < 0 or n > self.num_scopes:
+            raise PSBTError("Invalid scope number")
+        return n + 1
+
+    def scope_offset(self, n):
+        return self.scopes[self._scope(n)]
+
+    def find(self, n, key_start):
+        """Returns field number of the key starting with key_start or None"""
+        s = self._scope(n)
+        if s > self.num_scopes:
+            return None
+        l = len(key_start)
+        for i in range(self.first_field[s], self.first_field[s + 1]):
+            if self.types[i] != key_start[0] or self.key_lens[i] < l:
+                continue
+            if l > 1:
+                self.stream.seek(self.keys[i])
+                if self.stream.read(l) != key_start:
+                    continue
+            return i
+
+    def seek_to_scope(self, n):
+        off = self.scope_offset(n)
+        self.stream.seek(off)
+        return off
+
+    def seek_to_value(self, n, key_start):
+        """
+        Moves the stream to the value of the key in scope n.
+        Returns absolute offset of the value or None if not found.
+        """
+        i = self.find(n, key_start)
+        if i is None:
+            return None
+        self.stream.seek(self.values[i])
+        return self.values[i]
+
+
+class IndexedPSBTView(PSBTView):
+    """
+    PSBTView seeking to scopes with the offset index.
+    Previous transactions in compressed inputs are verified once
+    by PrevTxVerifier and are not parsed again.
+    While sighash.sign_input is running sighash_cache is used for digests
+    and current_scope (index, scope) is returned instead of parsing the input.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.index = PSBTIndex(self)
+        self.prevtxs = PrevTxVerifier(self)
+        self.sighash_cache = None
+        self.current_scope = None
+
+    def seek_to_scope(self, n):
+        return self.index.seek_to_scope(n)
+
+    def parsed_input(self, i):
+        """Returns the input scope that is being signed or None"""
+        if self.current_scope is not None and self.current_scope[0] == i:
+            return self.current_scope[1]
+
+    def sighash(self, i, *args, **kwargs):
+        if self.sighash_cache is not None:
+            return self.sighash_cache.sighash(i, *args, **kwargs)
+        return super().sighash(i, *args, **kwargs)
+
+    def input(self, i, compress=None):
+        scope = self.parsed_input(i)
+        if scope is not None:
+            return scope
+        if compress is None:
+            compress = self.compress
+        if not compress:
+            return super().input(i, compress)
+        if i < 0 or i >= self.num_inputs:
+            raise PSBTError("Invalid input index")
+        verified = self.prevtxs.utxo(i)
+        vin = self.tx.vin(i) if self.tx else None
+        scope = self.PSBTIN_CLS({}, vin=vin, compress=compress)
+        self.seek_to_scope(i)
+        while True:
+            key = read_string(self.stream)
+            # separator
+            if len(key) == 0:
+                break
+            if key == b"\x00" and verified is not None:
+                skip_string(self.stream)
+                txid, scope._utxo = verified
+                scope._txhash = bytes(reversed(txid))
+            else:
+                scope.read_value(self.stream, key)
+        return scope
+
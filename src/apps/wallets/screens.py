@@ -2,6 +2,7 @@ import lvgl as lv
 from gui.common import add_label, add_button, HOR_RES, format_addr
 from gui.decorators import on_release
 from gui.screens import QRAlert, Prompt, Alert
+from gui.components.pagedlist import PagedList
 from .commands import DELETE, EDIT, MENU
 
 
@@ -125,6 +126,9 @@ class WalletScreen(QRAlert):
             self.warning.set_text("")
         self.hide_loader()
 
+# number of keys shown at once
+KEYS_PER_PAGE = 5
+
 # micropython doesn't support mixins :(
 def _build_screen(scr, policy, keys):
     scr.policy = add_label("Policy: " + policy, y=75, scr=scr)
@@ -150,24 +154,36 @@ def _build_screen(scr, policy, keys):
         0,
         30 + 40*int(need_slip132_switch)
     )
-    scr.message.set_recolor(True)
     scr.page.set_height(500)
+    # only keys on the current page have labels
+    scr.keys_list = PagedList(
+        scr.page, len(keys), _create_key_row,
+        lambda lbl, i, y: _fill_key_row(scr, lbl, i, y),
+        page_size=KEYS_PER_PAGE,
+    )
+
+def _create_key_row(parent):
+    lbl = add_label("", scr=parent)
+    lbl.set_recolor(True)
+    return lbl
 
-def _fill_message(keys, is_complex, use_slip132=False):
-    msg = ""
+def _fill_key_row(scr, lbl, i, y):
+    lbl.set_text(_key_message(scr.keys[i], i, scr.is_complex, scr.use_slip132))
+    lbl.set_hidden(False)
+    lbl.set_y(y)
+    return y + lbl.get_height()
+
+def _key_message(k, i, is_complex, use_slip132=False):
     arg = "slip132" if use_slip132 else "canonical"
-    for i, k in enumerate(keys):
-        alias = "" if not is_complex else " (%s)" % chr(65+i)
-        kstr = str(k[arg]).replace("]","]\n")
-        if k["mine"]:
-            msg += "#7ED321 My key%s: #\n%s\n\n" % (alias, kstr)
-        elif k["is_nums"]:
-            msg += "#00CAF1 NUMS key%s: #\nNobody knows private key\n\n" % alias
-        elif k["is_private"]:
-            msg += "#F51E2D Private key%s: #\n%s\n\n" % (alias, kstr)
-        else:
-            msg += "#F5A623 External key%s:\n# %s\n\n" % (alias, kstr)
-    return msg
+    alias = "" if not is_complex else " (%s)" % chr(65+i)
+    kstr = str(k[arg]).replace("]","]\n")
+    if k["mine"]:
+        return "#7ED321 My key%s: #\n%s\n\n" % (alias, kstr)
+    elif k["is_nums"]:
+        return "#00CAF1 NUMS key%s: #\nNobody knows private key\n\n" % alias
+    elif k["is_private"]:
+        return "#F51E2D Private key%s: #\n%s\n\n" % (alias, kstr)
+    return "#F5A623 External key%s:\n# %s\n\n" % (alias, kstr)
 
 
 class ConfirmWalletScreen(Prompt):
@@ -183,8 +199,7 @@ class ConfirmWalletScreen(Prompt):
         return self.slip_switch.get_state() if self.slip_switch is not None else False
 
     def fill_message(self):
-        msg = _fill_message(self.keys, self.is_complex, self.use_slip132)
-        self.message.set_text(msg)
+        self.keys_list.update(self.message.get_y())
 
 
 class WalletInfoScreen(Alert):
@@ -200,5 +215,4 @@ class WalletInfoScreen(Alert):
         return self.slip_switch.get_state() if self.slip_switch is not None else False
 
     def fill_message(self):
-        msg = _fill_message(self.keys, self.is_complex, self.use_slip132)
-        self.message.set_text(msg)
+        self.keys_list.update(self.message.get_y())
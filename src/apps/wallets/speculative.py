@@ -0,0 +1,86 @@
+import asyncio
+import os
+import platform
+from helpers import B64Writer
+
+
+class SpeculativeSigner:
+    """
+    Signs PSBT in the background while the user reviews the transaction.
+    Signed PSBT is written to a temporary file, the task yields
+    to the GUI loop after every input.
+    When the user confirms with the same options the file becomes
+    the result, otherwise the task is cancelled and the file is removed.
+    Wallets are not updated here - only when the result is committed.
+    """
+    # ms between checks of the cancel token while waiting for the task
+    POLL_INTERVAL = 10
+
+    def __init__(self, manager, psbtv, wallets, fname, b64=False):
+        self.manager = manager
+        self.psbtv = psbtv
+        self.wallets = wallets
+        self.fname = fname
+        self.tmp = fname + ".tmp"
+        self.b64 = b64
+        self.options = None
+        self.task = None
+        self.running = False
+        self.done = False
+
+    def start(self, options):
+        """Starts signing with options that will likely be confirmed"""
+        self.cancel()
+        self.options = options
+        self.running = True
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        try:
+            with open(self.tmp, "wb") as f:
+                out = B64Writer(f) if self.b64 else f
+                for i in self.manager.sign_psbtview_iter(self.psbtv, out, self.wallets, **self.options):
+                    await asyncio.sleep_ms(0)
+                if self.b64:
+                    out.close()
+            self.done = True
+        finally:
+            self.running = False
+            if not self.done:
+                self.wipe()
+
+    async def commit(self, options, token=None):
+        """
+        Waits for the background signing to finish and moves the result to fname.
+        Returns False if it was started with different options,
+        None if the token was cancelled while waiting.
+        """
+        if self.task is None or options != self.options:
+            self.cancel()
+            return False
+        while self.running:
+            if token is not None and token.cancelled:
+                self.cancel()
+                return None
+            await asyncio.sleep_ms(self.POLL_INTERVAL)
+        # re-raises errors of the signing, i.e. no signatures added
+        await self.task
+        self.task = None
+        if platform.file_exists(self.fname):
+            os.remove(self.fname)
+        os.rename(self.tmp, self.fname)
+        return True
+
+    def cancel(self):
+        """Stops signing and removes partial result"""
+        if self.task is not None and self.running:
+            # file is still open, the task removes it when cancelled
+            self.task.cancel()
+        else:
+            self.wipe()
+        self.task = None
+        self.done = False
+
+    def wipe(self):
+        if platform.file_exists(self.tmp):
+            os.remove(self.tmp)
@@ -0,0 +1,118 @@
+from array import array
+
+# value of blinded inputs and outputs we can't unblind
+UNKNOWN_VALUE = -1
+# sequence with locktime and rbf disabled
+SEQUENCE_FINAL = 0xFFFFFFFF
+
+
+class MetaItems:
+    """
+    Metadata of transaction inputs or outputs for display.
+    Values, sequences, label and asset ids are stored in arrays,
+    rare fields like sighash, warning or raw asset - in a sparse dict.
+    Output addresses are not stored, they are derived on demand.
+    """
+    # fields stored in arrays
+    FIELDS = ["value", "sequence", "label", "asset", "change"]
+
+    def __init__(self, meta, n):
+        self.meta = meta
+        self.values = array("q", [0] * n)
+        self.sequences = array("I", [SEQUENCE_FINAL] * n)
+        # ids in meta.labels, 0 is empty label
+        self.labels = array("H", [0] * n)
+        # ids in meta.labels, 0 is default asset
+        self.assets = array("H", [0] * n)
+        self.changes = array("B", [0] * n)
+        # index: {field: value}
+        self.extra = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def value(self, i):
+        return self.values[i]
+
+    def sequence(self, i):
+        return self.sequences[i]
+
+    def label(self, i):
+        return self.meta.labels[self.labels[i]]
+
+    def asset(self, i):
+        idx = self.assets[i]
+        return self.meta.labels[idx] if idx else self.meta.get("default_asset", "BTC")
+
+    def change(self, i):
+        return bool(self.changes[i])
+
+    def address(self, i):
+        return self.meta.get_address(i)
+
+    def get(self, i, field, default=None):
+        """Returns one of the rare fields"""
+        return self.extra.get(i, {}).get(field, default)
+
+    def set(self, i, field, value):
+        if field == "value":
+            self.values[i] = value
+        elif field == "sequence":
+            self.sequences[i] = value
+        elif field == "label":
+            self.labels[i] = self.meta.label_id(value)
+        elif field == "asset":
+            self.assets[i] = self.meta.label_id(value)
+        elif field == "change":
+            self.changes[i] = 1 if value else 0
+        else:
+            if i not in self.extra:
+                self.extra[i] = {}
+            self.extra[i][field] = value
+
+    def update(self, i, fields):
+        for k in fields:
+            self.set(i, k, fields[k])
+
+
+class TxMeta:
+    """
+    Transaction metadata for display and user confirmation.
+    Global fields (fee, warnings, tx_version...) are accessed as in a dict,
+    inputs and outputs through MetaItems accessors.
+    Labels (wallet names, assets) are interned in a single table,
+    so every input or output only keeps an index.
+    """
+    def __init__(self, num_inputs, num_outputs, get_address=None, **fields):
+        self.labels = [""]
+        self._label_ids = {"": 0}
+        self.fields = fields
+        self.inputs = MetaItems(self, num_inputs)
+        self.outputs = MetaItems(self, num_outputs)
+        # function returning address of the output i
+        self._get_address = get_address
+
+    def label_id(self, label):
+        if label is None:
+            label = ""
+        idx = self._label_ids.get(label)
+        if idx is None:
+            idx = len(self.labels)
+            self.labels.append(label)
+            self._label_ids[label] = idx
+        return idx
+
+    def get_address(self, i):
+        return self._get_address(i)
+
+    def get(self, k, default=None):
+        return self.fields.get(k, default)
+
+    def __getitem__(self, k):
+        return self.fields[k]
+
+    def __setitem__(self, k, v):
+        self.fields[k] = v
+
+    def __contains__(self, k):
+        return k in self.fields
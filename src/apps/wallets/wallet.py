@@ -3,12 +3,15 @@ import platform
 from platform import maybe_mkdir, delete_recursively
 import json
 from embit import ec, hashes
+from embit.hashes import sha256
+from binascii import hexlify, unhexlify
 from embit.networks import NETWORKS
 from embit.psbt import DerivationPath
 from embit.descriptor import Descriptor
 from embit.descriptor.checksum import add_checksum
-from embit.descriptor.arguments import AllowedDerivation
+from embit.descriptor.arguments import AllowedDerivation, KeyOrigin
 from embit.transaction import SIGHASH
+from sighash import sign_input
 from .screens import WalletScreen, WalletInfoScreen
 from .commands import DELETE, EDIT, MENU, INFO, EXPORT
 from gui.screens import Menu, QRAlert, Alert, Prompt
@@ -21,6 +24,8 @@ class WalletError(AppError):
 class Wallet:
 
     GAP_LIMIT = 20
+    # max number of derived descriptors kept in memory
+    DERIVATION_CACHE_SIZE = 40
     DescriptorClass = Descriptor
     Networks = NETWORKS
 
@@ -30,12 +35,24 @@ class Wallet:
         if self.path is not None:
             self.path = self.path.rstrip("/")
             maybe_mkdir(self.path)
-        self.descriptor = desc
+        # descriptor is None if the wallet is loaded from the catalog,
+        # it is parsed on first use
+        self._descriptor = desc
+        # id and record of the wallet in the catalog
+        self.wid = None
+        self.record = None
         # receive and change gap limits
-        self.gaps = [self.GAP_LIMIT for b in range(self.descriptor.num_branches)]
+        self.gaps = None
+        if desc is not None:
+            self.gaps = [self.GAP_LIMIT for b in range(desc.num_branches)]
         self.name = name
         self.unused_recv = 0
         self.keystore = None
+        # descriptors with keys derived up to the wildcard, one per branch
+        self._branches = {}
+        # (branch, idx): [derived descriptor, last use]
+        self._derived = {}
+        self._counter = 0
 
     async def show(self, network, show_screen):
         while True:
@@ -97,29 +114,71 @@ class Wallet:
             else:
                 return
 
+    @property
+    def descriptor(self):
+        if self._descriptor is None:
+            self._descriptor = self.load_descriptor()
+        return self._descriptor
+
+    @property
+    def is_loaded(self):
+        return self._descriptor is not None
+
+    def load_descriptor(self):
+        """Parses the descriptor from the catalog record"""
+        if self.record is None:
+            raise WalletError("Wallet descriptor is not available")
+        descriptor = type(self).from_descriptor(self.record["descriptor"], None).descriptor
+        if self.record["hash"] != hexlify(sha256(str(descriptor).encode())).decode():
+            raise WalletError("Wallet descriptor doesn't match the record")
+        return descriptor
+
+    @property
+    def descriptor_hash(self):
+        """Hash of the descriptor to compare wallets without parsing"""
+        if self.is_loaded or self.record is None:
+            return hexlify(sha256(str(self.descriptor).encode())).decode()
+        return self.record["hash"]
+
+    def key_origins(self):
+        """Returns a list of (fingerprint, derivation, length of the derivation after the origin) of derivable keys"""
+        if not self.is_loaded and self.record is not None:
+            return [(unhexlify(fgp), tuple(der), l) for fgp, der, l in self.record["origins"]]
+        return [
+            (k.fingerprint, tuple(k.derivation), len(k.allowed_derivation.indexes))
+            for k in self.keys if getattr(k, "can_derive", False)
+        ]
+
+    def get_meta(self):
+        """Returns fields of the catalog record that change"""
+        return {
+            "name": self.name,
+            "gaps": self.gaps,
+            "unused_recv": self.unused_recv,
+        }
+
+    def get_record(self):
+        """Returns full catalog record of the wallet"""
+        obj = self.get_meta()
+        obj.update({
+            "descriptor": str(self.descriptor) if self.is_loaded else self.record["descriptor"],
+            "hash": self.descriptor_hash,
+            "origins": [[hexlify(fgp).decode(), list(der), l] for fgp, der, l in self.key_origins()],
+            "watchonly": self.is_watchonly,
+        })
+        return obj
+
     @property
     def is_watchonly(self):
         """Checks if the wallet is watch-only (doesn't control the key) or not"""
+        if not self.is_loaded and self.record is not None:
+            return self.record["watchonly"]
         return not (
             any([self.keystore.owns(k) if self.keystore else False for k in self.keys])
             or
             any([k.is_private for k in self.descriptor.keys])
         )
 
-    def save(self, keystore, path=None):
-        # wallet has access to keystore only if it's saved or loaded from file
-        self.keystore = keystore
-        if path is not None:
-            self.path = path.rstrip("/")
-        if self.path is None:
-            raise WalletError("Path is not defined")
-        maybe_mkdir(self.path)
-        desc = str(self.descriptor)
-        keystore.save_aead(self.path + "/descriptor", plaintext=desc.encode())
-        obj = {"gaps": self.gaps, "name": self.name, "unused_recv": self.unused_recv}
-        meta = json.dumps(obj).encode()
-        keystore.save_aead(self.path + "/meta", plaintext=meta)
-
     def check_network(self, network):
         """
         Checks that all the keys belong to the network (version of xpub and network of private key).
@@ -136,11 +195,6 @@ class Wallet:
                     return False
         return True
 
-    def wipe(self):
-        if self.path is None:
-            raise WalletError("I don't know path...")
-        delete_recursively(self.path, include_self=True)
-
     def get_address(self, idx: int, network: str, branch_index=0):
         desc, gap = self.get_descriptor(idx, branch_index)
         return desc.address(self.Networks[network]), gap
@@ -150,7 +204,58 @@ class Wallet:
             raise WalletError("Invalid branch index %d - can be between 0 and %d" % (branch_index, self.descriptor.num_branches))
         if idx < 0 or idx >= 0x80000000:
             raise WalletError("Invalid index %d" % idx)
-        return self.descriptor.derive(idx, branch_index=branch_index), self.gaps[branch_index]
+        return self.derive(idx, branch_index), self.gaps[branch_index]
+
+    def branch_keys(self, desc):
+        """Keys of the branch descriptor that can be derived in advance"""
+        return desc.keys
+
+    def get_branch(self, branch_index=0):
+        """
+        Returns the descriptor of the branch where every key
+        is already derived up to the wildcard (xpub/1/* -> xpub_1/*),
+        so deriving an address costs one child derivation per key.
+        """
+        desc = self._branches.get(branch_index)
+        if desc is not None:
+            return desc
+        desc = self.descriptor.branch(branch_index)
+        for k in self.branch_keys(desc):
+            if not getattr(k, "can_derive", False):
+                continue
+            indexes = k.allowed_derivation.indexes
+            n = 0
+            while n < len(indexes) and isinstance(indexes[n], int):
+                n += 1
+            if n == 0 or n == len(indexes):
+                continue
+            prefix = indexes[:n]
+            if k.origin:
+                k.origin = KeyOrigin(k.origin.fingerprint, k.origin.derivation + prefix)
+            else:
+                k.origin = KeyOrigin(k.key.child(0).fingerprint, prefix)
+            k.key = k.key.derive(prefix)
+            k.allowed_derivation = AllowedDerivation(indexes[n:])
+        self._branches[branch_index] = desc
+        return desc
+
+    def derive(self, idx, branch_index=0):
+        """Returns derived descriptor, recently used ones are cached"""
+        key = (branch_index, idx)
+        self._counter += 1
+        v = self._derived.get(key)
+        if v is not None:
+            v[1] = self._counter
+            return v[0]
+        desc = self.get_branch(branch_index).derive(idx)
+        while self._derived and len(self._derived) >= self.DERIVATION_CACHE_SIZE:
+            oldest = None
+            for k in self._derived:
+                if oldest is None or self._derived[k][1] < self._derived[oldest][1]:
+                    oldest = k
+            del self._derived[oldest]
+        self._derived[key] = [desc, self._counter]
+        return desc
 
     def script_pubkey(self, derivation: list):
         """Returns script_pubkey and gap limit"""
@@ -168,7 +273,17 @@ class Wallet:
         """
         Checks that psbt scope belongs to the wallet.
         """
-        return self.descriptor.owns(psbt_scope)
+        # we can't check if we don't know script_pubkey
+        if psbt_scope.script_pubkey is None:
+            return False
+        # quick check of script_pubkey type
+        if psbt_scope.script_pubkey.script_type() != self.descriptor.scriptpubkey_type():
+            return False
+        der = self.get_derivation(psbt_scope.bip32_derivations, psbt_scope.taproot_bip32_derivations)
+        if der is None:
+            return False
+        idx, branch_idx = der
+        return self.derive(idx, branch_idx).script_pubkey() == psbt_scope.script_pubkey
 
     def get_derivation(self, bip32_derivations={}, taproot_bip32_derivations={}):
         # otherwise we need standard derivation
@@ -181,7 +296,7 @@ class Wallet:
             if der is not None:
                 return der
 
-    def update_gaps(self, psbtv=None, known_idxs=None):
+    def update_gaps(self, psbtv=None, known_idxs=None, used_idxs=None):
         gaps = self.gaps
         # update from psbt
         if psbtv is not None:
@@ -193,6 +308,11 @@ class Wallet:
                         idx, branch_idx = res
                         if idx + self.GAP_LIMIT > gaps[branch_idx]:
                             gaps[branch_idx] = idx + self.GAP_LIMIT + 1
+        # update from max used indexes, i.e. from SigningPlan
+        if used_idxs is not None:
+            for i, idx in enumerate(used_idxs):
+                if idx is not None and idx + self.GAP_LIMIT > gaps[i]:
+                    gaps[i] = idx + self.GAP_LIMIT + 1
         # update from gaps arg
         if known_idxs is not None:
             for i, gap in enumerate(gaps):
@@ -209,7 +329,7 @@ class Wallet:
         if der is None:
             return False
         idx, branch_idx = der
-        desc = self.descriptor.derive(idx, branch_index=branch_idx)
+        desc = self.derive(idx, branch_idx)
         # find keys with our fingerprint
         for key in desc.keys:
             if key.fingerprint == fingerprint:
@@ -267,27 +387,28 @@ class Wallet:
             if der is None:
                 continue
             idx, branch = der
-            derived = self.descriptor.derive(idx, branch_index=branch)
+            derived = self.derive(idx, branch)
             keys = [k for k in derived.keys if k.is_private]
             for k in keys:
                 if k.is_private:
                     psbt.sign_with(k.private_key, sighash)
 
-    def sign_input(self, psbtv, i, sig_stream, sighash=SIGHASH.ALL, extra_scope_data=None):
+    def sign_input(self, psbtv, i, sig_stream, sighash=SIGHASH.ALL, extra_scope_data=None, sighashes=None, der=None):
         if not self.has_private_keys:
             return 0
-        inp = psbtv.input(i)
-        inp.update(extra_scope_data)
-        der = self.get_derivation(inp.bip32_derivations, inp.taproot_bip32_derivations)
+        if der is None:
+            inp = psbtv.input(i)
+            inp.update(extra_scope_data)
+            der = self.get_derivation(inp.bip32_derivations, inp.taproot_bip32_derivations)
         if der is None:
             return 0
         idx, branch = der
-        derived = self.descriptor.derive(idx, branch_index=branch)
+        derived = self.derive(idx, branch)
         keys = [k for k in derived.keys if k.is_private]
         count = 0
         for k in keys:
             if k.is_private:
-                count += psbtv.sign_input(i, k.private_key, sig_stream, sighash, extra_scope_data=extra_scope_data)
+                count += sign_input(psbtv, i, k.private_key, sig_stream, sighash, extra_scope_data, sighashes)
         return count
 
 
@@ -315,9 +436,20 @@ class Wallet:
                     k.allowed_derivation = AllowedDerivation.default()
         return cls(descriptor, path)
 
+    @classmethod
+    def from_record(cls, wid, keystore, record):
+        """Creates a wallet from the catalog record, descriptor is parsed on first use"""
+        w = cls(None, name=record["name"])
+        w.wid = wid
+        w.record = record
+        w.gaps = record["gaps"]
+        w.unused_recv = record["unused_recv"]
+        w.keystore = keystore
+        return w
+
     @classmethod
     def from_path(cls, path, keystore):
-        """Loads wallet from the folder"""
+        """Loads wallet from the folder (storage format before the catalog)"""
         path = path.rstrip("/")
         _, desc = keystore.load_aead(path + "/descriptor")
         w = cls.from_descriptor(desc.decode(), path)
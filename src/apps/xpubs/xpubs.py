@@ -5,7 +5,7 @@ import json
 from binascii import hexlify
 from embit.liquid.networks import NETWORKS
 from embit import bip32
-from helpers import is_liquid
+from helpers import is_liquid, LoaderProgress
 from io import BytesIO
 import platform
 from collections import OrderedDict
@@ -172,6 +172,8 @@ class XpubApp(BaseApp):
         if to_account >= 0x80000000:
             raise AppError('Account number too large')
         fingerprint = hexlify(self.keystore.fingerprint).decode()
+        progress = LoaderProgress(self.show_loader, "Exporting accounts...",
+                                  to_account - from_account + 1)
         if file_format == self.export_specter_diy:
             # in our format we can dump any number of accounts in one file
             filename = "%s-%s-%d-%d.txt" % (
@@ -184,7 +186,7 @@ class XpubApp(BaseApp):
                         return
                 with sd.open(filename, "w") as f:
                     for account in range(from_account, to_account+1):
-                        self.show_loader(title="Exporting account %d..." % account)
+                        progress.update(account - from_account)
                         self._dump_account(f, file_format, account)
             await show_screen(
                 Alert(
@@ -195,7 +197,7 @@ class XpubApp(BaseApp):
             )
         else: # cc format - one file per account
             for account in range(from_account, to_account+1):
-                self.show_loader(title="Exporting account %d..." % account)
+                progress.update(account - from_account)
                 await self.save_all_to_sd(file_format, account, show_screen)
             await show_screen(
                 Alert(
@@ -1,4 +1,5 @@
 import lvgl as lv
+from ..decorators import on_release
 
 class Modal(lv.obj):
     """mbox with semi-transparent background"""
@@ -20,6 +21,36 @@ class Modal(lv.obj):
         self.mbox = lv.mbox(self)
         self.mbox.set_width(400)
         self.mbox.align(None, lv.ALIGN.IN_TOP_MID, 0, 200)
+        # created on first use
+        self.bar = None
+        self.cancel_button = None
 
     def set_text(self, text):
         self.mbox.set_text(text)
+        if self.cancel_button is not None:
+            self.cancel_button.align(self.mbox, lv.ALIGN.OUT_BOTTOM_MID, 0, 60)
+
+    def set_progress(self, val):
+        """Shows progress bar, val is from 0 to 1, None hides the bar"""
+        if val is None:
+            if self.bar is not None:
+                self.bar.set_hidden(True)
+            return
+        if self.bar is None:
+            self.bar = lv.bar(self)
+            self.bar.set_size(360, 20)
+            self.bar.set_range(0, 100)
+        # mbox height depends on the text
+        self.bar.align(self.mbox, lv.ALIGN.OUT_BOTTOM_MID, 0, 20)
+        self.bar.set_value(int(val * 100), lv.ANIM.OFF)
+        self.bar.set_hidden(False)
+
+    def set_cancel(self, callback):
+        """Shows Cancel button calling callback"""
+        if self.cancel_button is None:
+            self.cancel_button = lv.btn(self)
+            self.cancel_button.set_size(200, 70)
+            lbl = lv.label(self.cancel_button)
+            lbl.set_text("Cancel")
+        self.cancel_button.set_event_cb(on_release(callback))
+        self.cancel_button.align(self.mbox, lv.ALIGN.OUT_BOTTOM_MID, 0, 60)
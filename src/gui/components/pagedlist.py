@@ -0,0 +1,84 @@
+import lvgl as lv
+from ..common import add_label, add_button_pair
+from ..decorators import on_release
+
+# number of rows with widgets
+PAGE_SIZE = 10
+
+
+def set_hidden(row, hidden):
+    """Hides a widget or all widgets of a row"""
+    if isinstance(row, (tuple, list)):
+        for obj in row:
+            obj.set_hidden(hidden)
+    else:
+        row.set_hidden(hidden)
+
+
+class PagedList:
+    """
+    Shows `count` items on a page, but creates widgets only for one page.
+    `create(parent)` returns widget(s) of a row,
+    `fill(row, i, y)` shows item i in the row at y and returns y for the next row.
+    When the user switches to another page the same rows are filled again.
+    If `on_update` is set it is called instead and should call update().
+    """
+    def __init__(self, parent, count, create, fill, page_size=PAGE_SIZE, on_update=None):
+        self.parent = parent
+        self.count = count
+        self.fill = fill
+        self.page_size = page_size
+        self.on_update = on_update
+        self.first = 0
+        self.y = 0
+        self.rows = [create(parent) for i in range(min(count, page_size))]
+        self.info = None
+        if count > page_size:
+            self.info = add_label("", style="hint", scr=parent)
+            self.prv, self.nxt = add_button_pair(
+                lv.SYMBOL.LEFT + " Previous", on_release(self.prev),
+                "Next " + lv.SYMBOL.RIGHT, on_release(self.next),
+                scr=parent,
+            )
+
+    def update(self, y=None):
+        """Fills rows of the current page starting from y, returns y below the list"""
+        if y is None:
+            y = self.y
+        self.y = y
+        if self.info is not None:
+            last = min(self.first + self.page_size, self.count)
+            self.info.set_text("%d-%d of %d" % (self.first + 1, last, self.count))
+            self.info.set_y(y)
+            y += self.info.get_height() + 10
+        for k, row in enumerate(self.rows):
+            i = self.first + k
+            if i < self.count:
+                y = self.fill(row, i, y)
+            else:
+                set_hidden(row, True)
+        if self.info is not None:
+            for btn in (self.prv, self.nxt):
+                btn.set_y(y + 20)
+            self.prv.set_state(lv.btn.STATE.INA if self.first == 0 else lv.btn.STATE.REL)
+            self.nxt.set_state(lv.btn.STATE.INA if last == self.count else lv.btn.STATE.REL)
+            y = self.nxt.get_y() + self.nxt.get_height()
+        return y
+
+    def show_page(self, first):
+        self.first = first
+        if self.on_update is None:
+            self.update()
+        else:
+            # the owner lays out the list together with other widgets
+            self.on_update()
+        # scroll to the beginning of the list
+        self.parent.focus(self.info, lv.ANIM.OFF)
+
+    def prev(self):
+        if self.first > 0:
+            self.show_page(max(self.first - self.page_size, 0))
+
+    def next(self):
+        if self.first + self.page_size < self.count:
+            self.show_page(self.first + self.page_size)
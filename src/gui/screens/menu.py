@@ -1,7 +1,8 @@
 import lvgl as lv
 from .screen import Screen
-from ..common import add_label, add_button
+from ..common import add_label, add_button, styles
 from ..decorators import on_release, cb_with_args
+from ..components.pagedlist import PagedList
 
 
 class Menu(Screen):
@@ -19,36 +20,13 @@ class Menu(Screen):
         h = 800 - y - 20
         self.page.set_size(480, h)
         self.page.set_y(y)
-        y = 0
+        self.items = buttons
         self.buttons = []
-        # value, text, enable, color
-        for value, text, *args in buttons:
-            if text is not None:
-                if value is not None:
-                    enable = len(args) == 0 or args[0]
-                    if enable:
-                        cb = on_release(cb_with_args(self.set_value, value))
-                    else:
-                        cb = None
-                    btn = add_button(text, cb, y=y, scr=self.page)
-                    if not enable:
-                        btn.set_state(lv.btn.STATE.INA)
-                    # color
-                    if len(args) > 1:
-                        color = args[1]
-                        style = lv.style_t()
-                        lv.style_copy(style, btn.get_style(lv.btn.STYLE.REL))
-                        style.body.main_color = lv.color_hex(color)
-                        style.body.grad_color = lv.color_hex(color)
-                        btn.set_style(lv.btn.STYLE.REL, style)
-
-                    self.buttons.append(btn)
-                    y += 85
-                else:
-                    add_label(text.upper(), y=y + 10, style="hint", scr=self.page)
-                    y += 45
-            else:
-                y += 40
+        # values of the buttons on the current page
+        self.values = []
+        # only one page of buttons is created
+        self.list = PagedList(self.page, len(buttons), self.create_row, self.fill_row)
+        self.list.update(0)
         if last is not None:
             self.add_back_button(*last)
             self.page.set_height(h - 100)
@@ -57,3 +35,46 @@ class Menu(Screen):
         if text is None:
             text = lv.SYMBOL.LEFT + " Back"
         add_button(text, on_release(cb_with_args(self.set_value, value)), scr=self)
+
+    def create_row(self, parent):
+        k = len(self.buttons)
+        self.values.append(None)
+        btn = add_button(None, on_release(cb_with_args(self.select, k)), scr=parent)
+        lbl = lv.label(btn)
+        lbl.set_align(lv.label.ALIGN.CENTER)
+        self.buttons.append(btn)
+        return k, btn, lbl, add_label("", style="hint", scr=parent)
+
+    def select(self, k):
+        # disabled buttons don't have a value
+        if self.values[k] is not None:
+            self.set_value(self.values[k])
+
+    def fill_row(self, row, i, y):
+        # value, text, enable, color
+        value, text, *args = self.items[i]
+        k, btn, lbl, hint = row
+        btn.set_hidden(text is None or value is None)
+        hint.set_hidden(text is None or value is not None)
+        if text is None:
+            return y + 40
+        if value is None:
+            hint.set_text(text.upper())
+            hint.set_y(y + 10)
+            return y + 45
+        enable = len(args) == 0 or args[0]
+        self.values[k] = value if enable else None
+        btn.set_state(lv.btn.STATE.REL if enable else lv.btn.STATE.INA)
+        # color
+        if len(args) > 1:
+            color = args[1]
+            style = lv.style_t()
+            lv.style_copy(style, styles["theme"].style.btn.rel)
+            style.body.main_color = lv.color_hex(color)
+            style.body.grad_color = lv.color_hex(color)
+            btn.set_style(lv.btn.STYLE.REL, style)
+        else:
+            btn.set_style(lv.btn.STYLE.REL, styles["theme"].style.btn.rel)
+        lbl.set_text(text)
+        btn.set_y(y)
+        return y + 85
@@ -58,10 +58,17 @@ class Screen(lv.obj):
 
     def show_loader(self,
                     text="Please wait until the process is complete.",
-                    title="Processing..."):
+                    title="Processing...", progress=None, on_cancel=None):
+        """
+        progress is a float from 0 to 1 shown as a progress bar,
+        on_cancel adds a Cancel button to the loader until it is hidden
+        """
         if self.mbox is None:
             self.mbox = Modal(self)
         self.mbox.set_text("\n\n"+title+"\n\n"+text+"\n\n")
+        self.mbox.set_progress(progress)
+        if on_cancel is not None:
+            self.mbox.set_cancel(on_cancel)
         # trigger update of the screen
         update()
         update()
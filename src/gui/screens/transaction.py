@@ -4,20 +4,24 @@ from helpers import conv_time
 from .prompt import Prompt
 from ..common import add_label, format_addr
 from ..decorators import on_release
+from ..components.pagedlist import PagedList
 
 class TransactionScreen(Prompt):
     def __init__(self, title, meta):
         self.default_asset = meta.get("default_asset", "BTC")
+        self.tx_version = meta["tx_version"]
+        inputs = self.inputs = meta.inputs
+        outputs = self.outputs = meta.outputs
         send_amount = sum(
-            [out["value"] for out in meta["outputs"] if not out["change"]]
+            [outputs.value(i) for i in range(len(outputs)) if not outputs.change(i)]
         )
         super().__init__(title, "")
 
         obj = self.message # for alignments
 
-        enable_inputs = len([k for k in meta["inputs"] if k.get("sighash", "")]) > 0
+        enable_inputs = any([inputs.get(i, "sighash", "") for i in range(len(inputs))])
         # if there is at least one unknown value (liquid)
-        enable_inputs = enable_inputs or (-1 in [out["value"] for out in meta["outputs"]])
+        enable_inputs = enable_inputs or (-1 in outputs.values)
         enable_inputs = enable_inputs or meta.get("issuance", False) or meta.get("reissuance", False)
 
         lbl = add_label("Show detailed information                      ", scr=self)
@@ -61,17 +65,22 @@ class TransactionScreen(Prompt):
         style_gray.text.font = lv.font_roboto_22
 
         self.style = style
+        self.style_primary = style_primary
         self.style_secondary = style_secondary
         self.style_warning = style_warning
         self.style_gray = style_gray
 
-        num_change_outputs = 0
-        for out in meta["outputs"]:
-            # first only show destination addresses
-            if out["change"] and not out.get("warning", ""):
-                num_change_outputs += 1
-                continue
-            obj = self.show_output(out, obj)
+        # first only show destination addresses
+        self.destinations = [
+            i for i in range(len(outputs))
+            if not outputs.change(i) or outputs.get(i, "warning", "")
+        ]
+        # widgets are created only for one page of outputs, inputs etc
+        self.summary_list = PagedList(self.page, len(self.destinations),
+                                      self.create_summary_row, self.fill_summary_row,
+                                      on_update=self.layout_summary)
+        # widgets below the list: (widget, x or None if centered, offset)
+        self.summary_tail = []
 
         fee = meta.get("fee")
         if fee:
@@ -83,151 +92,66 @@ class TransactionScreen(Prompt):
                 fee_txt = "%d satoshi" % (fee,)
             fee = add_label("Fee: " + fee_txt, scr=self.page)
             fee.set_style(0, style)
-            fee.align(obj, lv.ALIGN.OUT_BOTTOM_MID, 0, 30)
-
-            obj = fee
+            self.summary_tail.append((fee, None, 30))
 
         if "warnings" in meta and len(meta["warnings"]) > 0:
             text = "WARNING!\n" + "\n".join(meta["warnings"])
             self.warning = add_label(text, scr=self.page)
             self.warning.set_style(0, style_warning)
-            self.warning.align(obj, lv.ALIGN.OUT_BOTTOM_MID, 0, 30)
+            self.summary_tail.append((self.warning, None, 30))
 
-        meta_inputs_len = len(meta["inputs"])
-        lbl = add_label("%d %s" % (meta_inputs_len, "INPUT" if meta_inputs_len == 1 else "INPUTS"), scr=self.page2)
-        lbl.align(self.page2, lv.ALIGN.IN_TOP_MID, 0, 30)
-        obj = lbl
-        for i, inp in enumerate(meta["inputs"]):
-            idxlbl = lv.label(self.page2)
-            idxlbl.set_text("%d:" % i)
-            idxlbl.align(lbl, lv.ALIGN.OUT_BOTTOM_MID, 0, 30)
-            idxlbl.set_x(30)
-            lbl = lv.label(self.page2)
-            lbl.set_long_mode(lv.label.LONG.BREAK)
-            lbl.set_width(380)
-            valuetxt = "???" if inp["value"] == -1 else "%.8f" % (inp["value"]/1e8)
-            lbl.set_text("%s %s from %s" % (valuetxt, inp.get("asset", self.default_asset), inp.get("label", "Unknown wallet")))
-            lbl.align(idxlbl, lv.ALIGN.IN_TOP_LEFT, 0, 0)
-            lbl.set_x(60)
-
-            # https://learnmeabitcoin.com/technical/transaction/input/sequence
-            sequence = inp.get("sequence")
-            if sequence is not None:
-                seqlbl = lv.label(self.page2)
-                is_relative_locktime = False
-                if sequence == 0xFFFFFFFF:
-                    seq_text = "Locktime disabled"
-                elif sequence == 0xFFFFFFFE:
-                    seq_text = 'RBF "disabled"'
-                elif sequence == 0xFFFFFFFD:
-                    seq_text = "RBF enabled"
-                elif meta["tx_version"] >= 2 and sequence <= 0xEFFFFFFF and (sequence | 0x0040FFFF == 0x0040FFFF):
-                    seq_text = "Relative Locktime"
-                    is_relative_locktime = True
-                else:
-                    seq_text = "Non-standard"
-                seqlbl.set_text("Seq: 0x%08X (%s)" % (sequence, seq_text))
-                seqlbl.set_style(0, style_gray)
-                seqlbl.align(lbl, lv.ALIGN.OUT_BOTTOM_LEFT, 0, 5)
-                seqlbl.set_x(60)
-                lbl = seqlbl
-                if is_relative_locktime:
-                    rltlbl = lv.label(self.page2)
-                    rltlbl.set_style(0, style_gray)
-                    rltlbl.set_text(self.relative_locktime_to_text(sequence))
-                    rltlbl.align(lbl, lv.ALIGN.OUT_BOTTOM_LEFT, 15, 5)
-                    lbl = rltlbl
-            if inp.get("sighash", ""):
-                shlbl = lv.label(self.page2)
-                shlbl.set_long_mode(lv.label.LONG.BREAK)
-                shlbl.set_width(380)
-                shlbl.set_text(inp.get("sighash", ""))
-                shlbl.align(lbl, lv.ALIGN.OUT_BOTTOM_LEFT, 0, 5)
-                shlbl.set_x(60)
-                shlbl.set_style(0, style_warning)
-                lbl = shlbl
-            obj = lbl
-
-        meta_outputs_len = len(meta["outputs"])
-        lbl = add_label("%d %s" % (len(meta["outputs"]), "OUTPUT" if meta_outputs_len == 1 else "OUTPUTS"), scr=self.page2)
-        lbl.align(self.page2, lv.ALIGN.IN_TOP_MID, 0, 0)
-        lbl.set_y(obj.get_y() + obj.get_height() + 30)
-        for i, out in enumerate(meta["outputs"]):
-            idxlbl = lv.label(self.page2)
-            idxlbl.set_text("%d:" % i)
-            idxlbl.align(lbl, lv.ALIGN.OUT_BOTTOM_MID, 0, 30)
-            idxlbl.set_x(30)
-            lbl = lv.label(self.page2)
-            lbl.set_long_mode(lv.label.LONG.BREAK)
-            lbl.set_width(380)
-            valuetxt = "???" if out["value"] == -1 else "%.8f" % (out["value"]/1e8)
-            lbl.set_text("%s %s to %s" % (valuetxt, out.get("asset", self.default_asset), out.get("label", "")))
-            lbl.align(idxlbl, lv.ALIGN.IN_TOP_LEFT, 0, 0)
-            lbl.set_x(60)
-
-            addrlbl = lv.label(self.page2)
-            addrlbl.set_long_mode(lv.label.LONG.BREAK)
-            addrlbl.set_width(380)
-            addrlbl.set_text(format_addr(out["address"], words=4))
-            addrlbl.align(lbl, lv.ALIGN.OUT_BOTTOM_LEFT, 0, 5)
-            addrlbl.set_x(60)
-            if out.get("label", ""):
-                addrlbl.set_style(0, style_secondary)
-            else:
-                addrlbl.set_style(0, style_primary)
-            lbl = addrlbl
-            if "warning" in out:
-                text = out["warning"]
-                warning = add_label(text, scr=self.page2)
-                warning.set_align(lv.label.ALIGN.LEFT)
-                warning.set_width(380)
-                warning.set_style(0, self.style_warning)
-                warning.align(addrlbl, lv.ALIGN.OUT_BOTTOM_LEFT, 0, 10)
-                warning.set_x(60)
-                lbl = warning
+        meta_inputs_len = len(inputs)
+        self.inputs_lbl = add_label("%d %s" % (meta_inputs_len, "INPUT" if meta_inputs_len == 1 else "INPUTS"), scr=self.page2)
+        self.inputs_list = PagedList(self.page2, meta_inputs_len,
+                                     self.create_input_row, self.fill_input_row,
+                                     on_update=self.layout_details)
+
+        meta_outputs_len = len(outputs)
+        self.outputs_lbl = add_label("%d %s" % (meta_outputs_len, "OUTPUT" if meta_outputs_len == 1 else "OUTPUTS"), scr=self.page2)
+        self.outputs_list = PagedList(self.page2, meta_outputs_len,
+                                      self.create_output_row, self.fill_output_row,
+                                      on_update=self.layout_details)
+        self.details_tail = []
 
         if fee:
             idxlbl = lv.label(self.page2)
             idxlbl.set_text("Fee:  " + fee_txt)
-            idxlbl.align(lbl, lv.ALIGN.OUT_BOTTOM_MID, 0, 30)
-            idxlbl.set_x(30)
-            lbl = idxlbl
+            self.details_tail.append((idxlbl, 30, 30))
 
         verlbl = lv.label(self.page2)
         verlbl.set_style(0, style_gray)
         verlbl.set_text("Transaction Version: %d" % meta["tx_version"])
         # If the fee label is present, we want to be close to it. Otherwise, we want a larger margin.
-        verlbl.align(lbl, lv.ALIGN.OUT_BOTTOM_LEFT, 0, 5 if fee else 30)
-        verlbl.set_x(30)
+        self.details_tail.append((verlbl, 30, 5 if fee else 30))
         locktime = meta["locktime"]
-        if all(inp["sequence"] == 0xFFFFFFFF for inp in meta["inputs"]):
+        if all(sequence == 0xFFFFFFFF for sequence in inputs.sequences):
             # Locktime disabled. See: https://learnmeabitcoin.com/technical/transaction/input/sequence
             ltlbl = lv.label(self.page2)
             ltlbl.set_style(0, style_gray)
             ltlbl.set_text("Locktime: %d" % locktime)
-            ltlbl.align(verlbl, lv.ALIGN.OUT_BOTTOM_LEFT, 0, 5)
             ltdiabledlbl = lv.label(self.page2)
             ltdiabledlbl.set_style(0, style_warning)
-            ltdiabledlbl.set_text("All inputs have locktime disabled!" if meta["inputs"] else "No inputs!")
-            ltdiabledlbl.align(ltlbl, lv.ALIGN.OUT_BOTTOM_LEFT, 15, 5)
+            ltdiabledlbl.set_text("All inputs have locktime disabled!" if len(inputs) else "No inputs!")
+            self.details_tail += [(ltlbl, 30, 5), (ltdiabledlbl, 45, 5)]
         elif locktime <= 499999999:
             # Block height. See: https://learnmeabitcoin.com/technical/transaction/locktime
             ltlbl = lv.label(self.page2)
             ltlbl.set_style(0, style_gray)
             ltlbl.set_text("Locktime: %d (Block Height)" % locktime)
-            ltlbl.align(verlbl, lv.ALIGN.OUT_BOTTOM_LEFT, 0, 5)
+            self.details_tail.append((ltlbl, 30, 5))
         else:
             # Block timestamp. See: https://learnmeabitcoin.com/technical/transaction/locktime
             ltlbl = lv.label(self.page2)
             ltlbl.set_style(0, style_gray)
             ltlbl.set_text("Locktime: %d (Timestamp)" % locktime)
-            ltlbl.align(verlbl, lv.ALIGN.OUT_BOTTOM_LEFT, 0, 5)
             mp_time = conv_time(locktime)
             ltdatelbl = lv.label(self.page2)
             ltdatelbl.set_style(0, style_gray)
             ltdatelbl.set_text("%04d-%02d-%02d %02d:%02d:%02d UTC" % mp_time[:6])
-            ltdatelbl.align(ltlbl, lv.ALIGN.OUT_BOTTOM_LEFT, 15, 5)
+            self.details_tail += [(ltlbl, 30, 5), (ltdatelbl, 45, 5)]
 
+        self.layout_summary()
+        self.layout_details()
         self.toggle_details()
 
     def toggle_details(self):
@@ -238,36 +162,188 @@ class TransactionScreen(Prompt):
             self.page2.set_hidden(True)
             self.page.set_hidden(False)
 
-    def show_output(self, out, obj):
-        # show output
-        valuetxt = "???" if out["value"] == -1 else "%.8f" % (out["value"]/1e8)
-        lbl = add_label(
-            "%s %s to" % (valuetxt, out.get("asset", self.default_asset)), style="title", scr=self.page
+    def layout_tail(self, tail, y):
+        for obj, x, dy in tail:
+            y += dy
+            obj.set_y(y)
+            if x is not None:
+                obj.set_x(x)
+            y += obj.get_height()
+        return y
+
+    def layout_summary(self):
+        y = self.message.get_y() + self.message.get_height()
+        y = self.summary_list.update(y)
+        self.layout_tail(self.summary_tail, y)
+
+    def layout_details(self):
+        y = 30
+        self.inputs_lbl.set_y(y)
+        y = self.inputs_list.update(y + self.inputs_lbl.get_height())
+        y += 30
+        self.outputs_lbl.set_y(y)
+        y = self.outputs_list.update(y + self.outputs_lbl.get_height())
+        self.layout_tail(self.details_tail, y)
+
+    def create_summary_row(self, parent):
+        warning = add_label("", scr=parent)
+        warning.set_style(0, self.style_warning)
+        return (
+            add_label("", style="title", scr=parent),
+            add_label("", style="title", scr=parent),
+            add_label("", scr=parent),
+            warning,
         )
-        lbl.align(obj, lv.ALIGN.OUT_BOTTOM_MID, 0, 30)
-        obj = lbl
-        if out.get("label", ""):
-            lbl = add_label(out["label"], style="title", scr=self.page)
-            lbl.align(obj, lv.ALIGN.OUT_BOTTOM_MID, 0, 10)
-            obj = lbl
-        if out.get("label", ""):
-            txt = format_addr(out["address"], words=4)
+
+    def fill_summary_row(self, row, k, y):
+        return self.show_output(self.destinations[k], row, y)
+
+    def show_output(self, i, row, y):
+        # show output
+        outputs = self.outputs
+        value = outputs.value(i)
+        label = outputs.label(i)
+        valuelbl, lbl, addr, warning = row
+        valuetxt = "???" if value == -1 else "%.8f" % (value/1e8)
+        valuelbl.set_text("%s %s to" % (valuetxt, outputs.asset(i)))
+        y += 30
+        valuelbl.set_y(y)
+        y += valuelbl.get_height()
+        lbl.set_hidden(not label)
+        if label:
+            lbl.set_text(label)
+            y += 10
+            lbl.set_y(y)
+            y += lbl.get_height()
+        if label:
+            txt = format_addr(outputs.address(i), words=4)
         else:
-            txt = format_addr(out["address"])
-        addr = add_label(txt, scr=self.page)
-        if out.get("label", ""):
+            txt = format_addr(outputs.address(i))
+        addr.set_text(txt)
+        if label:
             addr.set_style(0, self.style_secondary)
         else:
             addr.set_style(0, self.style)
-        addr.align(obj, lv.ALIGN.OUT_BOTTOM_MID, 0, 10)
-        obj = addr
-        if "warning" in out:
-            text = "WARNING! %s" % out["warning"]
-            warning = add_label(text, scr=self.page)
-            warning.set_style(0, self.style_warning)
-            warning.align(obj, lv.ALIGN.OUT_BOTTOM_MID, 0, 10)
-            obj = warning
-        return obj
+        y += 10
+        addr.set_y(y)
+        y += addr.get_height()
+        text = outputs.get(i, "warning")
+        warning.set_hidden(text is None)
+        if text is not None:
+            warning.set_text("WARNING! %s" % text)
+            y += 10
+            warning.set_y(y)
+            y += warning.get_height()
+        valuelbl.set_hidden(False)
+        addr.set_hidden(False)
+        return y
+
+    def create_input_row(self, parent):
+        idxlbl = lv.label(parent)
+        lbl = lv.label(parent)
+        lbl.set_long_mode(lv.label.LONG.BREAK)
+        lbl.set_width(380)
+        seqlbl = lv.label(parent)
+        seqlbl.set_style(0, self.style_gray)
+        rltlbl = lv.label(parent)
+        rltlbl.set_style(0, self.style_gray)
+        shlbl = lv.label(parent)
+        shlbl.set_long_mode(lv.label.LONG.BREAK)
+        shlbl.set_width(380)
+        shlbl.set_style(0, self.style_warning)
+        return idxlbl, lbl, seqlbl, rltlbl, shlbl
+
+    def fill_input_row(self, row, i, y):
+        inputs = self.inputs
+        idxlbl, lbl, seqlbl, rltlbl, shlbl = row
+        y += 30
+        idxlbl.set_text("%d:" % i)
+        idxlbl.set_pos(30, y)
+        value = inputs.value(i)
+        valuetxt = "???" if value == -1 else "%.8f" % (value/1e8)
+        lbl.set_text("%s %s from %s" % (valuetxt, inputs.asset(i), inputs.label(i) or "Unknown wallet"))
+        lbl.set_pos(60, y)
+        y += lbl.get_height()
+
+        # https://learnmeabitcoin.com/technical/transaction/input/sequence
+        sequence = inputs.sequence(i)
+        is_relative_locktime = False
+        if sequence == 0xFFFFFFFF:
+            seq_text = "Locktime disabled"
+        elif sequence == 0xFFFFFFFE:
+            seq_text = 'RBF "disabled"'
+        elif sequence == 0xFFFFFFFD:
+            seq_text = "RBF enabled"
+        elif self.tx_version >= 2 and sequence <= 0xEFFFFFFF and (sequence | 0x0040FFFF == 0x0040FFFF):
+            seq_text = "Relative Locktime"
+            is_relative_locktime = True
+        else:
+            seq_text = "Non-standard"
+        seqlbl.set_text("Seq: 0x%08X (%s)" % (sequence, seq_text))
+        y += 5
+        seqlbl.set_pos(60, y)
+        y += seqlbl.get_height()
+        rltlbl.set_hidden(not is_relative_locktime)
+        if is_relative_locktime:
+            rltlbl.set_text(self.relative_locktime_to_text(sequence))
+            y += 5
+            rltlbl.set_pos(75, y)
+            y += rltlbl.get_height()
+        sighash = self.inputs.get(i, "sighash", "")
+        shlbl.set_hidden(not sighash)
+        if sighash:
+            shlbl.set_text(sighash)
+            y += 5
+            shlbl.set_pos(60, y)
+            y += shlbl.get_height()
+        for obj in (idxlbl, lbl, seqlbl):
+            obj.set_hidden(False)
+        return y
+
+    def create_output_row(self, parent):
+        idxlbl = lv.label(parent)
+        lbl = lv.label(parent)
+        lbl.set_long_mode(lv.label.LONG.BREAK)
+        lbl.set_width(380)
+        addrlbl = lv.label(parent)
+        addrlbl.set_long_mode(lv.label.LONG.BREAK)
+        addrlbl.set_width(380)
+        warning = add_label("", scr=parent)
+        warning.set_align(lv.label.ALIGN.LEFT)
+        warning.set_width(380)
+        warning.set_style(0, self.style_warning)
+        return idxlbl, lbl, addrlbl, warning
+
+    def fill_output_row(self, row, i, y):
+        outputs = self.outputs
+        idxlbl, lbl, addrlbl, warning = row
+        y += 30
+        idxlbl.set_text("%d:" % i)
+        idxlbl.set_pos(30, y)
+        value = outputs.value(i)
+        valuetxt = "???" if value == -1 else "%.8f" % (value/1e8)
+        lbl.set_text("%s %s to %s" % (valuetxt, outputs.asset(i), outputs.label(i)))
+        lbl.set_pos(60, y)
+        y += lbl.get_height()
+
+        addrlbl.set_text(format_addr(outputs.address(i), words=4))
+        if outputs.label(i):
+            addrlbl.set_style(0, self.style_secondary)
+        else:
+            addrlbl.set_style(0, self.style_primary)
+        y += 5
+        addrlbl.set_pos(60, y)
+        y += addrlbl.get_height()
+        text = outputs.get(i, "warning")
+        warning.set_hidden(text is None)
+        if text is not None:
+            warning.set_text(text)
+            y += 10
+            warning.set_pos(60, y)
+            y += warning.get_height()
+        for obj in (idxlbl, lbl, addrlbl):
+            obj.set_hidden(False)
+        return y
 
     def relative_locktime_to_text(self, sequence):
         if sequence & 0x00400000:
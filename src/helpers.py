@@ -8,10 +8,20 @@ import platform
 from binascii import b2a_base64, a2b_base64
 from embit.liquid.networks import NETWORKS
 import utime
+import asyncio
 
 AES_BLOCK = 16
 IV_SIZE = 16
 AES_CBC = 2
+# streaming aead format
+AEAD_STREAM_MAGIC = b"\xffaead\x01"
+AEAD_CHUNK_SIZE = 1024
+AEAD_MAX_CHUNK_SIZE = 4096
+AEAD_FINAL = 1
+# number of storage keys in CryptoContext
+AEAD_KEYS_CACHE_SIZE = 8
+# max time of processing between yields to other tasks, ms
+YIELD_INTERVAL = 50
 
 def is_liquid(network):
     if isinstance(network, str):
@@ -30,10 +40,56 @@ def fix_mnemonic(phrase):
     return bip39.mnemonic_from_bytes(entropy)
 
 
+# tag: sha256(tag) || sha256(tag)
+_tag_prefixes = {}
+
+
+def tag_prefix(tag: str) -> bytes:
+    """Returns cached prefix of the tagged hash"""
+    prefix = _tag_prefixes.get(tag)
+    if prefix is None:
+        hashtag = hashlib.sha256(tag.encode()).digest()
+        prefix = hashtag + hashtag
+        _tag_prefixes[tag] = prefix
+    return prefix
+
+
 def tagged_hash(tag: str, data: bytes) -> bytes:
     """BIP-Schnorr tag-specific key derivation"""
-    hashtag = hashlib.sha256(tag.encode()).digest()
-    return hashlib.sha256(hashtag + hashtag + data).digest()
+    return hashlib.sha256(tag_prefix(tag) + data).digest()
+
+
+def aead_keys(key: bytes) -> tuple:
+    """Derives (aes_key, hmac_key) from the storage key"""
+    return tagged_hash("aes", key), tagged_hash("hmac", key)
+
+
+class CryptoContext:
+    """
+    Caches aes and hmac keys derived from storage keys,
+    so files encrypted with the same key don't derive them again.
+    Owner should clear() it when the keys are wiped.
+    """
+    def __init__(self, size=AEAD_KEYS_CACHE_SIZE):
+        self.size = size
+        self.clear()
+
+    def clear(self):
+        # storage key: (aes_key, hmac_key)
+        self.cache = {}
+
+    def __len__(self):
+        return len(self.cache)
+
+    def keys(self, key):
+        keys = self.cache.get(key)
+        if keys is None:
+            # only a few keys are used, no need for lru
+            if len(self.cache) >= self.size:
+                self.cache.clear()
+            keys = aead_keys(key)
+            self.cache[key] = keys
+        return keys
 
 
 def encrypt(plain: bytes, key: bytes) -> bytes:
@@ -67,13 +123,13 @@ def decrypt(ct: bytes, key: bytes) -> bytes:
     return b"\x80".join(arr)
 
 
-def aead_encrypt(key: bytes, adata: bytes = b"", plaintext: bytes = b"") -> bytes:
+def aead_encrypt(key: bytes, adata: bytes = b"", plaintext: bytes = b"", keys: tuple = None) -> bytes:
     """
     Encrypts and authenticates with associated data using key k.
     output format: <compact-len:associated data><iv><ct><hmac>
+    keys - (aes_key, hmac_key) if already derived from the key
     """
-    aes_key = tagged_hash("aes", key)
-    hmac_key = tagged_hash("hmac", key)
+    aes_key, hmac_key = keys or aead_keys(key)
     data = compact.to_bytes(len(adata)) + adata
     # if there is not ct - just add hmac
     if len(plaintext) > 0:
@@ -82,7 +138,7 @@ def aead_encrypt(key: bytes, adata: bytes = b"", plaintext: bytes = b"") -> byte
     return data + mac
 
 
-def aead_decrypt(ciphertext: bytes, key: bytes) -> tuple:
+def aead_decrypt(ciphertext: bytes, key: bytes, keys: tuple = None) -> tuple:
     """
     Verifies MAC and decrypts ciphertext with associated data.
     Inverse to aead_encrypt
@@ -91,8 +147,7 @@ def aead_decrypt(ciphertext: bytes, key: bytes) -> tuple:
     mac = ciphertext[-32:]
     ct = ciphertext[:-32]
 
-    aes_key = tagged_hash("aes", key)
-    hmac_key = tagged_hash("hmac", key)
+    aes_key, hmac_key = keys or aead_keys(key)
     if mac != hmac.new(hmac_key, ct, digestmod="sha256").digest():
         raise Exception("Invalid HMAC")
     b = BytesIO(ct)
@@ -106,6 +161,164 @@ def aead_decrypt(ciphertext: bytes, key: bytes) -> tuple:
     return adata, decrypt(ct, aes_key)
 
 
+def _stream_mac(hmac_key, prev, counter, flag, ct):
+    """MAC of the chunk chained to the MAC of the previous one"""
+    h = hmac.new(hmac_key, prev, digestmod="sha256")
+    h.update(counter.to_bytes(4, "little"))
+    h.update(bytes([flag]))
+    h.update(ct)
+    return h.digest()
+
+
+class AEADWriter:
+    """
+    File-like writer of the streaming aead format:
+    <magic><compact-len:associated data><iv>
+    then chunks <flag><compact-len><ct><hmac>.
+    Every chunk is encrypted and authenticated separately,
+    hmac covers the previous hmac, chunk number and final flag,
+    so chunks can't be reordered, dropped or truncated.
+    Only one chunk is kept in memory.
+    Call close() to write the final chunk,
+    the file without it fails to decrypt.
+    """
+    def __init__(self, fout, key, adata=b"", chunk_size=AEAD_CHUNK_SIZE, closefd=False, keys=None):
+        if chunk_size % AES_BLOCK != 0 or chunk_size > AEAD_MAX_CHUNK_SIZE:
+            raise ValueError("Invalid chunk size")
+        self.fout = fout
+        self.closefd = closefd
+        self.chunk_size = chunk_size
+        self.aes_key, self.hmac_key = keys or aead_keys(key)
+        self.iv = rng.get_random_bytes(IV_SIZE)
+        header = AEAD_STREAM_MAGIC + compact.to_bytes(len(adata)) + adata + self.iv
+        fout.write(header)
+        self.mac = hmac.new(self.hmac_key, header, digestmod="sha256").digest()
+        self.counter = 0
+        self.buf = b""
+        self.closed = False
+
+    def _write_chunk(self, plain, flag):
+        ct = aes(self.aes_key, AES_CBC, self.iv).encrypt(plain)
+        # cbc continues from the last block
+        self.iv = ct[-AES_BLOCK:]
+        self.mac = _stream_mac(self.hmac_key, self.mac, self.counter, flag, ct)
+        self.counter += 1
+        self.fout.write(bytes([flag]))
+        self.fout.write(compact.to_bytes(len(ct)))
+        self.fout.write(ct)
+        self.fout.write(self.mac)
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError("Writer is closed")
+        self.buf += data
+        while len(self.buf) >= self.chunk_size:
+            self._write_chunk(self.buf[:self.chunk_size], 0)
+            self.buf = self.buf[self.chunk_size:]
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+        # last chunk is padded with 80...
+        plain = self.buf + b"\x80"
+        if len(plain) % AES_BLOCK != 0:
+            plain += b"\x00" * (AES_BLOCK - (len(plain) % AES_BLOCK))
+        self._write_chunk(plain, AEAD_FINAL)
+        self.buf = b""
+        self.closed = True
+        if self.closefd:
+            self.fout.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        # unfinished stream stays invalid if writing failed
+        if args[0] is None:
+            self.close()
+        elif self.closefd:
+            self.fout.close()
+
+
+class AEADReader:
+    """
+    File-like reader of data written by AEADWriter.
+    Chunk is verified before any of its plaintext is returned.
+    Associated data is available as reader.adata.
+    """
+    def __init__(self, fin, key, closefd=False, keys=None):
+        self.fin = fin
+        self.closefd = closefd
+        if fin.read(len(AEAD_STREAM_MAGIC)) != AEAD_STREAM_MAGIC:
+            raise Exception("Invalid stream")
+        l = compact.read_from(fin)
+        if l > AEAD_MAX_CHUNK_SIZE:
+            raise Exception("Invalid length")
+        self.adata = fin.read(l)
+        self.iv = fin.read(IV_SIZE)
+        if len(self.adata) != l or len(self.iv) != IV_SIZE:
+            raise Exception("Invalid length")
+        self.aes_key, self.hmac_key = keys or aead_keys(key)
+        header = AEAD_STREAM_MAGIC + compact.to_bytes(l) + self.adata + self.iv
+        self.mac = hmac.new(self.hmac_key, header, digestmod="sha256").digest()
+        self.counter = 0
+        self.buf = b""
+        self.pos = 0
+        self.final = False
+
+    def _read_chunk(self):
+        flag = self.fin.read(1)
+        if len(flag) == 0:
+            raise Exception("Truncated stream")
+        flag = flag[0]
+        l = compact.read_from(self.fin)
+        if flag > AEAD_FINAL or l == 0 or l % AES_BLOCK != 0 or l > AEAD_MAX_CHUNK_SIZE:
+            raise Exception("Invalid chunk")
+        ct = self.fin.read(l)
+        mac = self.fin.read(32)
+        if len(ct) != l or mac != _stream_mac(self.hmac_key, self.mac, self.counter, flag, ct):
+            raise Exception("Invalid HMAC")
+        plain = aes(self.aes_key, AES_CBC, self.iv).decrypt(ct)
+        self.iv = ct[-AES_BLOCK:]
+        self.mac = mac
+        self.counter += 1
+        if flag == AEAD_FINAL:
+            if len(self.fin.read(1)) != 0:
+                raise Exception("Data after the final chunk")
+            # remove 80... padding
+            stripped = plain.rstrip(b"\x00")
+            if len(stripped) == 0 or stripped[-1] != 0x80:
+                raise Exception("Invalid padding")
+            plain = stripped[:-1]
+            self.final = True
+        self.buf = plain
+        self.pos = 0
+
+    def read(self, n=-1):
+        res = b""
+        while n < 0 or len(res) < n:
+            if self.pos >= len(self.buf):
+                if self.final:
+                    break
+                self._read_chunk()
+                continue
+            end = len(self.buf) if n < 0 else self.pos + n - len(res)
+            res += self.buf[self.pos:end]
+            self.pos = min(end, len(self.buf))
+        return res
+
+    def close(self):
+        if self.closefd:
+            self.fin.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
 def load_apps(module="apps", whitelist=None, blacklist=None):
     mod = __import__(module)
     mods = mod.__all__
@@ -142,6 +355,101 @@ def b2a_base64_stream(sin, sout):
         l += sout.write(b2a_base64(chunk).strip())
     return l
 
+class B64Writer:
+    """File-like writer encoding data to base64 on the fly"""
+    def __init__(self, fout):
+        self.fout = fout
+        self.buf = b""
+
+    def write(self, data):
+        self.buf += data
+        # encode full 3-byte groups, 48 bytes at least
+        l = len(self.buf) - len(self.buf) % 48
+        if l > 0:
+            self.fout.write(b2a_base64(self.buf[:l]).strip())
+            self.buf = self.buf[l:]
+        return len(data)
+
+    def close(self):
+        """Writes the rest with padding"""
+        if len(self.buf) > 0:
+            self.fout.write(b2a_base64(self.buf).strip())
+        self.buf = b""
+
+class LoaderProgress:
+    """
+    Progress of a long loop shown on the loader.
+    Every redraw of the loader relayouts the screen,
+    so it is redrawn at most once per INTERVAL ms
+    with a progress bar and a counter, the title stays the same.
+    """
+    # minimal time between redraws, ms
+    INTERVAL = 300
+
+    def __init__(self, show_loader, title, total):
+        self.show_loader = show_loader
+        self.title = title
+        self.total = total
+        self.last = None
+
+    def update(self, done, title=None):
+        """Shows that `done` items are processed, redraws if the title is changed"""
+        if title is not None and title != self.title:
+            self.title = title
+            self.last = None
+        if self.last is not None and utime.ticks_diff(utime.ticks_ms(), self.last) < self.INTERVAL:
+            return
+        self.show_loader(
+            title=self.title,
+            text="%d of %d" % (done, self.total),
+            progress=(done / self.total if self.total else 1),
+        )
+        self.last = utime.ticks_ms()
+
+class Cancelled(Exception):
+    pass
+
+class CancelToken:
+    """Cancels long operation running with cooperate(), i.e. from the Cancel button"""
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+def run_steps(steps):
+    """Runs generator to the end and returns its return value"""
+    try:
+        while True:
+            next(steps)
+    except StopIteration as e:
+        return e.value
+
+async def cooperate(steps, token=None, progress=None, interval=YIELD_INTERVAL, items=None):
+    """
+    Runs generator of a long synchronous loop and returns its return value.
+    Yields to other tasks (GUI, hosts) every `interval` ms or every `items` steps,
+    updates progress with yielded values if they are not None.
+    Raises Cancelled if the token is cancelled, the generator is closed then.
+    """
+    t0 = utime.ticks_ms()
+    n = 0
+    while True:
+        try:
+            done = next(steps)
+        except StopIteration as e:
+            return e.value
+        if progress is not None and done is not None:
+            progress.update(done)
+        n += 1
+        if (items is not None and n >= items) or utime.ticks_diff(utime.ticks_ms(), t0) >= interval:
+            await asyncio.sleep_ms(0)
+            t0 = utime.ticks_ms()
+            n = 0
+        if token is not None and token.cancelled:
+            steps.close()
+            raise Cancelled()
+
 def read_until(s, chars=b"\n\r", max_len=100, return_on_max_len=False):
     """Reads from stream until one of the chars"""
     res = b""
@@ -1,6 +1,7 @@
 import asyncio
 from platform import maybe_mkdir
 from errors import BaseError
+from tracer import boot_span
 import json
 from gui.screens.settings import HostSettings
 from gui.screens import Alert
@@ -80,7 +81,8 @@ class Host:
     def save_settings(self, keystore):
         keystore.save_aead(self.settings_fname,
                            adata=json.dumps(self.settings).encode(),
-                           key=keystore.settings_key
+                           key=keystore.settings_key,
+                           commit=False
         )
 
     async def settings_menu(self, show_screen, keystore):
@@ -133,7 +135,8 @@ class Host:
         Maybe you want to remove all pending data first?
         """
         if not self.initialized:
-            self.init()
+            with boot_span("%s.init" % type(self).__name__):
+                self.init()
             await asyncio.sleep_ms(self.RECOVERY_TIME)
             self.initialized = True
         self.enabled = True
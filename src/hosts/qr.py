@@ -10,6 +10,8 @@ from gui.decorators import on_release
 from gui.screens.settings import HostSettings
 from gui.screens import Alert
 from helpers import read_until, read_write, a2b_base64_stream
+from tracer import span, trace, boot_span
+from memstats import memstats
 from microur.decoder import FileURDecoder
 from microur.util import cbor
 
@@ -519,10 +521,12 @@ class QRHost(Host):
             return
         
         # Identify scanner and baudrate
-        self._update_scanner_model()
+        with boot_span("QRHost.probe"):
+            self._update_scanner_model()
 
         if self._boot_reset_pending:
-            success = self._factory_reset_scanner_on_boot()
+            with boot_span("QRHost.factory_reset"):
+                success = self._factory_reset_scanner_on_boot()
             self._boot_reset_pending = False
             if success:
                 return
@@ -531,7 +535,8 @@ class QRHost(Host):
         
         # if failed to configure - probably a different scanner
         # in this case fallback to PIN trigger mode FIXME
-        self.is_configured = self.configure()
+        with boot_span("QRHost.configure"):
+            self.is_configured = self.configure()
         if self.is_configured:
             return
 
@@ -845,13 +850,14 @@ class QRHost(Host):
                     
                 # if not animated -> stop and return
                 if not self.check_animated(d):
-                    if d[-len(self.EOL):] == self.EOL:
-                        d = d[:-len(self.EOL)]
-                    self._stop_scanner()
-                    fname = self.path + "/data.txt"
-                    with open(fname, "wb") as fout:
-                        fout.write(d)
-                    self.stop_scanning()
+                    with span("QRHost.update"):
+                        if d[-len(self.EOL):] == self.EOL:
+                            d = d[:-len(self.EOL)]
+                        self._stop_scanner()
+                        fname = self.path + "/data.txt"
+                        with open(fname, "wb") as fout:
+                            fout.write(d)
+                        self.stop_scanning()
                     return
             else:
                 # if animated - we process chunks one at a time
@@ -863,20 +869,23 @@ class QRHost(Host):
                 return
             # restart scan while processing data
             await self._restart_scanner()
-            # slice to write
-            d = d[:-len(self.EOL)]
-            with open(self.tmpfile, "ab") as f:
-                f.write(d)
-            try:
-                if self.process_chunk():
+            # waiting for the data and the scanner is not included in the span
+            with span("QRHost.update"):
+                # slice to write
+                d = d[:-len(self.EOL)]
+                with open(self.tmpfile, "ab") as f:
+                    f.write(d)
+                try:
+                    if self.process_chunk():
+                        self.stop_scanning()
+                except Exception as e:
                     self.stop_scanning()
-            except Exception as e:
-                self.stop_scanning()
-                raise e
-            # erase the content of the file
-            with open(self.tmpfile, "wb") as f:
-                pass
+                    raise e
+                # erase the content of the file
+                with open(self.tmpfile, "wb") as f:
+                    pass
 
+    @trace("QRHost.process_chunk")
     def process_chunk(self):
         """Returns true when scanning complete"""
         # should not be there if trigger mode or simulator
@@ -1066,6 +1075,8 @@ class QRHost(Host):
             )
         stream = await self.scan(raw=raw, chunk_timeout=chunk_timeout)
         if stream is not None:
+            memstats.start("qr")
+            memstats.sample("receive")
             return stream
 
     async def send_data(self, stream, meta, *args, **kwargs):
@@ -4,6 +4,8 @@ import sys
 import pyb
 import asyncio
 import platform
+from tracer import span
+from memstats import memstats
 
 
 class USBHost(Host):
@@ -111,42 +113,43 @@ class USBHost(Host):
         # if we didn't get anything - return
         if res is None or len(res) == 0:
             return
-        # check if we already have something
-        # if not - create new file on the ramdisk
-        if self.f is None:
-            self.f = open(self.path + "/data", "wb")
-        # check if we don't have EOL in the data
-        if b"\n" not in res and b"\r" not in res:
-            self.f.write(res)
-            return
-        # if we do - there is a command
-        # both \r, \n or \r\n should work:
-        for eol in [b"\r\n", b"\r", b"\n"]:
-            # check if we have two EOL at once
-            # this means the host wants to start over
-            # like \n\n or \r\n\r\n or \r\r
-            if eol * 2 in res:
-                arr = res.split(eol * 2)
-                # cleanup and start over
-                self.cleanup()
+        with span("USBHost.read_to_file"):
+            # check if we already have something
+            # if not - create new file on the ramdisk
+            if self.f is None:
                 self.f = open(self.path + "/data", "wb")
-                # this is the part we care about
-                res = arr[-1]
-                # if command is not complete yet
-                # we write and return
-                if eol not in res:
-                    self.f.write(res)
-                    return
-            if eol in res:
-                arr = res.split(eol)
-                break
-        # only one command at a time is allowed,
-        # throw everything else away
-        self.f.write(arr[0])
-        # close file
-        self.f.close()
-        self.f = None
-        return self.path + "/data"
+            # check if we don't have EOL in the data
+            if b"\n" not in res and b"\r" not in res:
+                self.f.write(res)
+                return
+            # if we do - there is a command
+            # both \r, \n or \r\n should work:
+            for eol in [b"\r\n", b"\r", b"\n"]:
+                # check if we have two EOL at once
+                # this means the host wants to start over
+                # like \n\n or \r\n\r\n or \r\r
+                if eol * 2 in res:
+                    arr = res.split(eol * 2)
+                    # cleanup and start over
+                    self.cleanup()
+                    self.f = open(self.path + "/data", "wb")
+                    # this is the part we care about
+                    res = arr[-1]
+                    # if command is not complete yet
+                    # we write and return
+                    if eol not in res:
+                        self.f.write(res)
+                        return
+                if eol in res:
+                    arr = res.split(eol)
+                    break
+            # only one command at a time is allowed,
+            # throw everything else away
+            self.f.write(arr[0])
+            # close file
+            self.f.close()
+            self.f = None
+            return self.path + "/data"
 
     async def update(self):
         if self.manager is None:
@@ -158,6 +161,8 @@ class USBHost(Host):
         res = self.read_to_file()
         # if we got a filename - line is ready
         if res is not None:
+            memstats.start("usb")
+            memstats.sample("receive")
             # first send the host that we are processing data
             self.usb.write(self.ACK)
             # open again for reading and try to process content
@@ -151,6 +151,7 @@ class FlashKeyStore(RAMKeyStore):
 
     def lock(self):
         """Locks the keystore, requires PIN to unlock"""
+        super().lock()
         self._is_locked = True
         return self.is_locked
 
@@ -167,9 +168,14 @@ class FlashKeyStore(RAMKeyStore):
             "pin_attempts_left": self._pin_attempts_left,
         }
         data = json.dumps(obj).encode()
-        self.save_aead(self.path + "/pin", plaintext=data, key=self.secret)
-        # check it loads
-        self.load_state()
+        fname = self.path + "/pin"
+        # PIN counters are written immediately
+        d = self.save_aead(fname, plaintext=data, key=self.secret)
+        # check it was written correctly,
+        # full reload only if the file is different
+        with open(fname, "rb") as f:
+            if f.read() != d:
+                self.load_state()
 
     def _set_pin(self, pin):
         """Saves hmac of the PIN code for verification later"""
@@ -6,6 +6,7 @@ from platform import CriticalErrorWipeImmediately
 import platform
 from embit import bip39
 from helpers import tagged_hash, aead_encrypt, aead_decrypt
+from tracer import boot_wait
 import hmac
 from gui.screens import Alert, Progress, Menu, Prompt
 import asyncio
@@ -204,6 +205,7 @@ In this mode device can only operate when the smartcard is inserted!"""
 
     def lock(self):
         """Locks the keystore, requires PIN to unlock"""
+        super().lock()
         self.applet.lock()
         return self.is_locked
 
@@ -306,7 +308,8 @@ In this mode device can only operate when the smartcard is inserted!"""
                 button_text=None,
             )  # no button
             asyncio.create_task(self.wait_for_card(scr))
-            await self.show(scr)
+            with boot_wait():
+                await self.show(scr)
         try:
             self.applet.ping()
         except Exception as e:
@@ -6,12 +6,70 @@ import hmac
 from embit import ec, bip39, bip32
 from embit.liquid import slip77
 from embit.transaction import SIGHASH
-from helpers import aead_encrypt, aead_decrypt, tagged_hash
+from helpers import aead_encrypt, aead_decrypt, tagged_hash, AEADReader, AEADWriter, CryptoContext
+from tracer import trace, boot_wait
+from storage import storage
+from sighash import sign_input
 import secp256k1
 from gui.screens import Alert, PinScreen, Prompt, Menu, QRAlert
 from gui.screens.mnemonic import ExportMnemonicScreen
 from binascii import hexlify
 
+# max number of HD nodes kept in the derivation cache
+DERIVATION_CACHE_SIZE = 32
+
+
+class DerivationCache:
+    """
+    Bounded cache of derived HD nodes.
+    Keys are derivation path prefixes (tuples of indexes),
+    so it works as a flattened prefix tree: derivation starts
+    from the longest cached prefix and only remaining steps are computed.
+    Least recently used nodes are evicted first.
+    """
+    def __init__(self, size=DERIVATION_CACHE_SIZE):
+        self.size = size
+        self.clear()
+
+    def clear(self):
+        # path tuple: [HDKey, last use]
+        self.nodes = {}
+        self.counter = 0
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def _put(self, path, node):
+        while self.nodes and len(self.nodes) >= self.size:
+            oldest = None
+            for k in self.nodes:
+                if oldest is None or self.nodes[k][1] < self.nodes[oldest][1]:
+                    oldest = k
+            del self.nodes[oldest]
+        self.counter += 1
+        self.nodes[path] = [node, self.counter]
+
+    def derive(self, root, path):
+        """Derives a child of the root key, path is a string or a list of indexes"""
+        if isinstance(path, str):
+            path = bip32.parse_path(path)
+        path = tuple(path)
+        node = root
+        start = len(path)
+        while start > 0:
+            v = self.nodes.get(path[:start])
+            if v is not None:
+                self.counter += 1
+                v[1] = self.counter
+                node = v[0]
+                break
+            start -= 1
+        for i in range(start, len(path)):
+            node = node.child(path[i])
+            self._put(path[:i + 1], node)
+        return node
+
+
 class RAMKeyStore(KeyStore):
     """
     KeyStore that doesn't store your keys.
@@ -29,12 +87,16 @@ class RAMKeyStore(KeyStore):
         self.root = None
         # root fingerprint
         self.fingerprint = None
+        # intermediate nodes derived from the root
+        self.derivation_cache = DerivationCache()
         # slip77 blinding key
         self.slip77_key = None
         # private key at path m/0x1D'
         # used to encrypt & authenticate data
         # specific to this root key
         self.idkey = None
+        # aes and hmac keys derived from storage keys
+        self.crypto = CryptoContext()
         # unique secret for a device
         # used to show anti-phishing words
         self.secret = None
@@ -58,6 +120,8 @@ class RAMKeyStore(KeyStore):
         else:
             self.show_loader(title="Generating keys...")
         """Load mnemonic and password and create root key"""
+        self.derivation_cache.clear()
+        self.crypto.clear()
         if mnemonic is not None:
             self.mnemonic = mnemonic.strip()
             if not bip39.mnemonic_is_valid(self.mnemonic):
@@ -74,57 +138,110 @@ class RAMKeyStore(KeyStore):
     def sign_psbt(self, psbt, sighash=SIGHASH.ALL):
         psbt.sign_with(self.root, sighash)
 
-    def sign_input(self, psbtv, i, sig_stream, sighash=SIGHASH.ALL, extra_scope_data=None):
-        return psbtv.sign_input(i, self.root, sig_stream, sighash=sighash, extra_scope_data=extra_scope_data)
+    def sign_input(self, psbtv, i, sig_stream, sighash=SIGHASH.ALL, extra_scope_data=None, sighashes=None, derivations=None):
+        """
+        Signs the input with the root key.
+        If derivations [(pub, derivation), ...] are known in advance
+        only these keys are derived (using the derivation cache) and used.
+        """
+        if derivations is None:
+            return sign_input(psbtv, i, self.root, sig_stream, sighash, extra_scope_data, sighashes)
+        count = 0
+        for pub, der in derivations:
+            prv = self.derive(der).key
+            if prv.xonly() != pub.xonly():
+                raise KeyStoreError("Derivation path doesn't look right")
+            count += sign_input(psbtv, i, prv, sig_stream, sighash, extra_scope_data, sighashes)
+        return count
+
+    def derive(self, path):
+        """Derives the key from the root using the derivation cache"""
+        return self.derivation_cache.derive(self.root, path)
 
     def sign_hash(self, derivation, msghash: bytes):
-        return self.root.derive(derivation).key.sign(msghash)
+        return self.derive(derivation).key.sign(msghash)
 
     def sign_recoverable(self, derivation, msghash: bytes):
         """Returns a signature and a recovery flag"""
-        prv = self.root.derive(derivation).key
+        prv = self.derive(derivation).key
         sig = secp256k1.ecdsa_sign_recoverable(msghash, prv._secret)
         flag = sig[64]
         return ec.Signature(sig[:64]), flag
 
-    def save_aead(self, path, adata=b"", plaintext=b"", key=None):
-        """Encrypts and saves plaintext and associated data to file"""
+    def encrypt_aead(self, adata=b"", plaintext=b"", key=None):
+        """Encrypts plaintext and authenticates it with associated data"""
+        if key is None:
+            key = self.idkey
+        if key is None:
+            raise KeyStoreError("Pass the key please")
+        return aead_encrypt(key, adata, plaintext, self.crypto.keys(key))
+
+    def decrypt_aead(self, data, key=None):
+        """Inverse to encrypt_aead, returns a tuple (associated data, plaintext)"""
         if key is None:
             key = self.idkey
         if key is None:
             raise KeyStoreError("Pass the key please")
-        d = aead_encrypt(key, adata, plaintext)
-        with open(path, "wb") as f:
-            f.write(d)
-        platform.sync()
+        return aead_decrypt(data, key, self.crypto.keys(key))
+
+    def save_aead(self, path, adata=b"", plaintext=b"", key=None, commit=True):
+        """
+        Encrypts and saves plaintext and associated data to file.
+        With commit=False the write is delayed until storage.commit()
+        """
+        d = self.encrypt_aead(adata, plaintext, key)
+        storage.write(path, d)
+        if commit:
+            storage.flush(path)
+        return d
 
     def load_aead(self, path, key=None):
         """
         Loads data saved with save_aead,
         returns a tuple (associated data, plaintext)
         """
+        data = storage.read(path)
+        return self.decrypt_aead(data, key)
+
+    def open_aead(self, path, mode="rb", adata=b"", key=None):
+        """
+        Opens a file in the streaming aead format for large data.
+        Returns AEADReader for "rb" mode and AEADWriter for "wb".
+        Streams are written directly to flash, bypassing storage.
+        """
         if key is None:
             key = self.idkey
         if key is None:
             raise KeyStoreError("Pass the key please")
-        with open(path, "rb") as f:
-            data = f.read()
-        return aead_decrypt(data, key)
+        if mode == "rb":
+            storage.flush(path)
+        else:
+            storage.discard(path)
+        f = open(path, mode)
+        try:
+            if mode == "rb":
+                return AEADReader(f, key, closefd=True, keys=self.crypto.keys(key))
+            return AEADWriter(f, key, adata, closefd=True, keys=self.crypto.keys(key))
+        except:
+            f.close()
+            raise
 
+    @trace("RAMKeyStore.get_xpub")
     def get_xpub(self, path):
         if self.is_locked or self.root is None:
             raise KeyStoreError("Keystore is not ready")
-        return self.root.derive(path).to_public()
+        return self.derive(path).to_public()
 
     def owns(self, key):
         if key.fingerprint is not None and key.fingerprint != self.fingerprint:
             return False
         if key.derivation is None:
             return key.key == self.root.to_public()
-        return key.key == self.root.derive(key.derivation).to_public()
+        return key.key == self.derive(key.derivation).to_public()
 
     def wipe(self, path):
         """Delete everything in path"""
+        storage.discard(path)
         platform.delete_recursively(path)
 
     def load_secret(self, path):
@@ -230,8 +347,9 @@ class RAMKeyStore(KeyStore):
         return True
 
     def lock(self):
-        """Locks the keystore"""
-        pass
+        """Locks the keystore, subclasses should call it to wipe cached keys"""
+        self.derivation_cache.clear()
+        self.crypto.clear()
 
     def _unlock(self, pin):
         """
@@ -283,19 +401,23 @@ class RAMKeyStore(KeyStore):
                 % (self.pin_attempts_left, self.pin_attempts_max),
                 button_text="OK",
             )
-            await self.show(scr)
+            with boot_wait():
+                await self.show(scr)
         self.initialized = True
 
     async def unlock(self):
         # pin is not set - choose one
         if not self.is_pin_set:
-            pin = await self.setup_pin()
+            # waiting for the user is not a part of the boot time
+            with boot_wait():
+                pin = await self.setup_pin()
             self.show_loader("Setting up PIN code...")
             self._set_pin(pin)
 
         # if keystore is locked - ask for PIN code
         while self.is_locked:
-            pin = await self.get_pin()
+            with boot_wait():
+                pin = await self.get_pin()
             self.show_loader("Verifying PIN code...")
             self._unlock(pin)
 
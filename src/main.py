@@ -10,6 +10,8 @@ from hosts import SDHost, QRHost, USBHost, Host
 import platform
 from helpers import load_apps
 from app import BaseApp
+from memstats import memstats
+from tracer import boot_span
 import display
 
 def main(apps=None, network="main", keystore_cls=None):
@@ -18,63 +20,70 @@ def main(apps=None, network="main", keystore_cls=None):
     network: default network to operate
     keystores: list of KeyStore classes that can be used
     """
-    # Init display first as it also inits the SDRAM
-    display.init(False)
-    # create virtual file system /sdram
-    # for temp untrusted data storage
-    rampath = platform.mount_sdram()
+    with boot_span("main.main"):
+        # Init display first as it also inits the SDRAM
+        with boot_span("display.init"):
+            display.init(False)
+        # create virtual file system /sdram
+        # for temp untrusted data storage
+        with boot_span("platform.mount_sdram"):
+            rampath = platform.mount_sdram()
+        memstats.path = rampath
 
-    # set working path to empty folder in sdram
-    if not platform.simulator:
-        cwd = rampath+"/cwd"
-        platform.maybe_mkdir(cwd)
-        os.chdir(cwd)
+        # set working path to empty folder in sdram
+        if not platform.simulator:
+            cwd = rampath+"/cwd"
+            platform.maybe_mkdir(cwd)
+            os.chdir(cwd)
 
-    # define hosts - USB, QR, SDCard
-    # each hosts gets it's own RAM folder for data
-    Host.SETTINGS_DIR = platform.fpath("/qspi/hosts")
-    Specter.SETTINGS_DIR = platform.fpath("/qspi/global")
-    hosts = [
-        USBHost(rampath + "/usb"),
-        QRHost(rampath + "/qr"),
-        SDHost(rampath+"/sd"),
-    ]
-    # temp storage in RAM for host commands processing
-    BaseApp.TEMPDIR = rampath+"/tmp"
+        # define hosts - USB, QR, SDCard
+        # each hosts gets it's own RAM folder for data
+        Host.SETTINGS_DIR = platform.fpath("/qspi/hosts")
+        Specter.SETTINGS_DIR = platform.fpath("/qspi/global")
+        with boot_span("main.hosts"):
+            hosts = [
+                USBHost(rampath + "/usb"),
+                QRHost(rampath + "/qr"),
+                SDHost(rampath+"/sd"),
+            ]
+        # temp storage in RAM for host commands processing
+        BaseApp.TEMPDIR = rampath+"/tmp"
 
-    # define GUI
-    if not platform.simulator:
-        gui = SpecterGUI()
-    else:
-        # this GUI can simulate user actions for automated testing
-        from gui.tcp_gui import TCPGUI
-        gui = TCPGUI()
+        # define GUI
+        with boot_span("main.gui"):
+            if not platform.simulator:
+                gui = SpecterGUI()
+            else:
+                # this GUI can simulate user actions for automated testing
+                from gui.tcp_gui import TCPGUI
+                gui = TCPGUI()
 
-    # inject the folder where keystore stores it's data
-    KeyStore.path = platform.fpath("/flash/keystore")
-    # detect keystore to use
-    if keystore_cls is not None:
-        keystores = [keystore_cls]
-    else:
-        keystores = [
-            MemoryCard,
-            SDKeyStore,
-        ]
+        # inject the folder where keystore stores it's data
+        KeyStore.path = platform.fpath("/flash/keystore")
+        # detect keystore to use
+        if keystore_cls is not None:
+            keystores = [keystore_cls]
+        else:
+            keystores = [
+                MemoryCard,
+                SDKeyStore,
+            ]
 
-    # loading apps
-    if apps is None:
-        apps = load_apps()
+        # loading apps
+        if apps is None:
+            with boot_span("load_apps"):
+                apps = load_apps()
 
-    # make Specter instance
-    settings_path = platform.fpath("/flash")
-    specter = Specter(
-        gui=gui,
-        keystores=keystores,
-        hosts=hosts,
-        apps=apps,
-        settings_path=settings_path,
-        network=network,
-    )
+        # make Specter instance
+        settings_path = platform.fpath("/flash")
+        specter = Specter(
+            gui=gui,
+            keystores=keystores,
+            hosts=hosts,
+            apps=apps,
+            settings_path=settings_path,
+            network=network,
+        )
     specter.start()
 
 
@@ -0,0 +1,120 @@
+"""
+Memory high-water-mark accounting.
+Heap and ramdisk usage are sampled at stage boundaries
+of host request processing, last requests are kept in history.
+"""
+import gc
+import json
+import platform
+
+HISTORY_SIZE = 8
+
+if hasattr(gc, "mem_alloc"):
+    mem_alloc = gc.mem_alloc
+    mem_free = gc.mem_free
+else:
+    # CPython - heap size is not available
+    def mem_alloc():
+        return 0
+
+    def mem_free():
+        return 0
+
+
+class MemStats:
+    def __init__(self, size=HISTORY_SIZE):
+        self.size = size
+        # folder to measure, normally the ramdisk
+        self.path = None
+        # collect garbage before sampling to get live heap size,
+        # slower but deterministic
+        self.collect = False
+        self.clear()
+
+    def clear(self):
+        self.history = []
+        self.current = None
+        self.depth = 0
+
+    def start(self, name):
+        """Starts a new request record"""
+        if self.collect:
+            gc.collect()
+        self.current = {
+            "name": name,
+            "base_alloc": mem_alloc(),
+            "stages": [],
+            "peak_alloc": 0,
+            "peak_ramdisk": 0,
+        }
+
+    def enter(self, name="host"):
+        """Starts request processing, nested calls are merged"""
+        if self.current is None:
+            self.start(name)
+        self.depth += 1
+
+    def exit(self):
+        self.depth = max(self.depth - 1, 0)
+        if self.depth == 0:
+            self.sample("done")
+            return self.finish()
+
+    def sample(self, stage):
+        """Records heap and ramdisk usage at the stage boundary"""
+        if self.current is None:
+            return
+        if self.collect:
+            gc.collect()
+        alloc = mem_alloc()
+        ramdisk = 0
+        if self.path is not None:
+            try:
+                ramdisk = platform.disk_usage(self.path)
+            except OSError:
+                pass
+        self.current["stages"].append((stage, alloc, mem_free(), ramdisk))
+        if alloc > self.current["peak_alloc"]:
+            self.current["peak_alloc"] = alloc
+        if ramdisk > self.current["peak_ramdisk"]:
+            self.current["peak_ramdisk"] = ramdisk
+
+    def finish(self):
+        """Moves current record to the history and returns it"""
+        rec = self.current
+        if rec is None:
+            return
+        self.current = None
+        self.history.append(rec)
+        if len(self.history) > self.size:
+            self.history = self.history[-self.size:]
+        return rec
+
+    @property
+    def last(self):
+        return self.history[-1] if self.history else None
+
+    def dump(self, stream):
+        """Writes history to the stream as JSON"""
+        stream.write(b"[")
+        for i, rec in enumerate(self.history):
+            if i > 0:
+                stream.write(b", ")
+            obj = {
+                "name": rec["name"],
+                "base_alloc": rec["base_alloc"],
+                "peak_alloc": rec["peak_alloc"],
+                "peak_ramdisk": rec["peak_ramdisk"],
+                "stages": [{
+                    "stage": stage,
+                    "alloc": alloc,
+                    "free": free,
+                    "ramdisk": ramdisk,
+                } for stage, alloc, free, ramdisk in rec["stages"]],
+            }
+            stream.write(json.dumps(obj).encode())
+        stream.write(b"]")
+
+
+# global instance used by the firmware
+memstats = MemStats()
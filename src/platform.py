@@ -280,6 +280,25 @@ def file_exists(fname: str) -> bool:
         return False
 
 
+def disk_usage(path):
+    """Returns number of bytes used on the filesystem with this path"""
+    if not simulator:
+        st = os.statvfs(path)
+        return (st[2] - st[3]) * st[0]
+    # on simulator it's a normal folder, so we count files
+    path = path.rstrip("/")
+    used = 0
+    for _file in os.ilistdir(path):
+        if _file[0] in [".", ".."]:
+            continue
+        f = "%s/%s" % (path, _file[0])
+        if _file[1] == 0x8000:
+            used += os.stat(f)[6]
+        elif _file[1] == 0x4000:
+            used += disk_usage(f)
+    return used
+
+
 def delete_recursively(path, include_self=False):
     # remove trailing slash
     if path is None:
@@ -0,0 +1,92 @@
+"""
+Transaction-wide sighash digests shared by all inputs of the PSBT.
+Without the cache every taproot sighash re-reads all input scopes
+to get spent amounts and scripts, so signing N inputs is quadratic.
+"""
+from embit.transaction import SIGHASH
+from embit.psbtview import PSBTView, read_string
+
+
+class SighashCache:
+    """
+    Computes bip143 hashPrevouts, hashSequence, hashOutputs
+    and bip341 sha_amounts, sha_scriptpubkeys once per PSBTView.
+    Spent amounts and scripts are collected in a single pass
+    over the inputs when the first taproot input is signed.
+    """
+    def __init__(self, psbtv):
+        self.psbtv = psbtv
+        self.values = None
+        self.script_pubkeys = None
+        # digests are memoized in the view itself
+        psbtv.hash_prevouts()
+        psbtv.hash_sequence()
+        psbtv.hash_outputs()
+
+    def _load_utxos(self):
+        values = []
+        script_pubkeys = []
+        for i in range(self.psbtv.num_inputs):
+            utxo = self.psbtv.input(i).utxo
+            values.append(utxo.value)
+            script_pubkeys.append(utxo.script_pubkey)
+        self.values = values
+        self.script_pubkeys = script_pubkeys
+        self.psbtv.hash_amounts(values)
+        self.psbtv.hash_script_pubkeys(script_pubkeys)
+
+    def sighash(self, i, sighash=SIGHASH.ALL, input_scope=None, **kwargs):
+        """Same as PSBTView.sighash, but with cached spent outputs"""
+        psbtv = self.psbtv
+        inp = psbtv.input(i) if input_scope is None else input_scope
+        if not inp.is_taproot:
+            # not cached version, the view's sighash may use this cache
+            return PSBTView.sighash(psbtv, i, sighash=sighash, input_scope=inp, **kwargs)
+        if self.values is None:
+            self._load_utxos()
+        return psbtv.sighash_taproot(
+            i,
+            script_pubkeys=self.script_pubkeys,
+            values=self.values,
+            sighash=sighash,
+            **kwargs
+        )
+
+
+def _merge_sigs(psbtv, scope, sig_stream, pos):
+    """Adds signatures written to sig_stream after pos to the scope"""
+    end = sig_stream.tell()
+    sig_stream.seek(pos)
+    sigs = psbtv.PSBTIN_CLS({})
+    while sig_stream.tell() < end:
+        sigs.read_value(sig_stream, read_string(sig_stream))
+    scope.partial_sigs.update(sigs.partial_sigs)
+    scope.taproot_sigs.update(sigs.taproot_sigs)
+    scope.final_scriptwitness = sigs.final_scriptwitness or scope.final_scriptwitness
+
+
+def sign_input(psbtv, i, root, sig_stream, sighash=SIGHASH.ALL, extra_scope_data=None, sighashes=None):
+    """
+    psbtv.sign_input using the SighashCache if it is provided.
+    With the cache extra_scope_data is the already parsed input scope,
+    signatures are added to it directly.
+    Views with sighash_cache and current_scope (see IndexedPSBTView)
+    use the cache and don't parse the input again,
+    other views sign without the cache.
+    """
+    if sighashes is None:
+        return psbtv.sign_input(i, root, sig_stream, sighash=sighash, extra_scope_data=extra_scope_data)
+    if not hasattr(psbtv, "current_scope"):
+        pos = sig_stream.tell()
+        count = psbtv.sign_input(i, root, sig_stream, sighash=sighash, extra_scope_data=extra_scope_data)
+        if extra_scope_data is not None:
+            _merge_sigs(psbtv, extra_scope_data, sig_stream, pos)
+        return count
+    try:
+        psbtv.sighash_cache = sighashes
+        if extra_scope_data is not None:
+            psbtv.current_scope = (i, extra_scope_data)
+        return psbtv.sign_input(i, root, sig_stream, sighash=sighash, extra_scope_data=extra_scope_data)
+    finally:
+        psbtv.sighash_cache = None
+        psbtv.current_scope = None
@@ -16,6 +16,7 @@ from platform import (
     get_firmware_boot_mode,
     get_flash_read_protection_status,
     get_flash_write_protection_status,
+    simulator,
 )
 from hosts import Host, HostError
 from app import BaseApp
@@ -27,6 +28,9 @@ from gui.screens.mnemonic import MnemonicPrompt
 # small helper functions
 from helpers import gen_mnemonic, fix_mnemonic
 from errors import BaseError
+from tracer import trace_async, boot_span, boot_wait, boot_done
+from memstats import memstats
+from storage import storage
 
 
 class SpecterError(BaseError):
@@ -113,13 +117,14 @@ class Specter:
         return "\n\n".join(sections)
 
     def start(self):
-        # register battery monitor (runs every 3 seconds)
-        self.gui.set_battery_callback(get_battery_status, 3000)
-        # start the GUI
-        self.gui.start()
-        # register coroutines for all hosts
-        for host in self.hosts:
-            host.start(self)
+        with boot_span("Specter.start"):
+            # register battery monitor (runs every 3 seconds)
+            self.gui.set_battery_callback(get_battery_status, 3000)
+            # start the GUI
+            self.gui.start()
+            # register coroutines for all hosts
+            for host in self.hosts:
+                host.start(self)
         asyncio.run(self.setup())
 
     async def handle_exception(self, exception, next_fn):
@@ -175,17 +180,23 @@ class Specter:
         try:
             # check if the user already selected the keystore class
             if self.keystore is None:
-                await self.select_keystore()
+                with boot_span("Specter.select_keystore"):
+                    await self.select_keystore()
 
             if self.keystore is not None:
-                self.load_network(self.path, self.network)
+                with boot_span("Specter.load_network"):
+                    self.load_network(self.path, self.network)
 
             # load secrets
-            await self.keystore.init(self.gui.show_screen(), self.gui.show_loader)
+            with boot_span("%s.init" % type(self.keystore).__name__):
+                await self.keystore.init(self.gui.show_screen(), self.gui.show_loader)
             # unlock with PIN or set up the PIN code
-            await self.unlock()
+            with boot_span("Specter.unlock"):
+                await self.unlock()
         except Exception as e:
-            next_fn = await self.handle_exception(e, self.setup)
+            # error is shown to the user
+            with boot_wait():
+                next_fn = await self.handle_exception(e, self.setup)
             await next_fn()
 
         await self.main()
@@ -212,6 +223,8 @@ class Specter:
                 next_menu = await self.current_menu()
                 if next_menu is not None:
                     self.current_menu = next_menu
+                # write settings and wallets changed by the menu
+                storage.commit()
 
             except Exception as e:
                 next_fn = await self.handle_exception(e, self.setup)
@@ -258,6 +271,7 @@ class Specter:
         if self.keystore.is_key_saved and self.keystore.load_button:
             buttons.append((2, self.keystore.load_button))
         buttons += [(None, "Settings"), (3, "Device settings")]
+        boot_done(simulator)
         # wait for menu selection
         menuitem = await self.gui.menu(buttons)
 
@@ -359,6 +373,7 @@ class Specter:
         if hasattr(self.keystore, "lock"):
             buttons += [(2, "Lock device")]
         buttons += [(3, "Settings")]
+        boot_done(simulator)
         # wait for menu selection
         menuitem = await self.gui.menu(buttons)
 
@@ -529,15 +544,20 @@ class Specter:
             fname = self.settings_fname
         self.keystore.save_aead(fname,
                            adata=json.dumps(settings).encode(),
-                           key=self.keystore.settings_key
+                           key=self.keystore.settings_key,
+                           commit=False
         )
 
     async def experimental_settings(self):
-
+        experimental = self.GLOBAL.get("experimental", {})
         controls = [{
             "label": "Taproot",
             "hint": "Taproot support only for single-key wallets\nwithout tap script trees",
-            "value": self.GLOBAL.get("experimental", {}).get("taproot", False)
+            "value": experimental.get("taproot", False)
+        }, {
+            "label": "Background signing",
+            "hint": "Sign transactions while you review them,\nthe result is discarded if you don't confirm",
+            "value": experimental.get("speculative_signing", False)
         }]
 
         scr = HostSettings(
@@ -550,11 +570,12 @@ class Specter:
         res = await self.gui.show_screen()(scr)
         if res is None:
             return
-        taproot, *_ = res
+        taproot, speculative_signing, *_ = res
         # for now only experimental, can be extended
         settings = {
             "experimental": {
                 "taproot": taproot,
+                "speculative_signing": speculative_signing,
             }
         }
         self.GLOBAL = settings
@@ -567,7 +588,7 @@ class Specter:
         ] + [
             (1, "Communication"),
             # (2, "Applications"),
-            # (3, "Experimental"),
+            (3, "Experimental"),
         ] + [
             (None, "Global settings"),
             (42, "About this device"),
@@ -627,6 +648,7 @@ class Specter:
         wipe()
 
     async def lock(self):
+        storage.commit()
         # lock the keystore
         if hasattr(self.keystore, "lock"):
             self.keystore.lock()
@@ -639,10 +661,13 @@ class Specter:
         - setup PIN if not set
         - enter PIN if set
         """
-        await self.keystore.unlock()
+        # time user spends entering the PIN is excluded by the keystore
+        with boot_span("%s.unlock" % type(self.keystore).__name__):
+            await self.keystore.unlock()
         # now keystore is unlocked - we can load hosts configs
         for host in self.hosts:
-            host.load_settings(self.keystore)
+            with boot_span("%s.load_settings" % type(host).__name__):
+                host.load_settings(self.keystore)
         settings = self.load_settings()
         self.GLOBAL = settings
         BaseApp.GLOBAL = settings
@@ -676,12 +701,14 @@ class Specter:
         self.keystore.set_mnemonic(mnemonic, "")
         self.init_apps()
 
+    @trace_async("Specter.process_host_request")
     async def process_host_request(self, stream, popup=True, appname=None, show_fn=None):
         """
         This method is called whenever we got data from the host.
         It tries to find a proper app and pass the stream with data to it.
         """
         self.gui.show_loader(title="Processing host data...")
+        memstats.enter()
         res = None
         if show_fn is None:
             show_fn = self.gui.show_screen(popup)
@@ -721,5 +748,8 @@ class Specter:
                 # converted to "unknown error" on the host
                 raise e
         finally:
+            # one flash write for everything the request changed
+            storage.commit()
             self.gui.hide_loader()
+            memstats.exit()
         return res
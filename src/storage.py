@@ -0,0 +1,75 @@
+"""
+Write-back file storage.
+Small state files (wallet journal, host and global settings)
+are kept in memory when changed and written to flash
+in one batch with a single sync at commit points:
+after a host request, after a menu action, before locking.
+Security-critical files (PIN state, secrets) are flushed immediately.
+"""
+import platform
+
+
+class Storage:
+    def __init__(self):
+        # path: [data, append] - pending writes
+        self.dirty = {}
+
+    def __len__(self):
+        return len(self.dirty)
+
+    def write(self, path, data):
+        """Replaces file content on the next commit"""
+        self.dirty[path] = [data, False]
+
+    def append(self, path, data):
+        """Appends data to the file on the next commit"""
+        pending = self.dirty.get(path)
+        if pending is None:
+            self.dirty[path] = [data, True]
+        else:
+            pending[0] += data
+
+    def read(self, path):
+        """Returns file content including pending changes"""
+        pending = self.dirty.get(path)
+        if pending is not None and not pending[1]:
+            return pending[0]
+        with open(path, "rb") as f:
+            data = f.read()
+        if pending is not None:
+            data += pending[0]
+        return data
+
+    def exists(self, path):
+        return path in self.dirty or platform.file_exists(path)
+
+    def discard(self, path):
+        """Drops pending changes of the file or of all files in the folder"""
+        prefix = path.rstrip("/") + "/"
+        for k in [k for k in self.dirty if k == path or k.startswith(prefix)]:
+            del self.dirty[k]
+
+    def _write(self, path, pending):
+        data, append = pending
+        with open(path, "ab" if append else "wb") as f:
+            f.write(data)
+
+    def flush(self, path):
+        """Writes pending changes of a single file and syncs"""
+        pending = self.dirty.pop(path, None)
+        if pending is None:
+            return
+        self._write(path, pending)
+        platform.sync()
+
+    def commit(self):
+        """Writes all pending changes and syncs once"""
+        if not self.dirty:
+            return
+        dirty, self.dirty = self.dirty, {}
+        for path in sorted(dirty):
+            self._write(path, dirty[path])
+        platform.sync()
+
+
+storage = Storage()
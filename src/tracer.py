@@ -0,0 +1,229 @@
+"""
+Lightweight span tracer.
+Finished spans are stored in a fixed-size ring buffer,
+per-name statistics are accumulated for all spans ever recorded,
+so frequently called functions don't get lost when the buffer wraps.
+Boot phases are recorded by a separate tracer
+that stops when the first menu is shown.
+Time spent waiting for the user (PIN entry etc) is excluded
+from the boot clock, so it doesn't appear in the timeline.
+"""
+import utime
+import json
+
+BUFFER_SIZE = 100
+BOOT_BUFFER_SIZE = 50
+
+
+class Tracer:
+    def __init__(self, size=BUFFER_SIZE):
+        self.size = size
+        self.enabled = True
+        # time excluded with Pause, in us
+        self.paused = 0
+        self.clear()
+
+    def clear(self):
+        # (name, start_us, duration_us)
+        self.buffer = [None] * self.size
+        self.idx = 0
+        self.count = 0
+        # name: [count, total_us, max_us]
+        self.stats = {}
+
+    def record(self, name, start, duration):
+        self.buffer[self.idx] = (name, start, duration)
+        self.idx = (self.idx + 1) % self.size
+        self.count += 1
+        st = self.stats.get(name)
+        if st is None:
+            self.stats[name] = [1, duration, duration]
+        else:
+            st[0] += 1
+            st[1] += duration
+            if duration > st[2]:
+                st[2] = duration
+
+    @property
+    def spans(self):
+        """Recorded spans from the oldest to the newest"""
+        if self.count < self.size:
+            return self.buffer[:self.idx]
+        return self.buffer[self.idx:] + self.buffer[:self.idx]
+
+    @property
+    def dropped(self):
+        return max(self.count - self.size, 0)
+
+    def span(self, name):
+        return Span(self, name)
+
+    def now(self):
+        """Current time of the tracer clock without paused time"""
+        return utime.ticks_add(utime.ticks_us(), -self.paused)
+
+    def start_time(self, spans=None):
+        """Start of the earliest span, spans are ordered by the end time"""
+        if spans is None:
+            spans = self.spans
+        if not spans:
+            return 0
+        t0 = spans[0][1]
+        for _, start, _ in spans:
+            if utime.ticks_diff(start, t0) < 0:
+                t0 = start
+        return t0
+
+    def timeline(self):
+        """Returns (name, start_us, duration_us, depth) ordered by start time"""
+        spans = self.spans
+        t0 = self.start_time(spans)
+        # longer spans go first if they start at the same time
+        items = sorted(
+            [(utime.ticks_diff(start, t0), -duration, name) for name, start, duration in spans]
+        )
+        res = []
+        ends = []
+        for start, duration, name in items:
+            duration = -duration
+            while ends and start >= ends[-1]:
+                ends.pop()
+            res.append((name, start, duration, len(ends)))
+            ends.append(start + duration)
+        return res
+
+    def print_timeline(self):
+        print("    start ms  duration ms")
+        for name, start, duration, depth in self.timeline():
+            print("%12.1f %12.1f  %s%s" % (start / 1000, duration / 1000, "  " * depth, name))
+
+    def dump(self, stream):
+        """Writes spans and statistics to the stream as JSON"""
+        spans = self.spans
+        t0 = self.start_time(spans)
+        stream.write(b'{"dropped": %d, "spans": [' % self.dropped)
+        for i, (name, start, duration) in enumerate(spans):
+            if i > 0:
+                stream.write(b", ")
+            stream.write(json.dumps({
+                "name": name,
+                "start": utime.ticks_diff(start, t0),
+                "duration": duration,
+            }).encode())
+        stream.write(b'], "stats": {')
+        for i, name in enumerate(self.stats):
+            count, total, mx = self.stats[name]
+            if i > 0:
+                stream.write(b", ")
+            stream.write(json.dumps(name).encode())
+            stream.write(b': {"count": %d, "total": %d, "max": %d}' % (count, total, mx))
+        stream.write(b"}}")
+
+    def dump_chrome_trace(self, stream):
+        """
+        Writes spans in Chrome trace-event format,
+        can be opened in chrome://tracing or ui.perfetto.dev
+        """
+        spans = self.spans
+        t0 = self.start_time(spans)
+        stream.write(b'{"traceEvents": [')
+        for i, (name, start, duration) in enumerate(spans):
+            if i > 0:
+                stream.write(b",\n")
+            stream.write(json.dumps({
+                "name": name,
+                "ph": "X",
+                "ts": utime.ticks_diff(start, t0),
+                "dur": duration,
+                "pid": 1,
+                "tid": 1,
+            }).encode())
+        stream.write(b'], "displayTimeUnit": "ms"}')
+
+    def save_chrome_trace(self, fname):
+        with open(fname, "wb") as f:
+            self.dump_chrome_trace(f)
+
+
+class Span:
+    """Context manager measuring time spent in the block"""
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = self.tracer.now()
+        return self
+
+    def __exit__(self, *args):
+        if self.tracer.enabled:
+            dt = utime.ticks_diff(self.tracer.now(), self.start)
+            self.tracer.record(self.name, self.start, dt)
+        return False
+
+
+class Pause:
+    """Context manager excluding time spent in the block from the tracer clock"""
+    def __init__(self, tracer):
+        self.tracer = tracer
+
+    def __enter__(self):
+        self.start = utime.ticks_us()
+        return self
+
+    def __exit__(self, *args):
+        if self.tracer.enabled:
+            self.tracer.paused += utime.ticks_diff(utime.ticks_us(), self.start)
+        return False
+
+
+# global tracer used by the firmware
+tracer = Tracer()
+# boot timeline
+boot = Tracer(size=BOOT_BUFFER_SIZE)
+
+
+def span(name):
+    """Usage: with span("name"): ..."""
+    return Span(tracer, name)
+
+
+def trace(name):
+    """Decorator measuring every call of the function"""
+    def decorator(fn):
+        def wrapper(*args, **kwargs):
+            with Span(tracer, name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_async(name):
+    """Decorator measuring every call of the coroutine function"""
+    def decorator(fn):
+        async def wrapper(*args, **kwargs):
+            with Span(tracer, name):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def boot_span(name):
+    """Usage: with boot_span("phase"): ..."""
+    return Span(boot, name)
+
+
+def boot_wait():
+    """Usage: with boot_wait(): await user input - not a part of the boot time"""
+    return Pause(boot)
+
+
+def boot_done(verbose=False):
+    """Records total boot time and stops the boot timeline"""
+    if not boot.enabled or not boot.spans:
+        return
+    t0 = boot.start_time()
+    boot.record("boot", t0, utime.ticks_diff(boot.now(), t0))
+    boot.enabled = False
+    if verbose:
+        boot.print_timeline()
@@ -0,0 +1,289 @@
+"""
+End-to-end PSBT signing benchmark.
+
+Generates PSBTs with many inputs and outputs for single-sig,
+multisig and taproot wallets and runs them through the same stages
+as WalletManager.sign_psbt, recording wall time and memory peak
+of every stage.
+"""
+import gc
+import sys
+import utime
+from binascii import hexlify
+from embit import bip32, compact
+from embit.hashes import sha256
+from embit.networks import NETWORKS
+from embit.psbt import InputScope, OutputScope, DerivationPath
+from embit.transaction import Transaction, TransactionInput, TransactionOutput
+from helpers import a2b_base64_stream, b2a_base64_stream, B64Writer, read_write
+
+KINDS = ["wpkh", "wsh", "tr"]
+STAGES = ["b64decode", "preprocess", "confirm", "sign", "b64encode"]
+# default numbers of inputs and outputs
+SIZES = [1, 10, 50, 100, 200, 500]
+
+# amount of every generated input
+INPUT_VALUE = 100000
+# bytes passed to B64Writer at once in the b64encode stage
+ENCODE_CHUNK = 256
+
+if sys.implementation.name == "micropython":
+    def _mem_reset():
+        gc.collect()
+        return gc.mem_alloc()
+
+    def _mem_sample(peak):
+        return max(peak, gc.mem_alloc())
+
+    def _mem_peak(base, peak):
+        return max(peak, gc.mem_alloc()) - base
+
+    def _mem_stop():
+        pass
+else:
+    # tracemalloc slows down CPython a lot,
+    # so it is only started if memory tracing is requested
+    import tracemalloc
+
+    def _mem_reset():
+        gc.collect()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+
+    def _mem_sample(peak):
+        return peak
+
+    def _mem_peak(base, peak):
+        return tracemalloc.get_traced_memory()[1] - base
+
+    def _mem_stop():
+        tracemalloc.stop()
+
+
+class StageTimer:
+    """
+    Collects wall time and memory peak per stage.
+    On MicroPython gc.mem_alloc() is sampled at every loader update
+    and at the end of the stage, so the peak is a lower bound.
+    Under CPython tracemalloc peak is used.
+    """
+    def __init__(self, memory=True):
+        self.results = {}
+        self.memory = memory
+        self._name = None
+
+    def start(self, name):
+        self._name = name
+        self._peak = 0
+        self._base = _mem_reset() if self.memory else 0
+        self._t0 = utime.ticks_us()
+
+    def sample(self, *args, **kwargs):
+        # used as show_loader replacement
+        if self._name is not None and self.memory:
+            self._peak = _mem_sample(self._peak)
+
+    def stop(self):
+        dt = utime.ticks_diff(utime.ticks_us(), self._t0)
+        peak = None
+        if self.memory:
+            peak = max(_mem_peak(self._base, self._peak), 0)
+        self.results[self._name] = {
+            "time_ms": dt / 1000,
+            "mem_peak": peak,
+        }
+        self._name = None
+
+
+def _cosigner(i):
+    return bip32.HDKey.from_seed(sha256(b"specter bench cosigner %d" % i))
+
+
+def wallet_descriptor(keystore, kind, network, m=2, n=3):
+    """Returns descriptor of the wallet of certain kind with our key in it"""
+    net = NETWORKS[network]
+    coin = net["bip32"]
+    fgp = hexlify(keystore.fingerprint).decode()
+    if kind == "wpkh":
+        der = "m/84h/%dh/0h" % coin
+        xpub = keystore.get_xpub(der).to_base58(net["xpub"])
+        return "wpkh([%s%s]%s/{0,1}/*)" % (fgp, der[1:], xpub)
+    if kind == "tr":
+        der = "m/86h/%dh/0h" % coin
+        xpub = keystore.get_xpub(der).to_base58(net["xpub"])
+        return "tr([%s%s]%s/{0,1}/*)" % (fgp, der[1:], xpub)
+    if kind == "wsh":
+        der = "m/48h/%dh/0h/2h" % coin
+        xpub = keystore.get_xpub(der).to_base58(net["xpub"])
+        keys = ["[%s%s]%s/{0,1}/*" % (fgp, der[1:], xpub)]
+        for i in range(n - 1):
+            root = _cosigner(i)
+            xpub = root.derive(der).to_public().to_base58(net["xpub"])
+            fgp = hexlify(root.my_fingerprint).decode()
+            keys.append("[%s%s]%s/{0,1}/*" % (fgp, der[1:], xpub))
+        return "wsh(sortedmulti(%d,%s))" % (m, ",".join(keys))
+    raise ValueError("Unknown wallet kind: %s" % kind)
+
+
+def get_wallet(manager, kind, m=2, n=3):
+    """Finds or imports the wallet of certain kind into the wallet manager"""
+    desc = wallet_descriptor(manager.keystore, kind, manager.network, m, n)
+    w = manager.WalletClass.parse("Bench %s&%s" % (kind, desc))
+    for ww in manager.wallets:
+        if str(ww.descriptor) == str(w.descriptor):
+            return ww
+    manager.add_wallet(w)
+    return w
+
+
+def _fill_scope(scope, desc):
+    """Adds derivation information of the derived descriptor to the scope"""
+    for k in desc.keys:
+        der = DerivationPath(k.fingerprint, k.derivation)
+        if desc.is_taproot:
+            scope.taproot_bip32_derivations[k.get_public_key()] = ([], der)
+            scope.taproot_internal_key = k.get_public_key()
+        else:
+            scope.bip32_derivations[k.get_public_key()] = der
+    if not desc.is_taproot:
+        scope.witness_script = desc.witness_script()
+        scope.redeem_script = desc.redeem_script()
+
+
+def write_psbt(wallet, fout, num_inputs, num_outputs):
+    """
+    Writes a PSBT spending num_inputs receiving addresses of the wallet
+    to num_outputs change addresses. Scopes are serialized one by one
+    so the whole transaction never lives in memory.
+    """
+    vin = [
+        TransactionInput(sha256(b"specter bench input %d" % i), i % 4)
+        for i in range(num_inputs)
+    ]
+    fee = 1000
+    total = INPUT_VALUE * num_inputs - fee
+    values = [total // num_outputs for i in range(num_outputs)]
+    values[0] += total - sum(values)
+    vout = [
+        TransactionOutput(values[i], wallet.descriptor.derive(i, branch_index=1).script_pubkey())
+        for i in range(num_outputs)
+    ]
+    tx = Transaction(vin=vin, vout=vout)
+    fout.write(b"psbt\xff\x01\x00")
+    txdata = tx.serialize()
+    fout.write(compact.to_bytes(len(txdata)))
+    fout.write(txdata)
+    fout.write(b"\x00")
+    del tx, txdata, vout
+    for i in range(num_inputs):
+        desc = wallet.descriptor.derive(i, branch_index=0)
+        scope = InputScope(vin=vin[i])
+        scope.witness_utxo = TransactionOutput(INPUT_VALUE, desc.script_pubkey())
+        _fill_scope(scope, desc)
+        scope.write_to(fout)
+    for i in range(num_outputs):
+        desc = wallet.descriptor.derive(i, branch_index=1)
+        scope = OutputScope()
+        _fill_scope(scope, desc)
+        scope.write_to(fout)
+
+
+async def _confirm(*args, **kwargs):
+    return True
+
+
+async def run_stages(manager, b64path, timer):
+    """
+    Runs base64-encoded PSBT from b64path through the signing pipeline.
+    Returns path to the signed base64 PSBT.
+    """
+    manager.show_loader = timer.sample
+    tmp = manager.tempdir
+
+    timer.start("b64decode")
+    with open(b64path, "rb") as fin:
+        with open(tmp + "/raw", "wb") as fout:
+            a2b_base64_stream(fin, fout)
+    timer.stop()
+
+    with open(tmp + "/raw", "rb") as fin:
+        timer.start("preprocess")
+        psbtv, wallets, meta = manager.fill_psbt(fin)
+        timer.stop()
+
+        timer.start("confirm")
+        options = await manager.confirm_transaction(wallets, meta, _confirm)
+        timer.stop()
+        del meta
+
+        timer.start("sign")
+        with open(tmp + "/signed_raw", "wb") as fout:
+            manager.sign_psbtview(psbtv, fout, wallets, **options)
+        timer.stop()
+
+    # sign_psbt encodes to base64 while signing,
+    # here the same B64Writer runs as a separate stage to time it
+    timer.start("b64encode")
+    with open(tmp + "/signed_raw", "rb") as fin:
+        with open(tmp + "/signed_b64", "wb") as f:
+            fout = B64Writer(f)
+            read_write(fin, fout, ENCODE_CHUNK)
+            fout.close()
+    timer.stop()
+    return tmp + "/signed_b64"
+
+
+def bench(manager, wallet, num_inputs, num_outputs, memory=True):
+    """Runs a single benchmark and returns per-stage results"""
+    import asyncio
+
+    tmp = manager.tempdir
+    with open(tmp + "/bench_raw", "wb") as f:
+        write_psbt(wallet, f, num_inputs, num_outputs)
+    with open(tmp + "/bench_raw", "rb") as fin:
+        with open(tmp + "/bench_b64", "wb") as fout:
+            b2a_base64_stream(fin, fout)
+    gc.collect()
+    timer = StageTimer(memory)
+    asyncio.run(run_stages(manager, tmp + "/bench_b64", timer))
+    if memory:
+        _mem_stop()
+    return timer.results
+
+
+def report(kind, num_inputs, num_outputs, results):
+    """Prints one line per benchmark"""
+    line = "%-5s %4d in %4d out |" % (kind, num_inputs, num_outputs)
+    for stage in STAGES:
+        r = results[stage]
+        mem = "-" if r["mem_peak"] is None else "%dB" % r["mem_peak"]
+        line += " %s %8.1fms %8s |" % (stage, r["time_ms"], mem)
+    print(line)
+
+
+
+def parse_size(s):
+    if "x" in s:
+        n, m = s.split("x")
+        return int(n), int(m)
+    return int(s), int(s)
+
+
+def main(args):
+    from tests import util
+    memory = (sys.implementation.name == "micropython") or ("--mem" in args)
+    args = [arg for arg in args if not arg.startswith("--")]
+    kinds = args[0].split(",") if len(args) > 0 else KINDS
+    sizes = [parse_size(s) for s in args[1].split(",")] if len(args) > 1 else [(n, n) for n in SIZES]
+    util.clear_testdir()
+    ks = util.get_keystore()
+    wapp = util.get_wallets_app(ks, "regtest")
+    manager = wapp.manager
+    for kind in kinds:
+        w = get_wallet(manager, kind)
+        for num_inputs, num_outputs in sizes:
+            results = bench(manager, w, num_inputs, num_outputs, memory)
+            report(kind, num_inputs, num_outputs, results)
+    util.clear_testdir()
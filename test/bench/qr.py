@@ -0,0 +1,387 @@
+"""
+Animated QR replay benchmark.
+
+Replays frames of animated QR codes (pMofN base64, UR:BYTES and
+UR:CRYPTO-PSBT) into QRHost through a fake scanner UART that mimics
+GM65 and M3Y modules: the scanner decodes one frame per trigger,
+sends it with the UART baudrate and drops bytes that don't fit
+into the read buffer. Display frame rate, scanner latency,
+truncated frames and repeated frames are configurable,
+so CHUNK_TIMEOUT, READ_BUFFER_LEN and the file I/O in the frame
+processing can be tuned against the same recorded streams.
+"""
+import gc
+import utime
+import asyncio
+import pyb
+from platform import maybe_mkdir
+from embit.hashes import sha256
+from hosts.qr import (
+    QRHost,
+    HEADER,
+    SCAN_ADDR,
+    SUCCESS,
+    M3Y_ENABLE_SCAN,
+    M3Y_DISABLE_SCAN,
+    MODEL_GM65,
+    MODEL_M3Y,
+    READ_BUFFER_LEN,
+)
+
+FORMATS = ["base64", "bcur", "bcur2"]
+# PSBT sizes in kB
+SIZES = [1, 10, 50, 100, 200]
+
+# OK response of the M3Y scanner
+M3Y_SUCCESS = b"\x5A\x01\x00\x02\x90\x00\x93\xA5"
+
+# display and scanner defaults
+FRAME_INTERVAL_MS = 200
+SCAN_LATENCY_MS = 50
+BAUDRATE = 115200
+PART_LEN = 300
+# give up if the code is not scanned in this time
+TIMEOUT_MS = 600000
+
+
+class Random:
+    """Tiny LCG so replays are reproducible on MicroPython and CPython"""
+    def __init__(self, seed=1):
+        self.state = seed & 0x7FFFFFFF
+
+    def random(self):
+        self.state = (self.state * 1103515245 + 12345) & 0x7FFFFFFF
+        return self.state / 0x80000000
+
+
+class FakeUART:
+    """
+    Replaces pyb.UART of the scanner.
+    frames should support frames[idx] and len(frames),
+    infinite sequences (fountain codes) set is_infinite = True.
+    Scanning is armed either by scan commands (GM65 / M3Y command mode)
+    or by FakeTrigger, every arm decodes a single frame
+    that is currently shown on the display.
+    """
+    def __init__(self, frames, eol=b"\r", model=MODEL_GM65, baudrate=BAUDRATE,
+                 frame_interval_ms=FRAME_INTERVAL_MS, scan_latency_ms=SCAN_LATENCY_MS,
+                 truncate=0, duplicates=0, seed=1, read_buf_len=READ_BUFFER_LEN):
+        self.frames = frames
+        self.is_infinite = getattr(frames, "is_infinite", False)
+        self.eol = eol
+        self.model = model
+        self.baudrate = baudrate
+        self.frame_interval_ms = frame_interval_ms
+        self.scan_latency_ms = scan_latency_ms
+        # probability that the frame loses part of the data
+        self.truncate = truncate
+        # probability that the display shows the same frame again
+        self.duplicates = duplicates
+        self.rng = Random(seed)
+        self.read_buf_len = read_buf_len
+        self.reset()
+
+    def reset(self):
+        """Restarts the display animation and clears counters"""
+        self.rx = b""
+        self.armed = False
+        self._armed_at = 0
+        self._tx = None
+        self._tx_start = 0
+        self._tx_pos = 0
+        self._t0 = utime.ticks_ms()
+        self._slot = 0
+        self._frame = 0
+        self.shown = 1
+        self.scanned = 0
+        self.repeats = 0
+        self.truncated = 0
+        self.overflow = 0
+        self._seen = set()
+
+    def arm(self, enable):
+        if enable and not self.armed:
+            self._armed_at = utime.ticks_ms()
+        self.armed = bool(enable)
+
+    def _advance_display(self, now):
+        slot = utime.ticks_diff(now, self._t0) // self.frame_interval_ms
+        while self._slot < slot:
+            self._slot += 1
+            self.shown += 1
+            if self.rng.random() >= self.duplicates:
+                self._frame += 1
+
+    def _current_frame(self):
+        idx = self._frame
+        if not self.is_infinite:
+            idx = idx % len(self.frames)
+        return idx
+
+    def _push(self, data):
+        room = self.read_buf_len - len(self.rx)
+        if len(data) > room:
+            self.overflow += len(data) - room
+            data = data[:room]
+        self.rx += data
+
+    def _pump(self):
+        now = utime.ticks_ms()
+        self._advance_display(now)
+        if (self._tx is None and self.armed
+                and utime.ticks_diff(now, self._armed_at) >= self.scan_latency_ms):
+            idx = self._current_frame()
+            frame = self.frames[idx]
+            if isinstance(frame, str):
+                frame = frame.encode()
+            if self.rng.random() < self.truncate:
+                frame = frame[:int(len(frame) * self.rng.random())]
+                self.truncated += 1
+            if idx in self._seen:
+                self.repeats += 1
+            self._seen.add(idx)
+            self.scanned += 1
+            self._tx = frame + self.eol
+            self._tx_start = utime.ticks_add(self._armed_at, self.scan_latency_ms)
+            self._tx_pos = 0
+            # one frame per trigger
+            self.armed = False
+        if self._tx is not None:
+            # 10 bits per byte on the wire
+            sent = utime.ticks_diff(now, self._tx_start) * self.baudrate // 10000
+            sent = min(max(sent, 0), len(self._tx))
+            if sent > self._tx_pos:
+                self._push(self._tx[self._tx_pos:sent])
+                self._tx_pos = sent
+            if self._tx_pos == len(self._tx):
+                self._tx = None
+
+    def any(self):
+        self._pump()
+        return len(self.rx)
+
+    def read(self, n=None):
+        self._pump()
+        if len(self.rx) == 0:
+            return None
+        if n is None:
+            n = len(self.rx)
+        data, self.rx = self.rx[:n], self.rx[n:]
+        return data
+
+    def write(self, data):
+        if self.model == MODEL_M3Y:
+            if data[:2] == b"\x5A\x00":
+                cmd = data[4:-2]
+                if cmd == M3Y_ENABLE_SCAN:
+                    self.arm(True)
+                elif cmd == M3Y_DISABLE_SCAN:
+                    self.arm(False)
+                self._push(M3Y_SUCCESS)
+        elif data[:2] == HEADER:
+            if data[2:4] == b"\x08\x01" and data[4:6] == SCAN_ADDR:
+                self.arm(data[6] == 1)
+            self._push(SUCCESS)
+        return len(data)
+
+    def init(self, baudrate=None, read_buf_len=None, **kwargs):
+        if baudrate is not None:
+            self.baudrate = baudrate
+        if read_buf_len is not None:
+            self.read_buf_len = read_buf_len
+
+    def deinit(self):
+        pass
+
+
+class FakeTrigger:
+    """Scanner trigger pin, it is reversed: off means scanning"""
+    def __init__(self, uart):
+        self.uart = uart
+
+    def on(self):
+        self.uart.arm(False)
+
+    def off(self):
+        self.uart.arm(True)
+
+
+def make_host(path, uart, trigger=True):
+    """Creates QRHost talking to the fake UART"""
+    UART = pyb.UART
+    pyb.UART = lambda *args, **kwargs: uart
+    try:
+        host = QRHost(path)
+    finally:
+        pyb.UART = UART
+    uart.eol = host.EOL
+    host.trigger = FakeTrigger(uart) if trigger else None
+    host.scanner_model = uart.model
+    host.is_configured = True
+    host.enabled = True
+    return host
+
+
+def make_psbt(size, seed=b"specter bench qr"):
+    """Returns deterministic PSBT-like data of size bytes"""
+    chunks = [b"psbt\xff"]
+    h = seed
+    for i in range(size // 32 + 1):
+        h = sha256(h)
+        chunks.append(h)
+    return b"".join(chunks)[:size]
+
+
+def get_encoder(fmt):
+    if fmt == "base64":
+        from qrencoder import Base64QREncoder
+        return Base64QREncoder
+    if fmt == "bcur":
+        from qrencoder import LegacyBCUREncoder
+        return LegacyBCUREncoder
+    if fmt == "bcur2":
+        from qrencoder import CryptoPSBTEncoder
+        return CryptoPSBTEncoder
+    raise ValueError("Unknown QR format: %s" % fmt)
+
+
+def expected_result(fmt, enc, data):
+    """What QRHost should write to data.txt after a complete scan"""
+    if fmt == "bcur2":
+        return data
+    if fmt == "bcur" and len(enc) > 1:
+        return b"UR:BYTES/" + enc.enc_hash.encode() + b"/" + enc.get_full().encode()
+    return enc.get_full().encode()
+
+
+async def replay(host, uart, rate=10, timeout=TIMEOUT_MS):
+    """
+    Scans the animated QR code shown by the fake scanner
+    and calls host.update() every rate ms like Host.update_loop.
+    Returns (data, stats) where data is None if scan failed.
+    """
+    stats = {"accepted": 0, "rejected": 0, "error": None}
+    process_chunk = host.process_chunk
+
+    def counted_process_chunk():
+        try:
+            res = process_chunk()
+        except Exception:
+            stats["rejected"] += 1
+            raise
+        stats["accepted"] += 1
+        return res
+
+    host.process_chunk = counted_process_chunk
+    uart.reset()
+    t0 = utime.ticks_ms()
+    task = asyncio.create_task(host.scan())
+    # let scan() arm the scanner
+    await asyncio.sleep_ms(0)
+    while host.scanning:
+        if utime.ticks_diff(utime.ticks_ms(), t0) > timeout:
+            stats["error"] = "timeout"
+            host.abort()
+            break
+        try:
+            await host.update()
+        except Exception as e:
+            stats["error"] = str(e) or type(e).__name__
+            host.abort()
+            break
+        await asyncio.sleep_ms(rate)
+    stream = await task
+    stats["time_ms"] = utime.ticks_diff(utime.ticks_ms(), t0)
+    del host.process_chunk
+    data = None
+    if stream is not None:
+        data = stream.read()
+        stream.close()
+        host.f = None
+    return data, stats
+
+
+def bench(path, fmt, size, part_len=PART_LEN, trigger=True, rate=10, **kwargs):
+    """
+    Replays a PSBT of size bytes encoded as animated QR code.
+    kwargs are passed to FakeUART.
+    """
+    maybe_mkdir(path)
+    data = make_psbt(size)
+    with open(path + "/psbt", "wb") as f:
+        f.write(data)
+    EncoderCls = get_encoder(fmt)
+    with open(path + "/psbt", "rb") as f:
+        enc = EncoderCls(f, part_len=part_len, tempfile=path + "/frames")
+    with enc:
+        expected = expected_result(fmt, enc, data)
+        uart = FakeUART(enc, **kwargs)
+        host = make_host(path + "/host", uart, trigger)
+        gc.collect()
+        res, stats = asyncio.run(replay(host, uart, rate))
+        parts = None if enc.is_infinite else len(enc)
+    seconds = max(stats["time_ms"], 1) / 1000
+    return {
+        "parts": parts,
+        "time_ms": stats["time_ms"],
+        "shown": uart.shown,
+        "scanned": uart.scanned,
+        "missed": max(uart.shown - uart.scanned, 0),
+        "repeats": uart.repeats,
+        "truncated": uart.truncated,
+        "overflow": uart.overflow,
+        "accepted": stats["accepted"],
+        "rejected": stats["rejected"],
+        "fps": stats["accepted"] / seconds,
+        "error": stats["error"],
+        "ok": res == expected,
+    }
+
+
+def report(fmt, size, r):
+    """Prints one line per benchmark"""
+    parts = "inf" if r["parts"] is None else "%d" % r["parts"]
+    print("%-6s %4dkB %5s parts | %8.1fs | %6.2f fps | shown %5d scanned %5d "
+          "missed %5d repeats %4d | rejected %3d truncated %3d overflow %6dB | %s" % (
+              fmt, size // 1024, parts, r["time_ms"] / 1000, r["fps"],
+              r["shown"], r["scanned"], r["missed"], r["repeats"],
+              r["rejected"], r["truncated"], r["overflow"],
+              "ok" if r["ok"] else "FAIL %s" % (r["error"] or "data mismatch")))
+
+
+def parse_options(args):
+    """Splits --key=value options from positional arguments"""
+    options = {}
+    rest = []
+    for arg in args:
+        if arg.startswith("--"):
+            k, _, v = arg[2:].partition("=")
+            options[k] = v
+        else:
+            rest.append(arg)
+    return options, rest
+
+
+def main(args):
+    from tests import util
+    options, args = parse_options(args)
+    formats = args[0].split(",") if len(args) > 0 else FORMATS
+    sizes = [int(s) for s in args[1].split(",")] if len(args) > 1 else SIZES
+    kwargs = {
+        "model": MODEL_M3Y if "m3y" in options else MODEL_GM65,
+        "baudrate": int(options.get("baud", BAUDRATE)),
+        "frame_interval_ms": int(options.get("interval", FRAME_INTERVAL_MS)),
+        "scan_latency_ms": int(options.get("latency", SCAN_LATENCY_MS)),
+        "truncate": float(options.get("truncate", 0)),
+        "duplicates": float(options.get("duplicates", 0)),
+    }
+    part_len = int(options.get("part", PART_LEN))
+    # command mode if trigger pin is not used
+    trigger = "cmd" not in options
+    util.clear_testdir()
+    maybe_mkdir(util.TEST_DIR)
+    for fmt in formats:
+        for size in sizes:
+            r = bench(util.TEST_DIR + "/qr", fmt, size * 1024, part_len, trigger, **kwargs)
+            report(fmt, size * 1024, r)
+    util.clear_testdir()
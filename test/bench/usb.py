@@ -0,0 +1,319 @@
+"""
+USB transport benchmark.
+
+Replays host sessions through a loopback stand-in for pyb.USB_VCP
+into USBHost.read_to_file, process_command and _send_data,
+measuring bytes per second in both directions and command round-trip time.
+The loopback link itself is instant, so the numbers show
+the overhead of the firmware side: read and write chunk sizes
+and the host update loop.
+
+Sessions are lists of host messages, they can be generated
+(large PSBT, back-to-back xpub queries, double-EOL resets)
+or loaded from a file recorded by a previous run,
+so transport changes can be compared on the same traffic.
+"""
+import gc
+import utime
+import asyncio
+from binascii import a2b_base64, b2a_base64
+from embit.hashes import sha256
+from embit.psbt import PSBT
+from embit.transaction import Transaction, TransactionInput, TransactionOutput
+from helpers import b2a_base64_stream
+from hosts.core import HostError
+from hosts.usb import USBHost
+from .psbt import INPUT_VALUE, _fill_scope, _confirm
+
+# size of the generated PSBT in kB
+PSBT_SIZE = 100
+# number of back-to-back xpub queries
+XPUBS = 10
+# give up if the command is not processed in this time
+TIMEOUT_MS = 600000
+
+
+class LoopbackVCP:
+    """
+    Replaces pyb.USB_VCP: the host writes to the device input buffer
+    and reads whatever the device has written.
+    Read and write calls of the device are counted and timestamped.
+    """
+    RTS = 1
+    CTS = 2
+
+    def __init__(self):
+        self.rx = b""
+        self.tx = b""
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.reads = 0
+        self.writes = 0
+        # timestamps of the first, second and last writes
+        self.write_times = [None, None, None]
+
+    def init(self, *args, **kwargs):
+        pass
+
+    # host side
+
+    def send(self, data):
+        self.rx += data
+
+    def receive(self):
+        data, self.tx = self.tx, b""
+        return data
+
+    # device side
+
+    def any(self):
+        return len(self.rx)
+
+    def read(self, n=None):
+        if len(self.rx) == 0:
+            return None
+        if n is None:
+            n = len(self.rx)
+        self.reads += 1
+        data, self.rx = self.rx[:n], self.rx[n:]
+        return data
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        t = utime.ticks_us()
+        if self.write_times[0] is None:
+            self.write_times[0] = t
+        elif self.write_times[1] is None:
+            self.write_times[1] = t
+        self.write_times[2] = t
+        self.writes += 1
+        self.tx += data
+        return len(data)
+
+
+class HostManager:
+    """
+    Minimal stand-in for Specter.process_host_request,
+    finds the app for the request and confirms everything
+    """
+    def __init__(self, apps):
+        self.apps = apps
+
+    async def process_host_request(self, stream, popup=True, appname=None, show_fn=None):
+        matching_apps = []
+        for app in self.apps:
+            stream.seek(0)
+            if app.can_process(stream):
+                matching_apps.append(app)
+        if len(matching_apps) != 1:
+            stream.seek(0)
+            raise HostError("Can't find matching app for this request: %r" % stream.read(20))
+        stream.seek(0)
+        return await matching_apps[0].process_host_command(stream, _confirm)
+
+
+def make_host(path, vcp, apps):
+    host = USBHost(path)
+    host.usb = vcp
+    host.manager = HostManager(apps)
+    host.enabled = True
+    return host
+
+
+def write_large_psbt(wallet, fout, size):
+    """
+    Writes a single-input PSBT spending from the wallet
+    with non_witness_utxo padded to roughly size bytes
+    """
+    desc = wallet.descriptor.derive(0, branch_index=0)
+    change = wallet.descriptor.derive(0, branch_index=1)
+    utxo = TransactionOutput(INPUT_VALUE, desc.script_pubkey())
+    num_outputs = max(size // len(utxo.serialize()), 1)
+    prev = Transaction(
+        vin=[TransactionInput(sha256(b"specter bench usb"), 0)],
+        vout=[utxo] * num_outputs,
+    )
+    tx = Transaction(
+        vin=[TransactionInput(prev.txid(), 0)],
+        vout=[TransactionOutput(INPUT_VALUE - 1000, change.script_pubkey())],
+    )
+    psbt = PSBT(tx)
+    psbt.inputs[0].non_witness_utxo = prev
+    psbt.inputs[0].witness_utxo = utxo
+    _fill_scope(psbt.inputs[0], desc)
+    _fill_scope(psbt.outputs[0], change)
+    psbt.write_to(fout)
+
+
+def make_session(wallet, tmpdir, psbt_size=PSBT_SIZE * 1024, xpubs=XPUBS):
+    """
+    Returns a list of (host message, expected response) tuples,
+    response is None if it is not known yet
+    or b"" if the device should stay silent.
+    """
+    with open(tmpdir + "/usb_psbt", "wb") as f:
+        write_large_psbt(wallet, f, psbt_size)
+    with open(tmpdir + "/usb_psbt", "rb") as fin:
+        with open(tmpdir + "/usb_b64", "wb") as fout:
+            b2a_base64_stream(fin, fout)
+    with open(tmpdir + "/usb_b64", "rb") as f:
+        b64 = f.read().strip()
+    session = [(b"sign " + b64 + b"\r\n", None)]
+    for i in range(xpubs):
+        session.append((b"xpub m/84h/1h/%dh\r\n" % i, None))
+    # host starts sending a command and gives up,
+    # double EOL makes the device start over
+    session.append((b"sign " + b64[:1000], b""))
+    session.append((b"\r\n\r\nfingerprint\r\n", None))
+    # host always resets before the command
+    session.append((b"\r\n\r\nxpub m/84h/1h/0h\r\n", None))
+    return session
+
+
+def save_session(fname, records):
+    """Saves host messages and device responses"""
+    with open(fname, "wb") as f:
+        for msg, res in records:
+            f.write(b"> " + b2a_base64(msg))
+            f.write(b"< " + b2a_base64(res))
+
+
+def load_session(fname):
+    """Loads (host message, recorded response) tuples saved by save_session"""
+    session = []
+    msg = None
+    with open(fname, "rb") as f:
+        for line in f:
+            if line.startswith(b">"):
+                msg = a2b_base64(line[1:].strip())
+            elif line.startswith(b"<") and msg is not None:
+                session.append((msg, a2b_base64(line[1:].strip())))
+                msg = None
+    return session
+
+
+def _response_complete(data):
+    ack = USBHost.ACK
+    return data.startswith(ack) and len(data) > len(ack) and data.endswith(b"\r\n")
+
+
+async def replay(host, vcp, session, rate=10, timeout=TIMEOUT_MS):
+    """
+    Sends messages of the session one by one,
+    waiting for the response if it is expected,
+    and calls host.update() every rate ms like Host.update_loop.
+    Returns a list of per-message results.
+    """
+    results = []
+    for msg, expected in session:
+        vcp.reset_stats()
+        gc.collect()
+        t0 = utime.ticks_us()
+        vcp.send(msg)
+        out = b""
+        error = None
+        while True:
+            try:
+                await host.update()
+            except Exception as e:
+                error = str(e) or type(e).__name__
+                break
+            out += vcp.receive()
+            if _response_complete(out):
+                break
+            # device should stay silent - wait until everything is read
+            if expected == b"" and vcp.any() == 0:
+                break
+            if utime.ticks_diff(utime.ticks_us(), t0) > timeout * 1000:
+                error = "timeout"
+                break
+            await asyncio.sleep_ms(rate)
+        ack, first, last = vcp.write_times
+        r = {
+            "command": msg.strip().split(b" ")[0][:12].decode(),
+            "bytes_in": len(msg),
+            "bytes_out": max(len(out) - len(USBHost.ACK), 0),
+            "reads": vcp.reads,
+            "writes": vcp.writes,
+            "response": out,
+            "error": error,
+            "match": expected is None or expected == out,
+        }
+        # receive time - until ACK is sent
+        r["time_in_ms"] = utime.ticks_diff(ack, t0) / 1000 if ack is not None else None
+        # send time - from the first to the last response write
+        if first is not None:
+            r["time_out_ms"] = utime.ticks_diff(last, first) / 1000
+            r["rtt_ms"] = utime.ticks_diff(last, t0) / 1000
+        else:
+            r["time_out_ms"] = None
+            r["rtt_ms"] = None
+        results.append(r)
+    return results
+
+
+def _rate(nbytes, ms):
+    if ms is None:
+        return "-"
+    return "%.1fkB/s" % (nbytes / max(ms, 0.001))
+
+
+def report(results):
+    """Prints one line per message and totals"""
+    total = {"in": 0, "in_ms": 0, "out": 0, "out_ms": 0}
+    for r in results:
+        line = "%-12s %7dB in %9s | %7dB out %9s | rtt %s | %5d reads %5d writes" % (
+            r["command"] or "-", r["bytes_in"], _rate(r["bytes_in"], r["time_in_ms"]),
+            r["bytes_out"], _rate(r["bytes_out"], r["time_out_ms"]),
+            "-" if r["rtt_ms"] is None else "%.1fms" % r["rtt_ms"],
+            r["reads"], r["writes"],
+        )
+        if r["error"]:
+            line += " | FAIL %s" % r["error"]
+        elif not r["match"]:
+            line += " | response changed"
+        print(line)
+        if r["time_in_ms"] is not None:
+            total["in"] += r["bytes_in"]
+            total["in_ms"] += r["time_in_ms"]
+        if r["time_out_ms"] is not None:
+            total["out"] += r["bytes_out"]
+            total["out_ms"] += r["time_out_ms"]
+    print("total: %s in, %s out" % (
+        _rate(total["in"], total["in_ms"]), _rate(total["out"], total["out_ms"])))
+
+
+def main(args):
+    from platform import maybe_mkdir
+    from tests import util
+    from apps.xpubs import App as XpubApp
+    from .psbt import get_wallet
+    from .qr import parse_options
+
+    options, args = parse_options(args)
+    util.clear_testdir()
+    ks = util.get_keystore()
+    wapp = util.get_wallets_app(ks, "regtest")
+    xapp = XpubApp(util.TEST_DIR + "/xpubs")
+    xapp.init(ks, "regtest", util.show_loader, util.communicate)
+    if "load" in options:
+        session = load_session(options["load"])
+    else:
+        w = get_wallet(wapp.manager, "wpkh")
+        session = make_session(
+            w, wapp.manager.tempdir,
+            int(options.get("psbt", PSBT_SIZE)) * 1024,
+            int(options.get("xpubs", XPUBS)),
+        )
+    vcp = LoopbackVCP()
+    maybe_mkdir(util.TEST_DIR + "/usb")
+    host = make_host(util.TEST_DIR + "/usb", vcp, [wapp, xapp])
+    results = asyncio.run(replay(host, vcp, session, int(options.get("rate", 10))))
+    report(results)
+    if "save" in options:
+        save_session(options["save"], [
+            (msg, r["response"]) for (msg, _), r in zip(session, results)
+        ])
+    util.clear_testdir()
@@ -58,8 +58,12 @@ def setup_native_stubs():
             def off(self):
                 pass
 
+        class _DummyPin(_DummyLED):
+            OUT = 1
+
         pyb.SDCard = _DummySDCard
         pyb.LED = _DummyLED
+        pyb.Pin = _DummyPin
         pyb.usb_mode = lambda *args, **kwargs: None
         pyb.UART = lambda *args, **kwargs: None
         pyb.USB_VCP = lambda *args, **kwargs: None
@@ -79,6 +83,9 @@ def setup_native_stubs():
     if not hasattr(display, "Screen"):
         display.Screen = type("Screen", (), {})
 
+    def _stub_init(self, *args, **kwargs):
+        pass
+
     gui = _ensure_module("gui")
     if not hasattr(gui, "__path__"):
         gui.__path__ = []
@@ -105,7 +112,7 @@ def setup_native_stubs():
         "DevSettings",
     ]:
         if not hasattr(screens, _name):
-            setattr(screens, _name, type(_name, (), {}))
+            setattr(screens, _name, type(_name, (), {"__init__": _stub_init}))
 
     _ensure_submodule("gui.screens", "mnemonic", {
         "ExportMnemonicScreen": type("ExportMnemonicScreen", (), {}),
@@ -120,6 +127,13 @@ def setup_native_stubs():
         "QRAlert": type("QRAlert", (), {}),
     })
 
+    components = _ensure_module("gui.components")
+    if not hasattr(components, "__path__"):
+        components.__path__ = []
+    _ensure_submodule("gui.components", "pagedlist", {
+        "PagedList": type("PagedList", (), {"__init__": _stub_init}),
+    })
+
     common = _ensure_module("gui.common")
     if not hasattr(common, "HOR_RES"):
         common.HOR_RES = 480
@@ -186,6 +200,16 @@ def setup_native_stubs():
         utime.localtime = _time.localtime
         utime.gmtime = _time.gmtime
 
+    import asyncio
+    if not hasattr(asyncio, "sleep_ms"):
+        asyncio.sleep_ms = lambda ms: asyncio.sleep(ms / 1000.0)
+
+    if not hasattr(sys, "print_exception"):
+        import traceback
+        sys.print_exception = lambda exc, file=None: traceback.print_exception(
+            type(exc), exc, exc.__traceback__, file=file
+        )
+
     from app import BaseApp
 
     if not hasattr(BaseApp, "_native_original_get_prefix"):
@@ -0,0 +1,67 @@
+"""
+Benchmarks.
+
+Usage (from the test folder):
+    ../bin/micropython_unix run_bench.py [psbt] [kinds] [sizes]
+    python3 run_bench.py [psbt] [--mem] [kinds] [sizes]
+    ../bin/micropython_unix run_bench.py qr [options] [formats] [sizes]
+    ../bin/micropython_unix run_bench.py usb [options]
+
+PSBT signing benchmark (default):
+kinds - comma-separated list of wpkh,wsh,tr (all by default)
+sizes - comma-separated list of number of inputs and outputs,
+        either N or NxM (N inputs, M outputs)
+--mem - trace memory under CPython (slows down the run),
+        on MicroPython gc.mem_alloc() is always sampled
+
+Animated QR replay benchmark (qr):
+formats - comma-separated list of base64,bcur,bcur2 (all by default)
+sizes   - comma-separated list of PSBT sizes in kB
+--interval=MS   - display frame interval (200)
+--latency=MS    - scanner decoding latency (50)
+--truncate=P    - probability that a frame loses part of the data (0)
+--duplicates=P  - probability that the display repeats a frame (0)
+--part=N        - QR frame payload length (300)
+--baud=N        - scanner UART baudrate (115200)
+--cmd           - start scanning with commands instead of the trigger pin
+--m3y           - emulate M3Y scanner instead of GM65
+
+USB transport benchmark (usb):
+--psbt=KB       - size of the PSBT in the generated session (100)
+--xpubs=N       - number of back-to-back xpub queries (10)
+--rate=MS       - delay between host updates (10)
+--save=FILE     - record host messages and device responses to the file
+--load=FILE     - replay the session recorded with --save
+"""
+import sys
+# src goes before the standard library (platform module)
+sys.path.insert(1, '../src')
+sys.path.append('../f469-disco/libs/common')
+sys.path.append('../f469-disco/libs/unix')
+sys.path.append('../f469-disco/usermods/udisplay_f469/display_unixport')
+
+if sys.implementation.name == 'micropython':
+    import display
+    display.init(False)
+else:
+    from native_support import setup_native_stubs
+    setup_native_stubs()
+
+SUITES = ["psbt", "qr", "usb"]
+
+
+def main():
+    args = sys.argv[1:]
+    suite = "psbt"
+    if len(args) > 0 and args[0] in SUITES:
+        suite = args.pop(0)
+    if suite == "qr":
+        from bench.qr import main as run
+    elif suite == "usb":
+        from bench.usb import main as run
+    else:
+        from bench.psbt import main as run
+    run(args)
+
+
+main()
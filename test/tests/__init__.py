@@ -4,3 +4,7 @@ from .test_sign import *
 from .test_revault import *
 from .test_compatibility import *
 from .test_helpers import *
+from .test_tracer import *
+from .test_memory import *
+from .test_qr_replay import *
+from .test_usb_replay import *
@@ -1,5 +1,8 @@
 from unittest import TestCase
-from helpers import conv_time
+from io import BytesIO
+from helpers import conv_time, AEADReader, AEADWriter, CryptoContext, tagged_hash, aead_encrypt, aead_decrypt, LoaderProgress, CancelToken, Cancelled, cooperate, run_steps
+import asyncio
+import hashlib
 
 class HelpersTest(TestCase):
     def test_conv_time(self):
@@ -29,3 +32,91 @@ class HelpersTest(TestCase):
         # Test day after USA DST end on November 2nd 2026
         for hour in range(24):
             self.assertEqual(conv_time(1793577600 + hour * 3600), (2026, 11, 2, hour, 0, 0, 0, 306))
+
+    def test_aead_stream(self):
+        """Chunked aead stream roundtrip and tamper detection"""
+        key = b"k" * 32
+        for size in [0, 15, 16, 64, 200]:
+            data = bytes(range(256)) * 2
+            data = data[:size]
+            b = BytesIO()
+            with AEADWriter(b, key, adata=b"meta", chunk_size=64) as w:
+                # written in small pieces
+                for i in range(0, len(data), 7):
+                    w.write(data[i:i+7])
+            raw = b.getvalue()
+            r = AEADReader(BytesIO(raw), key)
+            self.assertEqual(r.adata, b"meta")
+            self.assertEqual(r.read(10) + r.read(), data)
+            # wrong key
+            with self.assertRaises(Exception):
+                AEADReader(BytesIO(raw), b"x" * 32).read()
+            # truncated or modified stream
+            for broken in [raw[:-33], raw[:-1], raw[:-2] + bytes([raw[-2] ^ 1]) + raw[-1:]]:
+                with self.assertRaises(Exception):
+                    AEADReader(BytesIO(broken), key).read()
+
+    def test_crypto_context(self):
+        """Cached tag prefixes and aead keys give the same results"""
+        tag = hashlib.sha256(b"aes").digest()
+        self.assertEqual(tagged_hash("aes", b"data"), hashlib.sha256(tag + tag + b"data").digest())
+        ctx = CryptoContext(size=2)
+        key = b"k" * 32
+        keys = ctx.keys(key)
+        self.assertTrue(ctx.keys(key) is keys)
+        ct = aead_encrypt(key, b"adata", b"plaintext", keys)
+        self.assertEqual(aead_decrypt(ct, key), (b"adata", b"plaintext"))
+        ctx.keys(b"a" * 32)
+        ctx.keys(b"b" * 32)
+        self.assertEqual(len(ctx), 1)
+
+    def test_loader_progress(self):
+        """Loader is redrawn only when the interval passed or the title changed"""
+        calls = []
+        progress = LoaderProgress(lambda **kwargs: calls.append(kwargs), "Parsing...", 1000)
+        progress.INTERVAL = 10**6
+        for i in range(500):
+            progress.update(i)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(calls[0], {"title": "Parsing...", "text": "0 of 1000", "progress": 0})
+        for i in range(500, 1000):
+            progress.update(i, title="Signing...")
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(calls[1]["title"], "Signing...")
+        self.assertEqual(calls[1]["progress"], 0.5)
+        progress.INTERVAL = 0
+        progress.update(1000)
+        self.assertEqual(calls[2]["progress"], 1)
+
+    def test_cooperate(self):
+        """Long loops yield to other tasks and stop when cancelled"""
+        closed = []
+        def steps(n):
+            try:
+                for i in range(n):
+                    yield i
+                return n
+            finally:
+                closed.append(n)
+        self.assertEqual(run_steps(steps(10)), 10)
+        # other task runs while the loop is processed
+        async def run(token):
+            ticks = []
+            async def ticker():
+                while True:
+                    ticks.append(1)
+                    await asyncio.sleep_ms(0)
+            task = asyncio.create_task(ticker())
+            try:
+                return await cooperate(steps(100), token, items=10), len(ticks)
+            finally:
+                task.cancel()
+        res, ticks = asyncio.run(run(CancelToken()))
+        self.assertEqual(res, 100)
+        self.assertTrue(ticks >= 5)
+        # cancelled token closes the loop
+        token = CancelToken()
+        token.cancel()
+        with self.assertRaises(Cancelled):
+            asyncio.run(run(token))
+        self.assertEqual(closed, [10, 100, 100])
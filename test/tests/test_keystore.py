@@ -2,6 +2,7 @@ from unittest import TestCase
 from keystore import FlashKeyStore
 import os
 import platform
+from .util import get_keystore, show_loader
 
 TEST_DIR = "testdir"
 
@@ -78,3 +79,34 @@ class FlashKeyStoreTest(TestCase):
         files = [f[0] for f in os.ilistdir(TEST_DIR)]
         self.assertFalse("secret" in files)
         self.assertFalse("pin" in files)
+
+    def test_derivation_cache(self):
+        """Cached derivations match derivations from the root"""
+        ks = get_keystore()
+        ks.derivation_cache.clear()
+        paths = ["m/84h/1h/0h", "m/84h/1h/0h/0/5", "m/84h/1h/1h", "m/48h/1h/0h/2h", "m"]
+        for path in paths:
+            self.assertEqual(ks.get_xpub(path).to_base58(), ks.root.derive(path).to_public().to_base58())
+        # common prefixes are shared
+        self.assertEqual(len(ks.derivation_cache), 10)
+        # cache is bounded
+        ks.derivation_cache.size = 4
+        for i in range(10):
+            ks.get_xpub("m/44h/1h/%dh" % i)
+        self.assertEqual(len(ks.derivation_cache), 4)
+        self.assertTrue((0x8000002C, 0x80000001, 0x80000009) in ks.derivation_cache.nodes)
+        # wiped when the mnemonic changes
+        ks.set_mnemonic("abandon "*11+"about", "")
+        self.assertEqual(len(ks.derivation_cache), 0)
+        self.assertEqual(ks.get_xpub("m/84h/1h/0h").to_base58(), ks.root.derive("m/84h/1h/0h").to_public().to_base58())
+        # and when the keystore is locked
+        ks.lock()
+        self.assertEqual(len(ks.derivation_cache), 0)
+        ks = self.get_keystore()
+        init_keystore(ks)
+        ks.show_loader = show_loader
+        ks.set_mnemonic("abandon "*11+"about", "")
+        ks.sign_hash("m/84h/1h/0h/0/0", b"1"*32)
+        self.assertEqual(len(ks.derivation_cache), 5)
+        ks.lock()
+        self.assertEqual(len(ks.derivation_cache), 0)
@@ -0,0 +1,100 @@
+from unittest import TestCase
+from io import BytesIO
+import asyncio
+import gc
+import os
+from memstats import memstats, MemStats
+from helpers import b2a_base64_stream
+from bench.psbt import get_wallet, write_psbt
+from .util import get_keystore, get_wallets_app, clear_testdir, TEST_DIR
+
+# Memory budgets for signing scenarios:
+# (wallet kind, inputs, outputs): (heap bytes, ramdisk bytes)
+# Heap is measured as live heap growth at stage boundaries,
+# it is only available on MicroPython (0 on CPython).
+BUDGETS = {
+    ("wsh", 200, 2): (128 * 1024, 448 * 1024),
+    ("wpkh", 50, 10): (48 * 1024, 60 * 1024),
+}
+
+STAGES = ["receive", "b64decode", "preprocess", "sigs", "signed", "done"]
+
+
+async def confirm(wallets, meta, show_screen):
+    return {"sighash": None}
+
+
+class MemStatsTest(TestCase):
+
+    def test_history(self):
+        ms = MemStats(size=2)
+        ms.path = TEST_DIR
+        for i in range(3):
+            ms.start("req%d" % i)
+            ms.sample("receive")
+            ms.enter()
+            # nested request doesn't finish the record
+            ms.enter()
+            self.assertIsNone(ms.exit())
+            rec = ms.exit()
+            self.assertEqual(rec["name"], "req%d" % i)
+            self.assertEqual([s[0] for s in rec["stages"]], ["receive", "done"])
+        self.assertEqual([rec["name"] for rec in ms.history], ["req1", "req2"])
+        b = BytesIO()
+        ms.dump(b)
+        self.assertTrue(b.getvalue().startswith(b'[{"'))
+
+
+class MemoryBudgetTest(TestCase):
+
+    def setUp(self):
+        clear_testdir()
+        self.manager = get_wallets_app(get_keystore(), "regtest").manager
+        self.manager.confirm_transaction = confirm
+        memstats.clear()
+        memstats.path = TEST_DIR
+        memstats.collect = True
+
+    def tearDown(self):
+        memstats.clear()
+        memstats.path = None
+        memstats.collect = False
+        clear_testdir()
+        gc.collect()
+
+    def run_scenario(self, kind, num_inputs, num_outputs):
+        w = get_wallet(self.manager, kind)
+        fname = TEST_DIR + "/psbt.b64"
+        with open(TEST_DIR + "/psbt.raw", "wb") as f:
+            write_psbt(w, f, num_inputs, num_outputs)
+        with open(TEST_DIR + "/psbt.raw", "rb") as fin:
+            with open(fname, "wb") as fout:
+                b2a_base64_stream(fin, fout)
+        # only base64 data is received from the host
+        os.remove(TEST_DIR + "/psbt.raw")
+        with open(fname, "rb") as f:
+            memstats.start("test")
+            memstats.sample("receive")
+            memstats.enter()
+            try:
+                res = asyncio.run(self.manager.sign_psbt(f, None))
+            finally:
+                rec = memstats.exit()
+        self.assertEqual(res, self.manager.tempdir + "/signed_b64")
+        return rec
+
+    def check_budget(self, kind, num_inputs, num_outputs):
+        heap, ramdisk = BUDGETS[(kind, num_inputs, num_outputs)]
+        rec = self.run_scenario(kind, num_inputs, num_outputs)
+        self.assertEqual([s[0] for s in rec["stages"]], STAGES)
+        name = "%s %d-in %d-out" % (kind, num_inputs, num_outputs)
+        used = rec["peak_alloc"] - rec["base_alloc"]
+        self.assertTrue(used <= heap, "%s: heap %d > %d" % (name, used, heap))
+        used = rec["peak_ramdisk"]
+        self.assertTrue(used <= ramdisk, "%s: ramdisk %d > %d" % (name, used, ramdisk))
+
+    def test_multisig_budget(self):
+        self.check_budget("wsh", 200, 2)
+
+    def test_singlesig_budget(self):
+        self.check_budget("wpkh", 50, 10)
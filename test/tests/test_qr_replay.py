@@ -0,0 +1,50 @@
+from unittest import TestCase
+from .util import clear_testdir, TEST_DIR
+import platform
+import utime
+
+SIZE = 1024
+
+
+class QRReplayTest(TestCase):
+
+    def setUp(self):
+        # hosts.qr needs microur from f469-disco,
+        # imported here so tests.util stays importable without it
+        from bench import qr
+        self.qr = qr
+        clear_testdir()
+        platform.maybe_mkdir(TEST_DIR)
+
+    def tearDown(self):
+        clear_testdir()
+
+    def test_formats(self):
+        for fmt in self.qr.FORMATS:
+            r = self.qr.bench(TEST_DIR + "/qr", fmt, SIZE, frame_interval_ms=50)
+            self.assertTrue(r["ok"], "%s: %s" % (fmt, r["error"]))
+            self.assertEqual(r["rejected"], 0)
+            self.assertTrue(r["accepted"] > 1)
+
+    def test_command_mode(self):
+        for model in [self.qr.MODEL_GM65, self.qr.MODEL_M3Y]:
+            r = self.qr.bench(TEST_DIR + "/qr", "base64", SIZE, trigger=False, model=model)
+            self.assertTrue(r["ok"], "model %d: %s" % (model, r["error"]))
+
+    def test_truncated_frames(self):
+        r = self.qr.bench(TEST_DIR + "/qr", "base64", SIZE, truncate=1)
+        self.assertFalse(r["ok"])
+        self.assertTrue(r["truncated"] > 0)
+
+    def test_overflow(self):
+        size = self.qr.READ_BUFFER_LEN
+        uart = self.qr.FakeUART(["a" * size], eol=b"\r\n")
+        uart.scan_latency_ms = 0
+        uart.baudrate = 10 ** 9
+        uart.arm(True)
+        uart.any()
+        utime.sleep_ms(5)
+        self.assertEqual(uart.any(), size)
+        self.assertEqual(uart.overflow, 2)
+        self.assertEqual(len(uart.read(10)), 10)
+        self.assertEqual(uart.scanned, 1)
@@ -75,8 +75,8 @@ class RevaultTest(TestCase):
                 wallets, meta = wapp.manager.preprocess_psbt(s, fout)
                 # check that we detected wallet and a non-standard sighash
                 self.assertEqual([w.name for w in wallets], wnames)
-                self.assertEqual([inp.get("label").replace(" (watch-only)", "") for inp in meta["inputs"]], wnames)
-                self.assertEqual(meta["inputs"][0].get("sighash"), "ALL | ANYONECANPAY")
+                self.assertEqual([meta.inputs.label(k).replace(" (watch-only)", "") for k in range(len(meta.inputs))], wnames)
+                self.assertEqual(meta.inputs.get(0, "sighash"), "ALL | ANYONECANPAY")
 
                 fout.seek(0)
                 psbtv = PSBTView.view(fout)
@@ -6,6 +6,7 @@ from embit.psbt import PSBT
 from embit.psbtview import PSBTView
 from embit.liquid.psetview import PSETView
 from apps.wallets.wallet import WalletError
+from apps.wallets.manager import RAW_STREAM
 from io import BytesIO
 
 PSBTS = {
@@ -76,6 +77,217 @@ class SignTest(TestCase):
         sig_count = wapp.manager.sign_psbtview(psbtv, b, wallets, None)
         self.assertTrue(check_sigs(PSBT.parse(b.getvalue()), PSBT.from_string(signed)))
 
+    def test_sighash_cache(self):
+        """Signatures with cached transaction digests are the same"""
+        from bench.psbt import get_wallet, write_psbt
+        from embit.transaction import SIGHASH
+        from sighash import SighashCache, sign_input
+        clear_testdir()
+        ks = get_keystore()
+        wapp = get_wallets_app(ks, "regtest")
+        for kind in ["wpkh", "tr"]:
+            b = BytesIO()
+            write_psbt(get_wallet(wapp.manager, kind), b, 3, 3)
+            for sighash in [SIGHASH.ALL, SIGHASH.SINGLE | SIGHASH.ANYONECANPAY]:
+                res = []
+                for cached in [False, True]:
+                    b.seek(0)
+                    psbtv = PSBTView.view(b)
+                    sighashes = SighashCache(psbtv) if cached else None
+                    sigs = BytesIO()
+                    for i in range(psbtv.num_inputs):
+                        self.assertEqual(sign_input(psbtv, i, ks.root, sigs, sighash, None, sighashes), 1)
+                    res.append(sigs.getvalue())
+                self.assertEqual(res[0], res[1])
+        clear_testdir()
+
+    def test_overlay(self):
+        """Missing fields are filled in memory and used for signing"""
+        import asyncio
+        from bench.psbt import get_wallet, write_psbt
+        clear_testdir()
+        ks = get_keystore()
+        manager = get_wallets_app(ks, "regtest").manager
+        async def confirm(wallets, meta, show_screen):
+            return {"sighash": None}
+        manager.confirm_transaction = confirm
+        b = BytesIO()
+        write_psbt(get_wallet(manager, "wsh"), b, 3, 2)
+        psbt = PSBT.parse(b.getvalue())
+        for scope in psbt.inputs + psbt.outputs:
+            scope.witness_script = None
+        res = []
+        for raw in [b.getvalue(), psbt.serialize()]:
+            fname = asyncio.run(manager.sign_psbt(BytesIO(raw), None, encoding=RAW_STREAM))
+            with open(fname, "rb") as f:
+                res.append(f.read())
+        self.assertEqual(res[0], res[1])
+        psbtv, wallets, meta = manager.fill_psbt(BytesIO(psbt.serialize()))
+        self.assertEqual(len(psbtv.input_overlays), 3)
+        self.assertEqual(psbtv.input(0).witness_script, PSBT.parse(b.getvalue()).inputs[0].witness_script)
+        clear_testdir()
+
+    def test_signing_plan(self):
+        """Only inputs from the plan are signed"""
+        import asyncio
+        from bench.psbt import get_wallet, write_psbt
+        from embit.psbt import DerivationPath
+        clear_testdir()
+        ks = get_keystore()
+        manager = get_wallets_app(ks, "regtest").manager
+        async def confirm(wallets, meta, show_screen):
+            return {"sighash": None}
+        manager.confirm_transaction = confirm
+        b = BytesIO()
+        write_psbt(get_wallet(manager, "wpkh"), b, 3, 2)
+        psbt = PSBT.parse(b.getvalue())
+        # input 1 belongs to somebody else
+        ders = psbt.inputs[1].bip32_derivations
+        for pub in ders:
+            ders[pub] = DerivationPath(b"\x01\x02\x03\x04", ders[pub].derivation)
+        psbtv, wallets, meta = manager.fill_psbt(BytesIO(psbt.serialize()))
+        self.assertEqual(sorted(psbtv.plan.inputs), [0, 2])
+        fname = asyncio.run(manager.sign_psbt(BytesIO(psbt.serialize()), None, encoding=RAW_STREAM))
+        with open(fname, "rb") as f:
+            signed = PSBT.parse(f.read())
+        self.assertEqual([len(inp.partial_sigs) for inp in signed.inputs], [1, 0, 1])
+        clear_testdir()
+
+    def test_speculative_signing(self):
+        """Background signing gives the same result and is wiped on cancel"""
+        import asyncio, os
+        from bench.psbt import get_wallet, write_psbt
+        clear_testdir()
+        ks = get_keystore()
+        manager = get_wallets_app(ks, "regtest").manager
+        b = BytesIO()
+        write_psbt(get_wallet(manager, "wsh"), b, 4, 2)
+        raw = b.getvalue()
+        async def sign(speculative, confirm):
+            manager.SPECULATIVE_SIGNING = speculative
+            async def final(wallets, meta, show_screen):
+                # user is looking at the screen
+                for i in range(20):
+                    await asyncio.sleep(0)
+                return confirm
+            manager.confirm_transaction_final = final
+            fname = await manager.sign_psbt(BytesIO(raw), None, encoding=RAW_STREAM)
+            if fname is None:
+                return None
+            with open(fname, "rb") as f:
+                return f.read()
+        self.assertEqual(asyncio.run(sign(True, True)), asyncio.run(sign(False, True)))
+        self.assertEqual(asyncio.run(sign(True, False)), None)
+        self.assertEqual([f for f in os.listdir(manager.tempdir) if f.endswith(".tmp")], [])
+        self.assertEqual(manager.speculation, None)
+        # Cancel button while waiting for the background signing
+        async def final(wallets, meta, show_screen):
+            return True
+        manager.confirm_transaction_final = final
+        show_loader = manager.show_loader
+        def loader(title="", on_cancel=None, **kwargs):
+            if on_cancel is not None and title.startswith("Signing"):
+                on_cancel()
+            return show_loader(title=title, **kwargs)
+        manager.show_loader = loader
+        manager.SPECULATIVE_SIGNING = True
+        self.assertEqual(asyncio.run(manager.sign_psbt(BytesIO(raw), None, encoding=RAW_STREAM)), None)
+        self.assertEqual([f for f in os.listdir(manager.tempdir) if f.endswith(".tmp")], [])
+        self.assertEqual(manager.speculation, None)
+        # enabled in experimental settings
+        manager.SPECULATIVE_SIGNING = False
+        self.assertFalse(manager.speculative_signing)
+        manager.GLOBAL = {"experimental": {"speculative_signing": True}}
+        self.assertTrue(manager.speculative_signing)
+        del manager.GLOBAL
+        clear_testdir()
+
+    def test_shared_prevtx(self):
+        """Parent transaction used by many inputs is verified once"""
+        from bench.psbt import get_wallet, _fill_scope
+        from embit.hashes import sha256
+        from embit.transaction import Transaction, TransactionInput, TransactionOutput
+        from embit.psbt import PSBTError
+        clear_testdir()
+        ks = get_keystore()
+        manager = get_wallets_app(ks, "regtest").manager
+        w = get_wallet(manager, "wpkh")
+        descs = [w.descriptor.derive(i, branch_index=0) for i in range(3)]
+        prev = Transaction(
+            vin=[TransactionInput(sha256(b"batched payout"), 0)],
+            vout=[TransactionOutput(10000*(i+1), desc.script_pubkey()) for i, desc in enumerate(descs)],
+        )
+        change = w.descriptor.derive(0, branch_index=1)
+        tx = Transaction(
+            vin=[TransactionInput(prev.txid(), i) for i in range(3)],
+            vout=[TransactionOutput(50000, change.script_pubkey())],
+        )
+        psbt = PSBT(tx)
+        for i, desc in enumerate(descs):
+            psbt.inputs[i].non_witness_utxo = prev
+            _fill_scope(psbt.inputs[i], desc)
+        _fill_scope(psbt.outputs[0], change)
+        psbtv, wallets, meta = manager.fill_psbt(BytesIO(psbt.serialize()))
+        self.assertEqual(len(psbtv.prevtxs), 1)
+        # parsing yields before streaming the parent transaction
+        view = manager.PSBTViewClass.view(BytesIO(psbt.serialize()), compress=True)
+        self.assertEqual(len(list(view.prevtxs.collect_iter())), 1)
+        self.assertEqual(view.prevtxs.utxo(2)[1].value, 30000)
+        self.assertEqual(meta["fee"], 10000)
+        self.assertEqual([psbtv.input(i).utxo.value for i in range(3)], [10000, 20000, 30000])
+        b = BytesIO()
+        manager.sign_psbtview(psbtv, b, wallets, None)
+        signed = PSBT.parse(b.getvalue())
+        self.assertEqual([len(inp.partial_sigs) for inp in signed.inputs], [1, 1, 1])
+        # wrong parent transaction
+        prev.locktime = 1
+        for inp in psbt.inputs:
+            inp.non_witness_utxo = prev
+        with self.assertRaises(PSBTError):
+            manager.fill_psbt(BytesIO(psbt.serialize()))
+        clear_testdir()
+
+    def test_tx_meta(self):
+        """Transaction metadata keeps one copy of every label"""
+        clear_testdir()
+        ks = get_keystore(mnemonic="ability "*11+"acid", password="")
+        manager = get_wallets_app(ks, 'regtest').manager
+        psbt = PSBT.from_string(PSBTS["wpkh"][0])
+        psbtv, wallets, meta = manager.fill_psbt(BytesIO(psbt.serialize()))
+        self.assertEqual(len(meta.inputs), len(psbt.inputs))
+        self.assertEqual(len(meta.outputs), len(psbt.outputs))
+        # all inputs are from the same wallet
+        names = [meta.inputs.label(i) for i in range(len(meta.inputs))]
+        self.assertEqual(names, [manager.wallets[0].name] * len(psbt.inputs))
+        self.assertEqual(len(set(meta.inputs.labels)), 1)
+        for i, out in enumerate(psbt.outputs):
+            self.assertEqual(meta.outputs.value(i), psbt.tx.vout[i].value)
+            self.assertEqual(meta.outputs.address(i), manager.get_address(out))
+            self.assertEqual(meta.outputs.asset(i), "tBTC")
+        self.assertEqual(meta.inputs.get(0, "sighash"), None)
+        self.assertEqual(meta["locktime"], psbt.tx.locktime)
+        clear_testdir()
+
+    def test_psbt_index(self):
+        """Offset index finds the same scopes and values as a full scan"""
+        from apps.wallets.psbtindex import PSBTIndex
+        raws = [PSBT.from_string(b64).serialize() for b64 in PSBTS["wpkh"]]
+        raws.append(PSET.from_string(PSETS["wpkh"][0]).serialize())
+        for raw in raws:
+            cls = PSETView if raw.startswith(PSETView.MAGIC) else PSBTView
+            psbtv = cls.view(BytesIO(raw))
+            index = PSBTIndex(psbtv)
+            for n in [None] + list(range(psbtv.num_inputs + psbtv.num_outputs + 1)):
+                self.assertEqual(index.seek_to_scope(n), cls.seek_to_scope(psbtv, n))
+            for n in range(psbtv.num_inputs + psbtv.num_outputs):
+                for key in [b"\x00", b"\x01", b"\x06", b"\x07", b"\x08", b"\xfc\x04pset\x04", b"\xfc\x04pset\x0e"]:
+                    off = cls.seek_to_scope(psbtv, n)
+                    rel = psbtv.seek_to_value(key, from_current=True)
+                    expected = None if rel is None else off + rel
+                    self.assertEqual(index.seek_to_value(n, key), expected)
+                    if expected is not None:
+                        self.assertEqual(psbtv.stream.tell(), expected)
+
     def test_pset(self):
         clear_testdir()
         mnemonic = "ceiling retire saddle forest engine address fancy option fruit destroy grid strategy"
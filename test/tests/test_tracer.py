@@ -0,0 +1,128 @@
+from unittest import TestCase
+from io import BytesIO
+import json
+import asyncio
+from tracer import Tracer, Span, trace, trace_async, tracer, boot, boot_span, boot_wait, boot_done
+from apps.perfstats import App as PerfStatsApp
+from .util import TEST_DIR
+
+
+class TracerTest(TestCase):
+
+    def test_ring_buffer(self):
+        t = Tracer(size=4)
+        for i in range(6):
+            with Span(t, "span%d" % i):
+                pass
+        self.assertEqual([s[0] for s in t.spans], ["span2", "span3", "span4", "span5"])
+        self.assertEqual(t.dropped, 2)
+        # stats survive buffer wrap
+        self.assertEqual(len(t.stats), 6)
+        with t.span("span5"):
+            pass
+        self.assertEqual(t.stats["span5"][0], 2)
+        t.clear()
+        self.assertEqual(t.spans, [])
+
+    def test_decorators(self):
+        tracer.clear()
+
+        @trace("sync")
+        def fn(a, b=1):
+            return a + b
+
+        @trace_async("async")
+        async def afn(a):
+            return a * 2
+
+        self.assertEqual(fn(1, b=2), 3)
+        self.assertEqual(asyncio.run(afn(3)), 6)
+        self.assertEqual([s[0] for s in tracer.spans], ["sync", "async"])
+        # spans are recorded even if function raises
+        with self.assertRaises(ValueError):
+            with Span(tracer, "error"):
+                raise ValueError()
+        self.assertEqual(tracer.spans[-1][0], "error")
+
+    def test_dump(self):
+        t = Tracer(size=4)
+        for i in range(3):
+            with t.span("a"):
+                pass
+        b = BytesIO()
+        t.dump(b)
+        obj = json.loads(b.getvalue().decode())
+        self.assertEqual(len(obj["spans"]), 3)
+        self.assertEqual(obj["stats"]["a"]["count"], 3)
+        self.assertEqual(obj["dropped"], 0)
+        b = BytesIO()
+        t.dump_chrome_trace(b)
+        obj = json.loads(b.getvalue().decode())
+        self.assertEqual(len(obj["traceEvents"]), 3)
+        self.assertEqual(obj["traceEvents"][0]["ph"], "X")
+        self.assertEqual(obj["traceEvents"][0]["ts"], 0)
+
+    def test_perfstats_command(self):
+        app = PerfStatsApp(TEST_DIR + "/perfstats")
+        tracer.clear()
+        with tracer.span("test"):
+            pass
+        stream, meta = asyncio.run(app.process_host_command(BytesIO(b"perfstats"), None))
+        obj = json.loads(stream.read().decode())
+        self.assertEqual(obj["spans"][0]["name"], "test")
+        res = asyncio.run(app.process_host_command(BytesIO(b"perfstats clear"), None))
+        self.assertTrue(res)
+        self.assertEqual(tracer.spans, [])
+
+    def test_boot_timeline(self):
+        t = Tracer(size=8)
+        # spans are recorded when they end
+        t.record("inner1", 1000, 10)
+        t.record("inner2", 1020, 30)
+        t.record("outer", 1000, 100)
+        t.record("next", 1100, 5)
+        self.assertEqual(t.start_time(), 1000)
+        self.assertEqual(t.timeline(), [
+            ("outer", 0, 100, 0),
+            ("inner1", 0, 10, 1),
+            ("inner2", 20, 30, 1),
+            ("next", 100, 5, 0),
+        ])
+
+    def test_boot_wait(self):
+        import utime
+        boot.clear()
+        boot.enabled = True
+        try:
+            with boot_span("Keystore.unlock"):
+                # user enters the PIN
+                with boot_wait():
+                    utime.sleep_ms(200)
+            boot_done()
+            # neither the span nor the total boot time include the wait
+            for name, start, duration in boot.spans:
+                self.assertTrue(duration < 100000, name)
+        finally:
+            boot.clear()
+            boot.enabled = True
+
+    def test_boot_done(self):
+        boot.clear()
+        boot.enabled = True
+        try:
+            with boot_span("main.main"):
+                pass
+            boot_done()
+            self.assertFalse(boot.enabled)
+            self.assertEqual([s[0] for s in boot.spans], ["main.main", "boot"])
+            # nothing is recorded after the first menu
+            with boot_span("late"):
+                pass
+            boot_done()
+            self.assertEqual(len(boot.spans), 2)
+            app = PerfStatsApp(TEST_DIR + "/perfstats")
+            stream, meta = asyncio.run(app.process_host_command(BytesIO(b"perfstats boot"), None))
+            obj = json.loads(stream.read().decode())
+            self.assertEqual(obj["spans"][-1]["name"], "boot")
+        finally:
+            boot.clear()
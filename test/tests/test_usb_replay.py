@@ -0,0 +1,53 @@
+from unittest import TestCase
+from binascii import a2b_base64
+import asyncio
+from .util import clear_testdir, get_keystore, get_wallets_app, show_loader, communicate, TEST_DIR
+
+
+class USBReplayTest(TestCase):
+
+    def setUp(self):
+        # hosts need microur from f469-disco,
+        # imported here so tests.util stays importable without it
+        from bench import usb
+        from bench.psbt import get_wallet
+        from apps.xpubs import App as XpubApp
+        self.usb = usb
+        clear_testdir()
+        ks = get_keystore()
+        self.wapp = get_wallets_app(ks, "regtest")
+        xapp = XpubApp(TEST_DIR + "/xpubs")
+        xapp.init(ks, "regtest", show_loader, communicate)
+        self.wallet = get_wallet(self.wapp.manager, "wpkh")
+        self.apps = [self.wapp, xapp]
+
+    def tearDown(self):
+        clear_testdir()
+
+    def replay(self, session):
+        vcp = self.usb.LoopbackVCP()
+        host = self.usb.make_host(TEST_DIR + "/usb", vcp, self.apps)
+        return asyncio.run(self.usb.replay(host, vcp, session, rate=1))
+
+    def test_session(self):
+        session = self.usb.make_session(self.wallet, self.wapp.manager.tempdir, 2048, 2)
+        results = self.replay(session)
+        self.assertEqual(len(results), len(session))
+        for r in results:
+            self.assertIsNone(r["error"])
+        self.assertEqual([r["command"] for r in results],
+                         ["sign", "xpub", "xpub", "sign", "fingerprint", "xpub"])
+        # large PSBT is read in many chunks
+        self.assertTrue(results[0]["reads"] > 1)
+        signed = results[0]["response"][len(self.usb.USBHost.ACK):].strip()
+        self.assertTrue(a2b_base64(signed).startswith(b"psbt\xff"))
+        # interrupted command is discarded, reset command is processed
+        self.assertEqual(results[3]["response"], b"")
+        self.assertEqual(results[1]["response"], results[5]["response"])
+        fname = TEST_DIR + "/session"
+        self.usb.save_session(fname, [(msg, r["response"]) for (msg, _), r in zip(session, results)])
+        loaded = self.usb.load_session(fname)
+        self.assertEqual([msg for msg, _ in loaded], [msg for msg, _ in session])
+        # signing is deterministic, so the replay matches the record
+        for r in self.replay(loaded):
+            self.assertTrue(r["match"])
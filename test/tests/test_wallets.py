@@ -1,11 +1,21 @@
 from unittest import TestCase
-from apps.wallets.wallet import Wallet
+import os
+from io import BytesIO
+from apps.wallets.wallet import Wallet, WalletError
 from embit.descriptor import Key
+from embit import script, bip32
+from embit.networks import NETWORKS
+from binascii import hexlify
+from embit.psbt import InputScope, DerivationPath
+from storage import storage
+from .util import get_keystore, get_wallets_app, clear_testdir
 
 TEST_DIR = "testdir"
 
 class WalletsTest(TestCase):
 
+    XPUB = "tpubDCZWxJ6kKqRHep5a2XycxrXRaTES1vs3ysfV7sdv5uhkaEgxBEdVbyQT46m3NcaLJqVNd41TYqDyQfvweLLXGmkxdHRnhxuJPf7BAWMXni2"
+
     def test_descriptors(self):
         """Test initial config creation"""
         k = "[8cce63f8/84h/1h/0h]tpubDCZWxJ6kKqRHep5a2XycxrXRaTES1vs3ysfV7sdv5uhkaEgxBEdVbyQT46m3NcaLJqVNd41TYqDyQfvweLLXGmkxdHRnhxuJPf7BAWMXni2/<0;1>/*"
@@ -62,3 +72,194 @@ class WalletsTest(TestCase):
         d = "tr([73c5da0a/2/2/2]tpubDCPwGho2toLmdSELZ3o8v1D6RUUK7Y5keCjMyrSfE75aX2Mcx4MNEM6MnXDZR87GQ1ot4YNn2GGtiN5SvM12c6cvYMrt6avwtYNcRab2HFv/<0;1>/*,or_b(pk([73c5da0a/1/2/3]tpubDCpEkdSHkygNaquCRtW8Fuo3TchAXFSWUuYB9aryim58T4CWM9vLgt26uUV5wdtuvbSk7rWmQQCpcYhGjbHiBzWCYXeyRMJ98zSBWekaJJm/<0;1>/*),s:pk([73c5da0a/3/2/1]tpubDDrLDbxjL1d5FK8djVqUjD3xL1gkhaTXTL1rHzEavwA2ss4YpF8Qm82cKN89PEBRYk6JVTZULA872LuFGENTGdNYASDCrXKKZkU86A8HLqA/<0;1>/*)))"
         w = Wallet.parse(d)
         print(w)
+
+    def test_derivation_cache(self):
+        """Cached derivations match derivations of the descriptor"""
+        k = "[8cce63f8/84h/1h/0h]tpubDCZWxJ6kKqRHep5a2XycxrXRaTES1vs3ysfV7sdv5uhkaEgxBEdVbyQT46m3NcaLJqVNd41TYqDyQfvweLLXGmkxdHRnhxuJPf7BAWMXni2"
+        descriptors = [
+            "wpkh(%s/<0;1>/*)" % k,
+            "wsh(sortedmulti(2,%s/<0;1>/*,%s/1/<0;1>/*,%s/5/*))" % (k,k,k),
+            "wpkh(%s/7/*/3)" % k,
+            "sh(wpkh(%s))" % k,
+        ]
+        for desc in descriptors:
+            w = Wallet.parse(desc)
+            for branch in range(w.descriptor.num_branches):
+                for idx in [0, 5, 0, 100]:
+                    derived, _ = w.get_descriptor(idx, branch)
+                    self.assertEqual(str(derived), str(w.descriptor.derive(idx, branch_index=branch)))
+            # original descriptor is not changed
+            self.assertEqual(str(w.descriptor), desc)
+        # cache is bounded
+        for idx in range(w.DERIVATION_CACHE_SIZE + 10):
+            w.script_pubkey([0, idx])
+        self.assertEqual(len(w._derived), w.DERIVATION_CACHE_SIZE)
+
+    def test_script_index(self):
+        """Lookahead index finds wallet scripts up to the gap limit"""
+        clear_testdir()
+        ks = get_keystore()
+        wm = get_wallets_app(ks, "regtest").manager
+        w = wm.wallets[0]
+        wm.script_index.update(wm.wallets)
+        self.assertEqual(len(wm.script_index), sum(w.gaps))
+        addr, _ = w.get_address(5, "regtest")
+        self.assertEqual(wm.find_wallet_from_address(addr, index=5), (w, (0, 5)))
+        addr, _ = w.get_address(7, "regtest", 1)
+        self.assertEqual(wm.find_wallet_from_address(addr, paths=["m/84h/1h/0h/1/7"]), (w, (7, 1)))
+        # path from the host should match the indexed address
+        with self.assertRaises(WalletError):
+            wm.find_wallet_from_address(addr, paths=["m/84h/1h/0h/1/8"])
+        # outside of the window
+        addr, _ = w.get_address(30, "regtest")
+        sc = script.address_to_scriptpubkey(addr)
+        self.assertIsNone(wm.script_index.lookup(sc))
+        self.assertEqual(wm.find_wallet_from_address(addr, index=30), (w, (0, 30)))
+        # window moves with the gap limit
+        w.update_gaps(known_idxs=[30, None])
+        wm.script_index.extend(w)
+        self.assertEqual(wm.script_index.lookup(sc), (w, 0, 30))
+        self.assertEqual(len(wm.script_index), sum(w.gaps))
+        wm.script_index.update([])
+        self.assertEqual(len(wm.script_index), 0)
+        clear_testdir()
+
+    def test_key_origin_index(self):
+        """Only wallets with matching key origins are candidates"""
+        clear_testdir()
+        ks = get_keystore()
+        wm = get_wallets_app(ks, "regtest").manager
+        w = wm.wallets[0]
+        wm.key_index.update(wm.wallets)
+        scope = InputScope()
+        pub = ks.get_xpub("m/84h/1h/0h/0/1000").key
+        scope.bip32_derivations[pub] = DerivationPath(ks.fingerprint, bip32.parse_path("m/84h/1h/0h/0/1000"))
+        self.assertEqual(wm.key_index.lookup(scope), [w])
+        scope.bip32_derivations[pub] = DerivationPath(b"\x00"*4, bip32.parse_path("m/84h/1h/0h/0/1000"))
+        self.assertEqual(wm.key_index.lookup(scope), [])
+        scope.bip32_derivations[pub] = DerivationPath(ks.fingerprint, bip32.parse_path("m/84h/1h/1h/0/1000"))
+        self.assertEqual(wm.key_index.lookup(scope), [])
+        wm.key_index.update([])
+        self.assertEqual(wm.key_index.origins, {})
+        clear_testdir()
+
+    def test_catalog(self):
+        """Wallets are loaded from the catalog and parsed on first use"""
+        clear_testdir()
+        ks = get_keystore()
+        wm = get_wallets_app(ks, "regtest").manager
+        xpub = ks.get_xpub("m/48h/1h/0h/2h").to_base58(NETWORKS["regtest"]["xpub"])
+        desc = "wsh(sortedmulti(1,[%s/48h/1h/0h/2h]%s/<0;1>/*,%s/<0;1>/*))" % (
+            hexlify(ks.fingerprint).decode(), xpub, self.XPUB)
+        w = wm.parse_wallet("Multisig&" + desc)
+        wm.add_wallet(w)
+        with self.assertRaises(Exception):
+            wm.parse_wallet(desc)
+        w.name = "Renamed"
+        wm.save_wallet(w)
+        wm = get_wallets_app(ks, "regtest").manager
+        self.assertEqual([w.name for w in wm.wallets], ["Default", "Renamed"])
+        self.assertEqual([w.is_loaded for w in wm.wallets], [False, False])
+        self.assertEqual([w.is_watchonly for w in wm.wallets], [False, False])
+        # key origins are known without parsing
+        scope = InputScope()
+        der = bip32.parse_path("m/48h/1h/0h/2h/1/3")
+        scope.bip32_derivations[ks.get_xpub(der).key] = DerivationPath(ks.fingerprint, der)
+        wm.key_index.update(wm.wallets)
+        self.assertEqual(wm.key_index.lookup(scope), [wm.wallets[1]])
+        self.assertFalse(wm.wallets[1].is_loaded)
+        self.assertEqual(str(wm.wallets[1].descriptor), desc)
+        # deleted wallet is not loaded
+        wm.delete_wallet(wm.wallets[1])
+        wm = get_wallets_app(ks, "regtest").manager
+        self.assertEqual([w.name for w in wm.wallets], ["Default"])
+        clear_testdir()
+
+    def test_catalog_journal(self):
+        """Journal survives truncated writes and is compacted"""
+        clear_testdir()
+        ks = get_keystore()
+        wm = get_wallets_app(ks, "regtest").manager
+        w = wm.wallets[0]
+        for i in range(wm.catalog.MAX_STALE + 1):
+            w.name = "Name %d" % i
+            wm.save_wallet(w)
+        # compacted to a single entry
+        self.assertEqual(wm.catalog.entries, 1)
+        size = os.stat(wm.catalog.fname)[6]
+        w.name = "Last"
+        wm.save_wallet(w)
+        # entry is written on commit
+        self.assertEqual(os.stat(wm.catalog.fname)[6], size)
+        storage.commit()
+        size = os.stat(wm.catalog.fname)[6]
+        # power loss in the middle of the next entry
+        with open(wm.catalog.fname, "ab") as f:
+            f.write(b"\xfd\x10")
+        wm = get_wallets_app(ks, "regtest").manager
+        self.assertEqual(wm.wallets[0].name, "Last")
+        # only the tail is dropped
+        self.assertEqual(wm.catalog.entries, 2)
+        self.assertEqual(os.stat(wm.catalog.fname)[6], size)
+        # interrupted compaction
+        os.rename(wm.catalog.fname, wm.catalog.fname + ".tmp")
+        wm = get_wallets_app(ks, "regtest").manager
+        self.assertEqual(wm.wallets[0].name, "Last")
+        clear_testdir()
+
+    def test_catalog_corrupted_entry(self):
+        """Damaged entry in the middle of the journal doesn't remove other wallets"""
+        from bench.psbt import get_wallet
+        from embit import compact
+        clear_testdir()
+        ks = get_keystore()
+        wm = get_wallets_app(ks, "regtest").manager
+        for kind in ["wpkh", "wsh", "tr"]:
+            get_wallet(wm, kind)
+        names = [w.name for w in wm.wallets]
+        # one entry per wallet
+        wm.catalog.compact()
+        with open(wm.catalog.fname, "rb") as f:
+            raw = bytearray(f.read())
+        f = BytesIO(raw)
+        for i in range(2):
+            f.seek(compact.read_from(f), 1)
+        off = f.tell()
+        # flip a byte of the ciphertext of the third wallet
+        raw[off + 10] ^= 1
+        with open(wm.catalog.fname, "wb") as f:
+            f.write(raw)
+        wm = get_wallets_app(ks, "regtest").manager
+        self.assertEqual([w.name for w in wm.wallets], names[:2] + names[3:])
+        self.assertEqual(len(wm.catalog.errors), 1)
+        # journal is not rewritten
+        with open(wm.catalog.fname, "rb") as f:
+            self.assertEqual(f.read(), bytes(raw))
+        # damaged first entry
+        raw[off + 10] ^= 1
+        raw[10] ^= 1
+        with open(wm.catalog.fname, "wb") as f:
+            f.write(raw)
+        wm = get_wallets_app(ks, "regtest").manager
+        self.assertEqual([w.name for w in wm.wallets], names[1:])
+        clear_testdir()
+
+    def test_catalog_migration(self):
+        """Wallets from numeric folders are moved to the catalog"""
+        clear_testdir()
+        ks = get_keystore()
+        wm = get_wallets_app(ks, "regtest").manager
+        desc = "wpkh(%s/<0;1>/*)" % self.XPUB
+        for wid, name in [(3, "Old"), (5, "Default")]:
+            path = wm.path + "/%d" % wid
+            os.mkdir(path)
+            d = desc if name == "Old" else str(wm.wallets[0].descriptor)
+            ks.save_aead(path + "/descriptor", plaintext=d.encode())
+            ks.save_aead(path + "/meta", plaintext=b'{"gaps": [30, 20], "name": "%s", "unused_recv": 10}' % name.encode())
+        wm = get_wallets_app(ks, "regtest").manager
+        # duplicate of the default wallet is skipped
+        self.assertEqual([w.name for w in wm.wallets], ["Default", "Old"])
+        self.assertEqual(wm.wallets[1].gaps, [30, 20])
+        self.assertEqual(wm.find_legacy_wallets(), [])
+        self.assertEqual(str(wm.wallets[1].descriptor), desc)
+        clear_testdir()
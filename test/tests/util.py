@@ -2,6 +2,7 @@ from keystore.ram import RAMKeyStore
 from app import BaseApp
 from apps.wallets import App as WalletsApp
 import platform
+from storage import storage
 
 TEST_DIR = "testdir"
 
@@ -9,6 +10,8 @@ def check_sigs(psbt1, psbt2):
     return [inp.partial_sigs for inp in psbt1.inputs] == [inp.partial_sigs for inp in psbt2.inputs]
 
 def clear_testdir():
+    # drop writes that were not committed by the previous test
+    storage.discard(TEST_DIR)
     try:
         platform.delete_recursively(TEST_DIR, include_self=True)
     except:
@@ -1 +1,2 @@
 from .test_wallet_manager_parsing import *
+from .test_bench import *
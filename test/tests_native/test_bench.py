@@ -0,0 +1,49 @@
+import sys
+
+if sys.implementation.name != 'micropython':
+    from native_support import setup_native_stubs
+
+    setup_native_stubs()
+
+from unittest import TestCase
+from binascii import a2b_base64
+import gc
+
+from embit.psbt import PSBT
+from tests.util import get_keystore, get_wallets_app, clear_testdir
+from bench.psbt import KINDS, STAGES, get_wallet, bench
+
+
+class PSBTBenchTest(TestCase):
+    def setUp(self):
+        clear_testdir()
+        self.keystore = get_keystore()
+        self.manager = get_wallets_app(self.keystore, "regtest").manager
+
+    def tearDown(self):
+        clear_testdir()
+        gc.collect()
+
+    def test_all_kinds_are_signed(self):
+        for kind in KINDS:
+            w = get_wallet(self.manager, kind)
+            # existing wallet is reused
+            self.assertIs(get_wallet(self.manager, kind), w)
+            results = bench(self.manager, w, 2, 3, memory=False)
+            self.assertEqual(sorted(results), sorted(STAGES))
+            # base64 decoding and encoding are reported separately
+            self.assertIn("b64decode", results)
+            self.assertIn("b64encode", results)
+            for stage in STAGES:
+                self.assertTrue(results[stage]["time_ms"] >= 0)
+            with open(self.manager.tempdir + "/signed_b64", "rb") as f:
+                psbt = PSBT.parse(a2b_base64(f.read()))
+            self.assertEqual(len(psbt.inputs), 2)
+            for inp in psbt.inputs:
+                self.assertTrue(inp.partial_sigs or inp.final_scriptwitness)
+
+    def test_memory_peaks(self):
+        w = get_wallet(self.manager, "wpkh")
+        results = bench(self.manager, w, 1, 1)
+        for stage in STAGES:
+            self.assertTrue(results[stage]["mem_peak"] >= 0)